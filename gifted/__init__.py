@@ -0,0 +1,4 @@
+# celery app is loaded with django, so @shared_task uses it
+from .celery import app as celery_app
+
+__all__ = ['celery_app']
@@ -0,0 +1,14 @@
+"""
+Celery application. Settings with CELERY_ prefix are read from django
+settings and tasks are found in tasks.py modules of installed apps.
+Worker: celery -A gifted worker -B
+"""
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gifted.settings')
+
+app = Celery('gifted')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 import os
 
 import dj_database_url
+from celery.schedules import crontab
 from decouple import Csv, config
 
 # import django_heroku
@@ -107,6 +108,8 @@ DATABASES = {
 
 EMAIL_HOST = 'localhost'
 EMAIL_PORT = 1025
+# messages sent at once by mass notifications (src/notifications/tasks.py)
+NOTIFICATION_CHUNK_SIZE = 100
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -164,18 +167,139 @@ STATICFILES_DIRS = [
 
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
 
+# rankings in the sidebar of rooms list
+LEADERBOARD_SIZE = 5
+LEADERBOARD_TIMEOUT = 60 * 5
+
+# cached ids of rooms which the user created or where the user is a guest
+PRIVATE_ROOMS_TIMEOUT = 60 * 60
+
+# full-text search (src/search.py). Backend is chosen by the database
+# when *_SEARCH_BACKEND is empty. Use 'polish' configuration if
+# the dictionary is installed in PostgreSQL.
+ROOM_SEARCH_BACKEND = os.environ.get('ROOM_SEARCH_BACKEND', '')
+FORUM_SEARCH_BACKEND = os.environ.get('FORUM_SEARCH_BACKEND', '')
+SEARCH_CONFIG = os.environ.get('SEARCH_CONFIG', 'simple')
+
 INTERNAL_IPS = ('127.0.0.1',)
 
+# messages of the project's loggers are lines of key=value pairs
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {
+            'format': 'time=%(asctime)s level=%(levelname)s '
+                      'logger=%(name)s %(message)s',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'simple',
+        },
+    },
+    'loggers': {
+        'src': {
+            'handlers': ['console'],
+            'level': os.environ.get('LOG_LEVEL', 'WARNING'),
+        },
+    },
+}
+
+# celery (gifted/celery.py). Eager mode runs tasks in the calling
+# process without a broker (tests, development without redis).
+CELERY_BROKER_URL = os.environ.get(
+    'CELERY_BROKER_URL', 'redis://127.0.0.1:6379/1'
+)
+CELERY_TASK_ALWAYS_EAGER = config(
+    'CELERY_TASK_ALWAYS_EAGER', default=False, cast=bool
+)
+CELERY_TASK_EAGER_PROPAGATES = True
+CELERY_BEAT_SCHEDULE = {
+    'close-rooms': {
+        'task': 'src.notifications.tasks.close_rooms',
+        'schedule': crontab(hour=0, minute=5),
+    },
+    'dispatch-room-notifications': {
+        'task': 'src.notifications.tasks.dispatch_room_notifications',
+        'schedule': crontab(minute='*/10'),
+    },
+    'send-outbox': {
+        'task': 'src.notifications.tasks.send_outbox',
+        'schedule': 10.0,
+    },
+    'update-hot-scores': {
+        'task': 'src.forum.tasks.update_hot_scores',
+        'schedule': crontab(minute='*/10'),
+    },
+    'update-room-scores': {
+        'task': 'src.rooms.tasks.update_room_scores',
+        'schedule': crontab(minute=15),
+    },
+}
+
 # required for channels
 ASGI_APPLICATION = 'gifted.routing.application'
 
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
-        "CONFIG": {
-            "hosts": [("127.0.0.1", 6379)],
+# threads of database work of asynchronous consumers (src/consumers.py)
+CONSUMER_DATABASE_THREADS = 8
+# seconds, donations within it are sent to sockets of the room as one
+# message (src/rooms/consumers.py)
+DONATION_BROADCAST_WINDOW = 0.1
+# seconds, new threads within it are sent to sockets of the forum as one
+# message (src/forum/consumers.py)
+FORUM_BROADCAST_WINDOW = 0.1
+# frames of one socket waiting for handling, more are rejected
+CONSUMER_QUEUE_SIZE = 10
+# token buckets of sockets (src/ratelimit.py), scope: (tokens per
+# second, burst). Scope is 'user' (all sockets of a user) or 'room'.
+DONATION_RATE_LIMITS = {'user': (1, 5), 'room': (100, 500)}
+THREAD_RATE_LIMITS = {'user': (0.2, 5), 'room': (10, 50)}
+
+# cache of rate limits (src/ratelimit.py), leaderboards and private
+# rooms of users: 'redis' is shared by all processes (web workers,
+# ASGI server, celery), 'memory' only by threads of one process (tests,
+# development without redis)
+CACHE = os.environ.get('CACHE', 'redis')
+CACHE_REDIS_URL = os.environ.get(
+    'CACHE_REDIS_URL', 'redis://127.0.0.1:6379/2'
+)
+CACHE_BACKENDS = {
+    'redis': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': CACHE_REDIS_URL,
+    },
+    'memory': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+CACHES = {
+    'default': CACHE_BACKENDS[CACHE],
+}
+
+# channel layer (src/layers.py): 'redis' when consumers run in many
+# processes or nodes, 'memory' when they all run in one process
+CHANNEL_LAYER = os.environ.get('CHANNEL_LAYER', 'redis')
+CHANNEL_REDIS_URL = os.environ.get(
+    'CHANNEL_REDIS_URL', 'redis://127.0.0.1:6379/0'
+)
+CHANNEL_LAYER_BACKENDS = {
+    'redis': {
+        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'CONFIG': {
+            'hosts': [CHANNEL_REDIS_URL],
         },
     },
+    'memory': {
+        'BACKEND': 'src.layers.LocalChannelLayer',
+        'CONFIG': {
+            'capacity': 1000,
+        },
+    },
+}
+CHANNEL_LAYERS = {
+    'default': CHANNEL_LAYER_BACKENDS[CHANNEL_LAYER],
 }
 
 # django_heroku.settings(locals())
@@ -4,6 +4,8 @@ from django.db import models
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
+from src.notifications.models import OutgoingEmail
+
 
 class Profile(models.Model):
     user = models.OneToOneField(
@@ -39,15 +41,14 @@ def create_user_profile(sender, instance, created, **kwargs):
 @receiver(post_save, sender=User)
 def save_profile(sender, instance, created, **kwargs):
     """
-    You can send invitation email. Just uncomment :send_email:
+    Welcome email is saved in the outbox in the transaction which
+    creates the user, it is sent by send_outbox task.
     """
-    if created:
+    if created and instance.email:
         username = instance.username
         email = instance.email
         subject = f'Witaj {username} Założyłeś właśnie konto w Gifted'
         message = 'Dziękujemy za zaufanie. Będziemy szcześliwi jeśli polecisz nas znajomym'
-        data = {'subject': subject, 'message': message, 'to': email}
-
-        # send_email(data)
+        OutgoingEmail.objects.enqueue(subject, message, email)
 
 # ----------------------------------------------------------
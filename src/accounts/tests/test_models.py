@@ -4,6 +4,9 @@ from django.contrib.auth import get_user_model
 from django.core import mail
 from django.test import TestCase
 
+from src.notifications.models import OutgoingEmail
+from src.rooms.models import Room
+
 from ..models import Profile
 
 User = get_user_model()
@@ -31,3 +34,30 @@ class TestProfileModel(TestCase):
     def test_full_name(self):
         profile = Profile.objects.filter(user_id=self.user1.id).first()
         self.assertEqual(profile.full_name, self.user1.username)
+
+    def test_get_observed_rooms(self):
+        rooms = [
+            Room.objects.create(
+                receiver='receiver', gift=f'gift{num}', price=100,
+                to_collect=100, visible=True, date_expires='2030-01-01',
+                score=num
+            )
+            for num in range(3)
+        ]
+        for room in rooms[:2]:
+            room.observers.add(self.user1)
+        self.assertEqual(
+            list(self.user1.profile.get_observed_rooms()),
+            [rooms[1], rooms[0]]
+        )
+
+    def test_welcome_email_is_enqueued(self):
+        User.objects.create_user(username='nomail', password='12345')
+        user = User.objects.create_user(
+            username='new', password='12345', email='new@test.pl'
+        )
+        email = OutgoingEmail.objects.get(to=user.email)
+        self.assertIn(user.username, email.subject)
+        self.assertFalse(
+            OutgoingEmail.objects.filter(subject__contains='nomail').exists()
+        )
@@ -6,6 +6,7 @@ from django.core import mail
 from django.test import TestCase
 from django.urls import resolve, reverse
 from django.forms.models import model_to_dict
+from django.utils.http import int_to_base36
 
 from src.accounts.forms import ProfileForm
 
@@ -124,7 +125,8 @@ class PasswordViewsTest(TestCase):
         )
         response = self.client.post(key_url, follow=True)
         self.assertEqual(response.status_code, 200)
-        expected = f'/accounts/password/reset/key/{self.user.id}-set-password/'
+        uid = int_to_base36(self.user.id)
+        expected = f'/accounts/password/reset/key/{uid}-set-password/'
         self.assertEqual(response.redirect_chain[0][0], expected)
 
 
@@ -161,3 +163,54 @@ class ProfileViewTest(TestCase):
         self.client.logout()
         response = self.client.get(url)
         self.assertEqual(response.status_code, 302)
+
+
+class UserSearchViewTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='Tester', password='12345'
+        )
+        for name in ['anna', 'Andrzej', 'antoni', 'bartosz', 'Anastazja']:
+            User.objects.create_user(username=name, password='12345')
+        self.url = reverse('accounts:user_search')
+        self.client.force_login(self.user)
+
+    def usernames(self, response):
+        return [user['username'] for user in response.json()['users']]
+
+    def test_login_required(self):
+        self.client.logout()
+        response = self.client.get(self.url, {'q': 'an'})
+        self.assertEqual(response.status_code, 302)
+
+    def test_prefix(self):
+        response = self.client.get(self.url, {'q': 'an'})
+        self.assertEqual(response.status_code, 200)
+        expected = ['Anastazja', 'Andrzej', 'anna', 'antoni']
+        self.assertEqual(self.usernames(response), expected)
+        self.assertIsNone(response.json()['next'])
+        self.assertIn('max-age=60', response['Cache-Control'])
+
+    def test_empty_query(self):
+        response = self.client.get(self.url, {'q': ''})
+        self.assertEqual(response.json(), {'users': [], 'next': None})
+
+    def test_pages(self):
+        response = self.client.get(self.url, {'q': 'an', 'limit': 2})
+        self.assertEqual(self.usernames(response), ['Anastazja', 'Andrzej'])
+        after = response.json()['next']
+        self.assertEqual(after, 'Andrzej')
+        response = self.client.get(
+            self.url, {'q': 'an', 'limit': 2, 'after': after}
+        )
+        self.assertEqual(self.usernames(response), ['anna', 'antoni'])
+        self.assertIsNone(response.json()['next'])
+
+    def test_limit_is_bounded(self):
+        User.objects.bulk_create([
+            User(username=f'user{num}', password='!') for num in range(30)
+        ])
+        response = self.client.get(self.url, {'q': 'user', 'limit': 1000})
+        self.assertEqual(len(self.usernames(response)), 20)
+        response = self.client.get(self.url, {'q': 'user', 'limit': 'abc'})
+        self.assertEqual(len(self.usernames(response)), 10)
@@ -2,8 +2,8 @@ from django.contrib.auth.views import LoginView, LogoutView
 from django.urls import include, path, re_path
 
 from .views import (CustomPasswordResetFromKeyView, CustomPasswordResetView,
-                    MyPasswordChangeView, ProfileDetailView, signup,
-                    update_profile)
+                    MyPasswordChangeView, ProfileDetailView, UserSearchView,
+                    signup, update_profile)
 
 app_name = 'accounts'
 urlpatterns = [
@@ -17,4 +17,7 @@ urlpatterns = [
     re_path(r"^password/reset/key/(?P<uidb36>[0-9A-Za-z]+)-(?P<key>.+)/$",
             CustomPasswordResetFromKeyView.as_view(), name='account_reset_password_from_key'),
     path('logout/', LogoutView.as_view(), name='logout'),
+
+    # ajax urlpatterns
+    path('ajax/users/', UserSearchView.as_view(), name='user_search'),
 ]
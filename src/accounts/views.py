@@ -8,10 +8,14 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.views import PasswordChangeView
 from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
 from django.db import transaction
+from django.http import JsonResponse
 from django.shortcuts import redirect, render
 from django.urls import reverse_lazy
+from django.utils.cache import patch_cache_control
+from django.views import View
 from django.views.generic import DetailView
 
+from src.rooms import leaderboards
 from src.rooms.models import Room
 
 from .forms import (
@@ -20,6 +24,8 @@ from .forms import (
 )
 from .models import Profile
 
+User = get_user_model()
+
 
 @transaction.atomic
 def signup(request):
@@ -68,10 +74,10 @@ class SearchOrderProfileMixin:
         context['observed'] = rooms.count()
         is_all = self.request.GET.get('all', None)
         if not rooms.exists() or is_all == 'true':
-            rooms = Room.get_visible.all()
+            rooms = Room.objects.get_visible(self.object)
         order = self.request.GET.get('order', '')
-        if order in ['most_popular', 'most_patrons', 'most_to_collect']:
-            rooms = getattr(rooms, order)()
+        if order in leaderboards.RANKINGS:
+            rooms = leaderboards.order_rooms(rooms, order)
 
         rooms = rooms.prefetch_related('creator')
         paginator = Paginator(rooms, self.paginate_by)
@@ -89,7 +95,7 @@ class SearchOrderProfileMixin:
 
 
 class ProfileDetailView(LoginRequiredMixin, SearchOrderProfileMixin, DetailView):
-    model = get_user_model()
+    model = User
     template_name = 'accounts/home.html'
     context_object_name = 'profile'
     paginate_by = 3
@@ -104,6 +110,51 @@ class ProfileDetailView(LoginRequiredMixin, SearchOrderProfileMixin, DetailView)
         return context
 
 
+class UserSearchView(LoginRequiredMixin, View):
+    """
+    ajax autocomplete of usernames (guests and messages in rooms).
+    Returns at most 'limit' users whose username starts with 'q'.
+    The next page is fetched with 'after' - the last username
+    from the previous page - so no page needs OFFSET.
+    """
+    default_limit = 10
+    max_limit = 20
+    max_age = 60
+
+    def get_limit(self):
+        try:
+            limit = int(self.request.GET.get('limit', self.default_limit))
+        except ValueError:
+            limit = self.default_limit
+        return max(1, min(limit, self.max_limit))
+
+    def get(self, request):
+        prefix = request.GET.get('q', '').strip()
+        after = request.GET.get('after', '')
+        limit = self.get_limit()
+        users = []
+        if prefix:
+            queryset = User.objects.filter(
+                username__istartswith=prefix,
+                is_active=True,
+            )
+            if after:
+                queryset = queryset.filter(username__gt=after)
+            users = list(
+                queryset.order_by('username')
+                .values('id', 'username')[:limit + 1]
+            )
+        has_more = len(users) > limit
+        users = users[:limit]
+        message = {
+            'users': users,
+            'next': users[-1]['username'] if has_more else None,
+        }
+        response = JsonResponse(message)
+        patch_cache_control(response, private=True, max_age=self.max_age)
+        return response
+
+
 @login_required
 @transaction.atomic
 def update_profile(request):
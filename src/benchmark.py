@@ -0,0 +1,87 @@
+"""
+Helpers for benchmark management commands. Data created by
+a benchmark lives only inside a transaction which is rolled back at the
+end, so benchmarks can be run against any development database.
+"""
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+
+class Rollback(Exception):
+    """raised to roll back data created by the benchmark"""
+
+
+class BenchmarkCommand(BaseCommand):
+    """
+    Subclass has to define :populate: (create data) and :run: (measure
+    with :measure: and :explain:). Both get command options as kwargs.
+    """
+    repeat = 5
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=self.repeat,
+            help='how many times every measurement is repeated'
+        )
+
+    def handle(self, *args, **options):
+        self.repeat = options['repeat']
+        try:
+            with transaction.atomic():
+                start = time.perf_counter()
+                self.populate(**options)
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f'Dane przygotowane w {elapsed:.1f} s')
+                self.run(**options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def populate(self, **options):
+        raise NotImplementedError
+
+    def run(self, **options):
+        raise NotImplementedError
+
+    def measure(self, name, func):
+        """
+        run func :repeat: times and print the best and average time
+        :return: the best time in seconds
+        """
+        times = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+        best = min(times)
+        average = sum(times) / len(times)
+        self.stdout.write(
+            f'{name}: best {best * 1000:.2f} ms, '
+            f'average {average * 1000:.2f} ms'
+        )
+        return best
+
+    def measure_once(self, name, func):
+        """
+        run func once and print its time and peak of memory allocated
+        by python (tracemalloc slows it down)
+        :return: result of func
+        """
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(
+            f'{name}: {elapsed:.1f} s, memory {peak / 2 ** 20:.1f} MB'
+        )
+        return result
+
+    def explain(self, name, queryset):
+        """print query plan of the queryset"""
+        self.stdout.write(self.style.MIGRATE_HEADING(name))
+        self.stdout.write(queryset.explain())
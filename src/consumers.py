@@ -0,0 +1,227 @@
+"""
+Helpers of asynchronous consumers. Database work of a consumer runs in
+threads of :DATABASE_EXECUTOR:, so the event loop only waits for
+sockets and a burst of messages does not start a thread per message.
+Size of the pool is CONSUMER_DATABASE_THREADS setting, it should not
+be bigger than the number of database connections of one process.
+:BroadcastCoalescer: and :BroadcastBatcher: merge frequent messages
+sent to a group. :QueuedJsonWebsocketConsumer: limits how fast
+a client can send frames.
+"""
+import asyncio
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
+
+from src.ratelimit import bucket_key, take_token
+
+logger = logging.getLogger(__name__)
+
+DATABASE_EXECUTOR = ThreadPoolExecutor(
+    max_workers=settings.CONSUMER_DATABASE_THREADS,
+    thread_name_prefix='consumer-database',
+)
+
+
+def database_task(func):
+    """
+    database_sync_to_async (closes old connections) which runs func in
+    DATABASE_EXECUTOR. It can decorate methods of consumers.
+    """
+    return database_sync_to_async(
+        func, thread_sensitive=False, executor=DATABASE_EXECUTOR
+    )
+
+
+class BroadcastWindow:
+    """
+    Messages published to a group within :window: seconds are sent to
+    the group as one message when the window ends. Subclass decides how
+    messages are merged (:add: and :take:). One instance is shared by
+    all consumers of the process.
+    """
+    def __init__(self, window):
+        self.window = window
+        self.pending = {}       # group: merged messages
+        self.flushes = {}       # group: (event loop, task)
+        self.published = 0
+        self.sent = 0
+
+    def metrics(self):
+        """published and sent messages, saved are not sent"""
+        return {
+            'published': self.published,
+            'sent': self.sent,
+            'saved': self.published - self.sent,
+        }
+
+    def reset(self):
+        self.published = self.sent = 0
+
+    def add(self, group, message):
+        """merge message with pending ones, :return: False to drop it"""
+        raise NotImplementedError
+
+    def take(self, group):
+        """:return: message sent to the group, pending ones are removed"""
+        raise NotImplementedError
+
+    async def publish(self, channel_layer, group, message):
+        self.published += 1
+        if not self.add(group, message):
+            return
+        loop = asyncio.get_event_loop()
+        flush_loop, flush = self.flushes.get(group, (None, None))
+        # flush scheduled by a loop which has been closed never ends
+        if flush is None or flush.done() or flush_loop is not loop:
+            self.flushes[group] = (
+                loop, loop.create_task(self.flush(channel_layer, group))
+            )
+
+    async def flush(self, channel_layer, group):
+        await asyncio.sleep(self.window)
+        # later messages schedule a new flush
+        del self.flushes[group]
+        message = self.take(group)
+        self.sent += 1
+        await channel_layer.group_send(group, message)
+
+
+class BroadcastCoalescer(BroadcastWindow):
+    """
+    Only the newest message of the window is sent. Every message has
+    'sequence' (higher is newer, clients drop frames older than
+    the last one they have got) and a message which is not newer than
+    the pending or the last sent message of the group is dropped.
+    Sequences of at most :max_groups: groups which were sent to most
+    recently are kept, a stale message of a forgotten group is sent and
+    dropped by clients.
+    """
+    def __init__(self, window, max_groups=10000):
+        super().__init__(window)
+        self.max_groups = max_groups
+        self.last_sent = OrderedDict()      # group: sequence
+
+    def reset(self):
+        """forget sent sequences and metrics"""
+        super().reset()
+        self.last_sent.clear()
+
+    def add(self, group, message):
+        sequence = message['sequence']
+        if sequence <= self.last_sent.get(group, -1):
+            return False
+        pending = self.pending.get(group)
+        if pending is None or sequence > pending['sequence']:
+            self.pending[group] = message
+        return True
+
+    def take(self, group):
+        message = self.pending.pop(group)
+        self.last_sent[group] = message['sequence']
+        self.last_sent.move_to_end(group)
+        if len(self.last_sent) > self.max_groups:
+            self.last_sent.popitem(last=False)
+        return message
+
+
+class BroadcastBatcher(BroadcastWindow):
+    """
+    All messages of the window are sent as one message
+    {'type': :message_type:, 'messages': [messages in order]}.
+    """
+    def __init__(self, window, message_type):
+        super().__init__(window)
+        self.message_type = message_type
+
+    def add(self, group, message):
+        self.pending.setdefault(group, []).append(message)
+        return True
+
+    def take(self, group):
+        return {
+            'type': self.message_type,
+            'messages': self.pending.pop(group),
+        }
+
+
+class QueuedJsonWebsocketConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Frames of a socket wait in a queue of CONSUMER_QUEUE_SIZE frames
+    and :handle_json: gets them one by one, so one client has at most
+    one database task at a time. A frame which does not fit in the queue
+    is rejected. Before a frame is handled a token is taken from
+    the buckets of the user and of the room (self.room_id), their
+    (rate, burst) are in <:rate_limit_name:>_RATE_LIMITS setting (see
+    src/ratelimit.py). A frame of a client which sends too fast is
+    rejected with 'retry_after' seconds. Rejections are answered by
+    :error_frame:.
+    """
+    rate_limit_name = None
+    queue_full_message = 'Za dużo wiadomości naraz, poczekaj na odpowiedź'
+    rate_limited_message = 'Za dużo wiadomości, spróbuj ponownie za chwilę'
+
+    async def websocket_connect(self, message):
+        self.inbound = asyncio.Queue(settings.CONSUMER_QUEUE_SIZE)
+        self.worker = asyncio.ensure_future(self.handle_frames())
+        await super().websocket_connect(message)
+
+    async def websocket_disconnect(self, message):
+        self.worker.cancel()
+        await super().websocket_disconnect(message)
+
+    async def receive_json(self, content):
+        try:
+            self.inbound.put_nowait(content)
+        except asyncio.QueueFull:
+            await self.send_json(self.error_frame(
+                {'__all__': [self.queue_full_message]}
+            ))
+
+    async def handle_frames(self):
+        while True:
+            content = await self.inbound.get()
+            try:
+                wait = await sync_to_async(
+                    take_token, thread_sensitive=False
+                )(self.get_buckets())
+                if wait:
+                    await self.send_json(self.error_frame(
+                        {'__all__': [self.rate_limited_message]},
+                        retry_after=round(wait, 1)
+                    ))
+                else:
+                    await self.handle_json(content)
+            except Exception:
+                logger.exception(
+                    'frame failed channel=%s', self.channel_name
+                )
+                await self.close()
+                return
+
+    def get_buckets(self):
+        """:return: buckets of the user and of the room for take_token"""
+        limits = getattr(
+            settings, f'{self.rate_limit_name.upper()}_RATE_LIMITS', {}
+        )
+        idents = {
+            'user': self.scope['user'].pk or self.channel_name,
+            'room': self.room_id,
+        }
+        return [
+            (bucket_key(f'{self.rate_limit_name}_{scope}', ident),
+             *limits[scope])
+            for scope, ident in idents.items() if scope in limits
+        ]
+
+    async def handle_json(self, content):
+        raise NotImplementedError
+
+    def error_frame(self, errors, **extra):
+        """:return: json with errors ({field: [messages]}) of a frame"""
+        return {**errors, **extra}
@@ -1,74 +1,121 @@
-import json
+import logging
+from functools import lru_cache
 
-from asgiref.sync import async_to_sync
-from channels.generic.websocket import WebsocketConsumer
+from django.conf import settings
 from django.forms.models import model_to_dict
 
+from src.consumers import (
+    BroadcastBatcher, QueuedJsonWebsocketConsumer, database_task
+)
+
 from .forms import ThreadCreateForm
 from .models import Thread
 
+logger = logging.getLogger(__name__)
+
+# new threads of a room created within a window are sent as one message
+new_threads = BroadcastBatcher(
+    settings.FORUM_BROADCAST_WINDOW, 'chat_messages'
+)
 
-class ThreadConsumer(WebsocketConsumer):
+
+class ThreadConsumer(QueuedJsonWebsocketConsumer):
     """
     Consumer is responsible for creating a new threads. It gets
-    text_data ('subject', 'content' and 'post_id'). Optionally there
-    can be 'parent' ('thread_id') in text_data.
+    json ('subject', 'content' and 'post_id'). Optionally there
+    can be 'parent' ('thread_id') in json.
     Then new thread will be a comment to a parent,
     otherwise new thread will be direct comment to the parent post.
+    New threads are sent to sockets of the room as a list (see
+    :new_threads:). Post of a parent thread is cached per connection
+    (:parent_cache_size: threads), replies usually go to the same
+    threads. New threads of a user and of a room are limited by
+    THREAD_RATE_LIMITS.
     """
-    def connect(self):
+    parent_cache_size = 128
+    rate_limit_name = 'thread'
+
+    async def connect(self):
         self.room_id = self.scope['url_route']['kwargs']['room_id']
         self.forum_group_name = f'forum_{self.room_id}'
+        self.parent_post_id = lru_cache(self.parent_cache_size)(
+            self.get_parent_post_id
+        )
 
-        print(f'connected to {self.forum_group_name}')
-        async_to_sync(self.channel_layer.group_add)(
+        await self.channel_layer.group_add(
             self.forum_group_name,
             self.channel_name,
         )
+        await self.accept()
+        logger.debug(
+            'connected group=%s channel=%s',
+            self.forum_group_name, self.channel_name
+        )
 
-        self.accept()
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(
+            self.forum_group_name,
+            self.channel_name,
+        )
+        logger.debug(
+            'disconnected group=%s channel=%s code=%s',
+            self.forum_group_name, self.channel_name, close_code
+        )
 
-    def disconnect(self):
-        self.close()
+    async def handle_json(self, content):
+        thread, errors = await self.create_thread(content)
+        if errors:
+            return await self.send_json(self.error_frame(errors))
+        logger.info(
+            'thread created group=%s thread=%s author=%s',
+            self.forum_group_name, thread['id'], thread['author']
+        )
+        await new_threads.publish(
+            self.channel_layer,
+            self.forum_group_name,
+            {'type': 'chat_message', 'data': thread}
+        )
+
+    @staticmethod
+    def get_parent_post_id(parent):
+        """:return: id of the post of the thread"""
+        return (Thread.objects
+                .values_list('post_id', flat=True)
+                .get(id=parent))
 
-    def receive(self, text_data):
-        json_data = json.loads(text_data)
+    @database_task
+    def create_thread(self, content):
+        """:return: (thread as dict, None) or (None, errors)"""
         author = self.scope['user']
-        parent_thread = json_data.get('parent', None)
+        post_id = content.get('post_id')
+        parent_thread = content.get('parent', None)
         # check if new thread should be
         # direct comment to the post or comment to the thread
         if parent_thread:
-            parent_thread = int(parent_thread)
-            json_data['post_id'] = Thread.objects.get(id=parent_thread).post_id
+            try:
+                parent_thread = int(parent_thread)
+                post_id = self.parent_post_id(parent_thread)
+            except (TypeError, ValueError, Thread.DoesNotExist):
+                return None, {'parent': ['Nie ma takiego komentarza']}
         thread_data = {
             'author': author.id,
-            'post': int(json_data['post_id']),
-            'subject': json_data['subject'],
-            'content': json_data['content'],
+            'post': post_id,
+            'subject': content.get('subject'),
+            'content': content.get('content'),
             'parent': parent_thread
         }
         form = ThreadCreateForm(thread_data)
-        if form.is_valid():
-            thread = form.save()
-
-            thread_dict = model_to_dict(thread)
-            thread_dict['date'] = thread.date.strftime('%d.%m.%y %H:%M')
-            thread_dict['author'] = author.username
-            thread_dict['thread_parent'] = parent_thread
+        if not form.is_valid():
+            return None, form.errors
+        thread = form.save()
 
-            return async_to_sync(self.channel_layer.group_send)(
-                self.forum_group_name,
-                {
-                    'type': 'chat_message',
-                    'data': thread_dict
-                }
-            )
-        self.send(text_data=json.dumps(
-            form.errors
-        ))
+        thread_dict = model_to_dict(thread)
+        thread_dict['date'] = thread.date.strftime('%d.%m.%y %H:%M')
+        thread_dict['author'] = author.username
+        thread_dict['thread_parent'] = parent_thread
+        return thread_dict, None
 
-    def chat_message(self, event):
-        print(event)
-        self.send(text_data=json.dumps(
-            event['data']
-        ))
+    async def chat_messages(self, event):
+        await self.send_json([
+            message['data'] for message in event['messages']
+        ])
@@ -0,0 +1,120 @@
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
+
+from src.benchmark import BenchmarkCommand
+from src.forum.models import Opinion, Post, Thread
+from src.rooms.models import Room
+
+User = get_user_model()
+
+PAGE = 20
+BATCH = 50000
+
+
+def old_data_with_likes():
+    """PostQuerySet.data_with_likes before the totals were stored"""
+    return Post.visible.annotate(all_likes_old=Coalesce(
+        Sum(F('threads__opinions__likes') + F('opinions__likes')), 0
+    )).order_by('-all_likes_old')
+
+
+class Command(BenchmarkCommand):
+    help = 'Compare all posts page ordered by joined and stored likes'
+    repeat = 3
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--posts', type=int, default=20000)
+        parser.add_argument(
+            '--threads', type=int, default=5,
+            help='number of threads of every post'
+        )
+        parser.add_argument('--opinions', type=int, default=1000000)
+        parser.add_argument('--users', type=int, default=2000)
+
+    def populate(self, **options):
+        random.seed(0)
+        User.objects.bulk_create(
+            [User(username=f'benchmark{num}', password='!')
+             for num in range(options['users'])]
+        )
+        user_ids = list(
+            User.objects
+            .filter(username__startswith='benchmark')
+            .values_list('id', flat=True)
+        )
+        room = Room.objects.create(
+            receiver='benchmark', creator_id=user_ids[0], gift='benchmark',
+            price=100, to_collect=100, visible=True,
+            date_expires=date.today() + timedelta(days=30),
+        )
+        Post.objects.bulk_create([
+            Post(room=room, author_id=random.choice(user_ids),
+                 subject=f'post{num}', content='benchmark')
+            for num in range(options['posts'])
+        ])
+        post_ids = list(
+            Post.objects.filter(room=room).values_list('id', flat=True)
+        )
+        Thread.objects.bulk_create([
+            Thread(post_id=post_id, author_id=random.choice(user_ids),
+                   subject='thread', content='benchmark')
+            for post_id in post_ids
+            for _ in range(options['threads'])
+        ])
+        thread_ids = list(
+            Thread.objects.filter(post__room=room)
+            .values_list('id', flat=True)
+        )
+        # every target gets opinions of different users, a fifth of
+        # opinions is about posts
+        targets = (
+            [('post_id', post_id) for post_id in post_ids]
+            + [('thread_id', thread_id) for thread_id in thread_ids]
+        )
+        per_target, extra = divmod(options['opinions'], len(targets))
+        opinions = []
+        for num, (field, target_id) in enumerate(targets):
+            count = per_target + (num < extra)
+            for user_id in random.sample(user_ids, count):
+                opinions.append(Opinion(**{
+                    field: target_id,
+                    'user_id': user_id,
+                    'likes': random.choice([1, 1, 1, -1]),
+                }))
+            if len(opinions) >= BATCH:
+                Opinion.objects.bulk_create(opinions)
+                opinions = []
+        Opinion.objects.bulk_create(opinions)
+        self.opinions = Opinion.objects.count()
+        # bulk_create does not update counters
+        Thread.objects.rebuild_opinion_counters()
+        Post.objects.rebuild_opinion_counters()
+        Post.objects.rebuild_all_likes()
+        Post.objects.update_hot_scores()
+
+    def run(self, **options):
+        self.explain('Stare zapytanie', old_data_with_likes()[:PAGE])
+        self.explain(
+            'Nowe zapytanie', Post.visible.data_with_likes()[:PAGE]
+        )
+        self.explain('Gorące', Post.visible.hot()[:PAGE])
+
+        self.stdout.write(
+            f'Pierwsza strona postów przy {self.opinions} opiniach:'
+        )
+        old = self.measure(
+            'stare', lambda: list(old_data_with_likes()[:PAGE])
+        )
+        new = self.measure(
+            'nowe', lambda: list(Post.visible.data_with_likes()[:PAGE])
+        )
+        self.measure('gorące', lambda: list(Post.visible.hot()[:PAGE]))
+        self.stdout.write(f'Przyspieszenie: {old / new:.1f}x')
+        self.measure(
+            'przeliczenie gorących', Post.objects.update_hot_scores
+        )
@@ -0,0 +1,102 @@
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.db.models import Prefetch, Sum
+from django.test import RequestFactory
+
+from src.benchmark import BenchmarkCommand
+from src.forum.models import Opinion, Post, Thread
+from src.forum.views import PostListView
+from src.rooms.models import Room
+
+User = get_user_model()
+
+
+def old_summarise(queryset):
+    """PostQuerySet.summarise before it was a single query"""
+    all_comments = []
+    posts = (queryset.prefetch_related(
+                Prefetch(
+                    'threads',
+                    queryset=Thread.objects.filter(parent__isnull=True),
+                )
+            )
+            .prefetch_related('author'))
+    for post in posts:
+        all_comments.append({
+            'id': post.id,
+            'author': post.author,
+            'subject': post.subject,
+            'content': post.content,
+            'date': post.date,
+            'threads': post.threads.count(),
+        })
+    likes = (queryset.annotate(likes__sum=Sum('opinions__likes'))
+             .values('pk', 'likes__sum'))
+    for post in likes:
+        for comment in all_comments:
+            if comment['id'] == post['pk']:
+                comment['likes'] = post['likes__sum']
+    return all_comments
+
+
+class Command(BenchmarkCommand):
+    help = 'Compare building all posts of a room with the first page'
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--posts', type=int, default=5000)
+        parser.add_argument(
+            '--threads', type=int, default=3,
+            help='number of main threads of every post'
+        )
+
+    def populate(self, **options):
+        random.seed(0)
+        self.user = User.objects.create(
+            username='benchmark_room', password='!'
+        )
+        self.room = Room.objects.create(
+            receiver='benchmark', creator=self.user, gift='benchmark',
+            price=100, to_collect=100, visible=True,
+            date_expires=date.today() + timedelta(days=30),
+        )
+        Post.objects.bulk_create([
+            Post(room=self.room, author=self.user,
+                 subject=f'post{num}', content='benchmark')
+            for num in range(options['posts'])
+        ])
+        post_ids = list(
+            Post.objects.filter(room=self.room).values_list('id', flat=True)
+        )
+        Thread.objects.bulk_create([
+            Thread(post_id=post_id, author=self.user,
+                   subject='thread', content='benchmark')
+            for post_id in post_ids
+            for _ in range(options['threads'])
+        ])
+        Opinion.objects.bulk_create([
+            Opinion(post_id=post_id, user=self.user,
+                    likes=random.choice([1, -1]))
+            for post_id in post_ids
+        ])
+        Post.objects.filter(room=self.room).rebuild_opinion_counters()
+
+    def run(self, **options):
+        posts = Post.visible.filter(room_id=self.room.id)
+        self.explain(
+            'Pierwsza strona', posts.order_by('id').summarise()[:21]
+        )
+        request = RequestFactory().get(f'/forum/{self.room.id}/')
+        request.user = AnonymousUser()
+        view = PostListView.as_view()
+
+        def first_page():
+            view(request, pk=self.room.id).render()
+
+        self.stdout.write(f'Zbiórka z {options["posts"]} postami:')
+        old = self.measure('stare summarise', lambda: old_summarise(posts))
+        new = self.measure('nowa pierwsza strona (z szablonem)', first_page)
+        self.stdout.write(f'Przyspieszenie: {old / new:.1f}x')
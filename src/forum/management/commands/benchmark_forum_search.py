@@ -0,0 +1,95 @@
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+
+from src.benchmark import BenchmarkCommand
+from src.forum.models import Post, Thread
+from src.forum.search import (
+    JoinSearchBackend, after_cursor, encode_cursor, get_backend,
+    update_index
+)
+from src.rooms.models import Room
+
+User = get_user_model()
+
+WORDS = [
+    'rower', 'laptop', 'telefon', 'książka', 'wycieczka', 'koncert',
+    'prezent', 'urodziny', 'kolor', 'rozmiar', 'sklep', 'dostawa',
+    'termin', 'cena', 'zniżka', 'kupić', 'wybrać', 'zapłacić',
+]
+# about 5000 words, so a phrase is found in a small part of posts
+VOCABULARY = [f'{word}{num}' for word in WORDS for num in range(100, 380)]
+PHRASES = ['rower123', 'kolor200', 'termin345', 'sklep150']
+PAGE = 20
+
+
+def text(words):
+    return ' '.join(random.choices(VOCABULARY, k=words))
+
+
+class Command(BenchmarkCommand):
+    help = 'Compare search joining threads with the forum search index'
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument(
+            '--threads', type=int, default=5,
+            help='number of threads of every post'
+        )
+
+    def populate(self, **options):
+        random.seed(0)
+        user = User.objects.create(username='benchmark_forum', password='!')
+        room = Room.objects.create(
+            receiver='benchmark', creator=user, gift='benchmark',
+            price=100, to_collect=100, visible=True,
+            date_expires=date.today() + timedelta(days=30),
+        )
+        Post.objects.bulk_create([
+            Post(room=room, author=user, subject=text(3), content=text(20))
+            for _ in range(options['posts'])
+        ])
+        posts = Post.objects.filter(room=room)
+        threads = []
+        for post_id in posts.values_list('id', flat=True).iterator():
+            for _ in range(options['threads']):
+                threads.append(Thread(
+                    author=user, post_id=post_id,
+                    subject=text(3), content=text(20),
+                ))
+        Thread.objects.bulk_create(threads)
+        # bulk_create does not send post_save
+        update_index(posts)
+
+    def run(self, **options):
+        old_backend = JoinSearchBackend()
+        backend = get_backend()
+        name = type(backend).__name__
+        self.explain('join', Post.visible.search(PHRASES[0], old_backend))
+        self.explain(name, Post.visible.search(PHRASES[0], backend))
+
+        def old_pages():
+            # count and offset pagination like AllPostListView before
+            for phrase in PHRASES:
+                posts = Post.visible.search(phrase, old_backend)
+                posts.count()
+                list(posts.order_by('-id')[:PAGE])
+                list(posts.order_by('-id')[PAGE:2 * PAGE])
+
+        def new_pages():
+            for phrase in PHRASES:
+                posts = (Post.visible.search(phrase, backend)
+                         .order_by('-search_rank', '-id'))
+                first = list(posts[:PAGE])
+                if first:
+                    cursor = encode_cursor(first[-1])
+                    list(after_cursor(posts, cursor)[:PAGE])
+
+        self.stdout.write(
+            f'Dwie strony wyników dla {len(PHRASES)} fraz:'
+        )
+        old = self.measure('join', old_pages)
+        new = self.measure(name, new_pages)
+        self.stdout.write(f'Przyspieszenie: {old / new:.1f}x')
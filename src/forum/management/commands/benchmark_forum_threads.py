@@ -0,0 +1,96 @@
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Max
+
+from src.benchmark import BenchmarkCommand
+from src.forum.models import Post, Thread
+from src.rooms.models import Room
+
+User = get_user_model()
+
+
+def old_show_children(thread):
+    """Thread.show_children before threads had paths"""
+    all_threads = []
+    if not thread.children.all():
+        return all_threads
+    for child in thread.children.all():
+        all_threads.append({child: old_show_children(child)})
+    return all_threads
+
+
+class Command(BenchmarkCommand):
+    help = 'Compare recursive and materialized path reading of thread tree'
+    repeat = 3
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--threads', type=int, default=10000)
+        parser.add_argument(
+            '--children', type=int, default=4,
+            help='maximal number of children of a thread'
+        )
+
+    def populate(self, **options):
+        random.seed(0)
+        user = User.objects.create(username='benchmark_threads', password='!')
+        room = Room.objects.create(
+            receiver='benchmark', creator=user, gift='benchmark',
+            price=100, to_collect=100, visible=True,
+            date_expires=date.today() + timedelta(days=30),
+        )
+        post = Post.objects.create(
+            room=room, author=user, subject='benchmark', content='benchmark'
+        )
+        # ids are given explicitly, so paths are known before insert
+        # (bulk_create does not return ids on SQLite)
+        next_id = (Thread.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+        self.root = Thread(
+            id=next_id, author=user, post=post, subject='0', content='0',
+            path=str(next_id).zfill(Thread.PATH_STEP), depth=0,
+        )
+        threads = [self.root]
+        open_threads = [self.root]
+        while len(threads) < options['threads']:
+            parent = open_threads.pop(0)
+            for _ in range(random.randint(1, options['children'])):
+                if len(threads) >= options['threads']:
+                    break
+                thread_id = next_id + len(threads)
+                thread = Thread(
+                    id=thread_id, author=user, post=post, parent=parent,
+                    subject=str(len(threads)), content=str(len(threads)),
+                    path=parent.path + str(thread_id).zfill(Thread.PATH_STEP),
+                    depth=parent.depth + 1,
+                )
+                threads.append(thread)
+                open_threads.append(thread)
+        Thread.objects.bulk_create(threads, batch_size=500)
+        self.depth = max(thread.depth for thread in threads)
+
+    def run(self, **options):
+        root = Thread.objects.get(pk=self.root.pk)
+        self.explain('Poddrzewo', Thread.objects.subtree(root))
+        for name, show_children in [
+            ('rekurencyjnie', lambda: old_show_children(root)),
+            ('ścieżka', root.show_children),
+        ]:
+            queries = []
+
+            def count_query(execute, sql, params, many, context):
+                queries.append(sql)
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(count_query):
+                show_children()
+            self.stdout.write(f'{name}: {len(queries)} zapytań')
+
+        self.stdout.write(
+            f'Drzewo {options["threads"]} wątków o głębokości {self.depth}:'
+        )
+        old = self.measure('rekurencyjnie', lambda: old_show_children(root))
+        new = self.measure('ścieżka', root.show_children)
+        self.stdout.write(f'Przyspieszenie: {old / new:.1f}x')
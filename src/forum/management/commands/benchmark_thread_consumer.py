@@ -0,0 +1,186 @@
+import asyncio
+import json
+import time
+from datetime import date, timedelta
+
+from asgiref.sync import async_to_sync
+from channels.generic.websocket import WebsocketConsumer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.forms.models import model_to_dict
+from django.test import override_settings
+from django.urls import path
+
+from src.benchmark import BenchmarkCommand
+from src.forum.consumers import ThreadConsumer, new_threads
+from src.forum.forms import ThreadCreateForm
+from src.forum.models import Post, Thread
+from src.rooms.models import Room
+
+User = get_user_model()
+
+TIMEOUT = 600
+
+
+class OldThreadConsumer(WebsocketConsumer):
+    """ThreadConsumer before it was asynchronous (without prints)"""
+    def connect(self):
+        self.room_id = self.scope['url_route']['kwargs']['room_id']
+        self.forum_group_name = f'forum_{self.room_id}'
+        async_to_sync(self.channel_layer.group_add)(
+            self.forum_group_name,
+            self.channel_name,
+        )
+        self.accept()
+
+    def disconnect(self, close_code):
+        self.close()
+
+    def receive(self, text_data):
+        json_data = json.loads(text_data)
+        author = self.scope['user']
+        parent_thread = json_data.get('parent', None)
+        if parent_thread:
+            parent_thread = int(parent_thread)
+            json_data['post_id'] = Thread.objects.get(id=parent_thread).post_id
+        form = ThreadCreateForm({
+            'author': author.id,
+            'post': int(json_data['post_id']),
+            'subject': json_data['subject'],
+            'content': json_data['content'],
+            'parent': parent_thread
+        })
+        if form.is_valid():
+            thread = form.save()
+            thread_dict = model_to_dict(thread)
+            thread_dict['date'] = thread.date.strftime('%d.%m.%y %H:%M')
+            thread_dict['author'] = author.username
+            thread_dict['thread_parent'] = parent_thread
+            return async_to_sync(self.channel_layer.group_send)(
+                self.forum_group_name,
+                {'type': 'chat_message', 'data': thread_dict}
+            )
+        self.send(text_data=json.dumps(form.errors))
+
+    def chat_message(self, event):
+        self.send(text_data=json.dumps(event['data']))
+
+
+class Command(BenchmarkCommand):
+    help = 'Compare threads per second and sent messages of the old ' \
+           'and new ThreadConsumer (in-process ASGI application and ' \
+           'in-memory channel layer)'
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--sockets', type=int, default=1000)
+        parser.add_argument('--threads', type=int, default=50)
+
+    def handle(self, *args, **options):
+        # consumers save threads in their own threads and connections,
+        # so data is committed and removed at the end
+        self.populate(**options)
+        try:
+            layers = {'default': {
+                'BACKEND': 'channels.layers.InMemoryChannelLayer',
+                'CONFIG': {
+                    'capacity': options['threads'] * 2,
+                    'expiry': TIMEOUT,
+                },
+            }}
+            # one user sends everything, so rate limits are turned off
+            with override_settings(
+                CHANNEL_LAYERS=layers, THREAD_RATE_LIMITS={}
+            ):
+                self.run(**options)
+        finally:
+            Room.objects.filter(pk=self.room.pk).delete()
+            self.user.delete()
+
+    def populate(self, **options):
+        self.user = User.objects.create(
+            username='benchmark_thread', password='!'
+        )
+        self.room = Room.objects.create(
+            receiver='receiver', creator=self.user, gift='gift',
+            price=1000, to_collect=1000, visible=True,
+            date_expires=date.today() + timedelta(days=30)
+        )
+        self.post = Post.objects.create(
+            room=self.room, author=self.user, subject='post',
+            content='post'
+        )
+        self.parent = Thread.objects.create(
+            author=self.user, post=self.post, subject='parent',
+            content='parent'
+        )
+
+    def run(self, **options):
+        old_application, self.new_application = [
+            URLRouter([path('ws/room/<int:room_id>/post/', consumer)])
+            for consumer in [OldThreadConsumer, ThreadConsumer]
+        ]
+        for name, application in [
+            ('stary (WebsocketConsumer)', old_application),
+            ('nowy (AsyncJsonWebsocketConsumer)', self.new_application),
+        ]:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            async_to_sync(self.load_test)(application, **options)
+
+    async def load_test(self, application, sockets, threads, **options):
+        url = f'/ws/room/{self.room.id}/post/'
+        start = time.perf_counter()
+        communicators = []
+        for _ in range(sockets):
+            communicator = WebsocketCommunicator(application, url)
+            communicator.scope['user'] = self.user
+            connected, _ = await communicator.connect(TIMEOUT)
+            if connected:
+                communicators.append(communicator)
+        self.stdout.write(
+            f'otwarte gniazda: {len(communicators)} '
+            f'w {time.perf_counter() - start:.1f} s'
+        )
+        authors = [
+            communicators[num % len(communicators)]
+            for num in range(threads)
+        ]
+        # half are replies to the same thread
+        messages = [
+            {'parent': self.parent.id, 'subject': 's', 'content': 'c'}
+            if num % 2 else
+            {'post_id': self.post.id, 'subject': 's', 'content': 'c'}
+            for num in range(threads)
+        ]
+
+        async def read(communicator):
+            """:return: number of received messages"""
+            received = frames = 0
+            while received < threads:
+                message = await communicator.receive_json_from(TIMEOUT)
+                received += len(message) if isinstance(message, list) else 1
+                frames += 1
+            return frames
+
+        new_threads.reset()
+        start = time.perf_counter()
+        frames = await asyncio.gather(
+            *[read(communicator) for communicator in communicators],
+            *[
+                author.send_json_to(message)
+                for author, message in zip(authors, messages)
+            ],
+        )
+        elapsed = time.perf_counter() - start
+        frames = sum(frames[:len(communicators)])
+        self.stdout.write(
+            f'{threads} wątków w {elapsed:.2f} s: '
+            f'{threads / elapsed:.0f} wątków/s, '
+            f'{frames} wiadomości ({frames / elapsed:.0f}/s)'
+        )
+        if application is self.new_application:
+            self.stdout.write(f'paczki: {new_threads.metrics()}')
+        await asyncio.gather(*[
+            communicator.disconnect() for communicator in communicators
+        ])
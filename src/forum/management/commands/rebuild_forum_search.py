@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from src.forum.models import Post
+from src.forum.search import get_backend, update_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild search documents of posts and the search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'post_ids', nargs='*', type=int,
+            help='ids of posts to rebuild. All posts if empty'
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.all()
+        if options['post_ids']:
+            posts = posts.filter(id__in=options['post_ids'])
+        update_index(posts)
+        self.stdout.write(self.style.SUCCESS(
+            f'Zaktualizowano indeks ({type(get_backend()).__name__})'
+        ))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from src.forum.models import Post, Thread
+
+
+class Command(BaseCommand):
+    help = 'Rebuild like and dislike counters of posts and threads'
+
+    def handle(self, *args, **options):
+        threads = Thread.objects.rebuild_opinion_counters()
+        posts = Post.objects.rebuild_opinion_counters()
+        # all_likes includes scores of threads, so it goes last
+        Post.objects.rebuild_all_likes()
+        self.stdout.write(self.style.SUCCESS(
+            f'Przeliczono {posts} postów i {threads} wątków'
+        ))
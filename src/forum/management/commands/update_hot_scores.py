@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from src.forum.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Recalculate time-decayed hot ranking of posts, run it periodically'
+
+    def handle(self, *args, **options):
+        updated = Post.objects.update_hot_scores()
+        self.stdout.write(self.style.SUCCESS(f'Przeliczono {updated} postów'))
@@ -0,0 +1,80 @@
+# Generated by Django 2.2.28 on 2026-10-17 06:34
+
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+FIELDS = 'subject, content, search_document'
+# configuration of the default SEARCH_CONFIG. Migration does not read
+# settings, run rebuild_forum_search after switching to another one.
+CONFIG = 'simple'
+
+
+def fill_search_index(apps, schema_editor):
+    Post = apps.get_model('forum', 'Post')
+    posts = (Post._default_manager
+             .select_related('room', 'author')
+             .prefetch_related('threads'))
+    changed = []
+    for post in posts:
+        parts = [post.room.gift, post.author.username]
+        for thread in post.threads.all():
+            parts.extend([thread.subject, thread.content])
+        post.search_document = '\n'.join(parts)
+        changed.append(post)
+    Post._default_manager.bulk_update(changed, ['search_document'])
+
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute(
+            "UPDATE forum_post SET search_vector = "
+            "setweight(to_tsvector(%s::regconfig, COALESCE(subject, '')), 'A') || "
+            "setweight(to_tsvector(%s::regconfig, COALESCE(content, '')), 'B') || "
+            "setweight(to_tsvector(%s::regconfig, COALESCE(search_document, '')), 'C')",
+            [CONFIG, CONFIG, CONFIG]
+        )
+        schema_editor.execute(
+            'CREATE INDEX post_search_vector ON forum_post '
+            'USING gin (search_vector)'
+        )
+    elif connection.vendor == 'sqlite':
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'CREATE VIRTUAL TABLE forum_post_search '
+                    f'USING fts5({FIELDS}, tokenize="trigram")'
+                )
+        except Exception:
+            return  # search uses icontains without the table
+        schema_editor.execute(
+            f'INSERT INTO forum_post_search (rowid, {FIELDS}) '
+            f'SELECT id, {FIELDS} FROM forum_post'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS post_search_vector')
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS forum_post_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0012_auto_20190617_2222'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='search_document',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_search_index, drop_search_index),
+    ]
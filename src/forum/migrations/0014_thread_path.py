@@ -0,0 +1,56 @@
+# Generated by Django 2.2.28 on 2026-10-17 09:12
+
+from django.db import migrations, models
+
+PATH_STEP = 10
+
+
+def fill_paths(apps, schema_editor):
+    Thread = apps.get_model('forum', 'Thread')
+    parents = dict(
+        Thread._default_manager.values_list('id', 'parent_id')
+    )
+    paths = {}
+
+    def get_path(thread_id):
+        # iterative, discussions can be deeper than the recursion limit
+        chain = []
+        ancestor_id = thread_id
+        while ancestor_id is not None and ancestor_id not in paths:
+            chain.append(ancestor_id)
+            ancestor_id = parents[ancestor_id]
+        path, depth = paths.get(ancestor_id, ('', -1))
+        for ancestor_id in reversed(chain):
+            path += str(ancestor_id).zfill(PATH_STEP)
+            depth += 1
+            paths[ancestor_id] = path, depth
+        return paths[thread_id]
+
+    threads = []
+    for thread in Thread._default_manager.only('id', 'parent_id'):
+        thread.path, thread.depth = get_path(thread.id)
+        threads.append(thread)
+    Thread._default_manager.bulk_update(
+        threads, ['path', 'depth'], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0013_post_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thread',
+            name='path',
+            field=models.TextField(db_index=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 2.2.28 on 2026-10-17 06:53
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Opinion = apps.get_model('forum', 'Opinion')
+    opinions = Opinion._default_manager
+    for field in ['post', 'thread']:
+        # only the latest opinion of the user about the object is kept
+        latest = (opinions
+                  .filter(**{f'{field}__isnull': False})
+                  .values('user', field)
+                  .annotate(latest=Max('id'))
+                  .values_list('latest', flat=True))
+        (opinions
+         .filter(**{f'{field}__isnull': False})
+         .exclude(id__in=latest)
+         .delete())
+
+        Model = apps.get_model('forum', field)
+        target_opinions = (opinions
+                           .filter(**{field: OuterRef('pk')})
+                           .order_by()
+                           .values(field))
+
+        def count(likes):
+            return Coalesce(
+                Subquery(
+                    target_opinions.filter(likes=likes)
+                                   .annotate(num=Count('id'))
+                                   .values('num'),
+                    output_field=IntegerField()
+                ),
+                0
+            )
+
+        Model._default_manager.update(
+            like_count=count(1),
+            dislike_count=count(-1),
+            score=count(1) - count(-1),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('forum', '0014_thread_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='dislike_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='score',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='dislike_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='score',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='opinion',
+            unique_together={('user', 'post'), ('user', 'thread')},
+        ),
+    ]
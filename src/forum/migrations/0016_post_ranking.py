@@ -0,0 +1,51 @@
+# Generated by Django 2.2.28 on 2026-10-17 06:57
+
+from django.db import migrations, models
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_all_likes(apps, schema_editor):
+    Post = apps.get_model('forum', 'Post')
+    Thread = apps.get_model('forum', 'Thread')
+    threads = (Thread._default_manager
+               .filter(post=OuterRef('pk'))
+               .order_by()
+               .values('post'))
+    threads_score = Coalesce(
+        Subquery(
+            threads.annotate(total=Sum('score')).values('total'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+    Post._default_manager.update(all_likes=F('score') + threads_score)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0015_opinion_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='all_likes',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='hot_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_all_likes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-all_likes', 'id'], name='post_all_likes'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-hot_score', '-id'], name='post_hot_score'),
+        ),
+    ]
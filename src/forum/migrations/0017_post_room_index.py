@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-17 07:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0016_post_ranking'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['room', 'id'], name='post_room_id'),
+        ),
+    ]
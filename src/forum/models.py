@@ -1,63 +1,230 @@
+from datetime import timedelta
+
 from django.conf import settings
-from django.db import models
-from django.db.models import Count, F, Prefetch, Q, Sum
-from django.db.models.functions import Coalesce
-from django.forms.models import model_to_dict
+from django.contrib.postgres.search import SearchVectorField
+from django.db import IntegrityError, models, transaction
+from django.db.models import (
+    Count, F, IntegerField, OuterRef, Subquery, Sum
+)
+from django.db.models.functions import Coalesce, Substr
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
 
 from src.rooms.models import Room
 
+from . import search
+
+
+class OpinionCountersQuerySet(models.QuerySet):
+    def rebuild_opinion_counters(self):
+        """
+        Recalculate like_count, dislike_count and score from Opinion
+        table with a single UPDATE.
+        :return: number of updated rows
+        """
+        opinions = (Opinion.objects
+                    .filter(**{self.model.opinion_field: OuterRef('pk')})
+                    .order_by()
+                    .values(self.model.opinion_field))
+
+        def count(likes):
+            return Coalesce(
+                Subquery(
+                    opinions.filter(likes=likes)
+                            .annotate(num=Count('id'))
+                            .values('num'),
+                    output_field=IntegerField()
+                ),
+                0
+            )
+
+        like_count = count(Opinion.LIKE)
+        dislike_count = count(Opinion.DISLIKE)
+        return self.update(
+            like_count=like_count,
+            dislike_count=dislike_count,
+            score=like_count - dislike_count,
+        )
+
+
+class OpinionCounters(models.Model):
+    """
+    Counters of opinions (likes) about the object, updated in the same
+    transaction as the Opinion. :opinion_field: is the name of
+    Opinion foreign key to the model.
+    """
+    like_count = models.PositiveIntegerField(default=0, editable=False)
+    dislike_count = models.PositiveIntegerField(default=0, editable=False)
+    score = models.IntegerField(default=0, editable=False)
+
+    opinion_field = None
+
+    class Meta:
+        abstract = True
+
+    def get_likes(self):
+        """current score (likes - dislikes) read from the database"""
+        self.refresh_from_db(fields=['like_count', 'dislike_count', 'score'])
+        return self.score
+
+    def add_like(self, user):
+        return self.set_opinion(user, Opinion.LIKE)
+
+    def add_dislike(self, user):
+        return self.set_opinion(user, Opinion.DISLIKE)
+
+    @transaction.atomic
+    def set_opinion(self, user, likes):
+        """
+        User has one opinion about the object. The same opinion given
+        again is withdrawn, the opposite one replaces it.
+        :return: new score
+        """
+        target = {self.opinion_field: self}
+        opinion = (Opinion.objects
+                   .select_for_update()
+                   .filter(user=user, **target)
+                   .first())
+        if opinion is None:
+            try:
+                with transaction.atomic():
+                    Opinion.objects.create(user=user, likes=likes, **target)
+            except IntegrityError:
+                # the same user has just added it in another request
+                return self.get_likes()
+            change = {likes: 1}
+        elif opinion.likes == likes:
+            opinion.delete()
+            change = {likes: -1}
+        else:
+            opinion.likes = likes
+            opinion.save(update_fields=['likes'])
+            change = {likes: 1, -likes: -1}
+        like = change.get(Opinion.LIKE, 0)
+        dislike = change.get(Opinion.DISLIKE, 0)
+        type(self).objects.filter(pk=self.pk).update(
+            like_count=F('like_count') + like,
+            dislike_count=F('dislike_count') + dislike,
+            score=F('score') + like - dislike,
+        )
+        self.score_changed(like - dislike)
+        return self.get_likes()
+
+    def score_changed(self, change):
+        """update totals which include the score"""
 
-class PostQuerySet(models.QuerySet):
+
+class PostQuerySet(OpinionCountersQuerySet):
     def get_visible(self):
         return self.filter(room__visible=True)
 
-    def search(self, field):
-        queryset = self.filter(
-            Q(room__gift__icontains=field) |
-            Q(author__username__icontains=field) |
-            Q(subject__icontains=field) |
-            Q(content__icontains=field) |
-            Q(threads__subject__icontains=field) |
-            Q(threads__content__icontains=field)
-        ).distinct()
-        return queryset
+    def search(self, field, backend=None):
+        """
+        Posts are searched in the search index (see search.py) and
+        annotated with 'search_rank' (higher is better).
+        """
+        if backend is None:
+            backend = search.get_backend()
+        return backend.search(self, field)
 
     def summarise(self):
-        all_comments = []
-        posts = (self.prefetch_related(
-                    Prefetch(
-                        'threads',
-                        queryset=Thread.objects.filter(parent__isnull=True),
-                    )
-                )
-                .prefetch_related('author'))
-        for post in posts:
-            post_detail = {
-                'id': post.id,
-                'author': post.author,
-                'subject': post.subject,
-                'content': post.content,
-                'date': post.date,
-                'threads': post.threads.count(),
-            }
-            all_comments.append(post_detail)
-        likes = self.annotate(likes__sum=Sum('opinions__likes')).values('pk', 'likes__sum')
-        for post in likes:
-            post_id = post['pk']
-            for comment in all_comments:
-                if comment['id'] == post_id:
-                    comment['likes'] = post['likes__sum']
-        return all_comments
+        """
+        Lightweight rows (dicts) of posts for the forum page of a room
+        from a single query: author name is joined, main threads are
+        counted by a subquery and likes are the stored score.
+        """
+        main_threads = (Thread.objects
+                        .filter(post=OuterRef('pk'), parent__isnull=True)
+                        .order_by()
+                        .values('post'))
+        return self.annotate(
+            author_name=F('author__username'),
+            thread_count=Coalesce(
+                Subquery(
+                    main_threads.annotate(num=Count('id')).values('num'),
+                    output_field=IntegerField()
+                ),
+                0
+            ),
+            likes=F('score'),
+        ).values(
+            'id', 'author_id', 'author_name', 'subject', 'content', 'date',
+            'thread_count', 'likes'
+        )
+
+    def with_thread_count(self):
+        """annotate 'thread_count' (all threads) by a subquery"""
+        threads = (Thread.objects
+                   .filter(post=OuterRef('pk'))
+                   .order_by()
+                   .values('post'))
+        return self.annotate(thread_count=Coalesce(
+            Subquery(
+                threads.annotate(num=Count('id')).values('num'),
+                output_field=IntegerField()
+            ),
+            0
+        ))
 
     def data_with_likes(self):
-        posts_with_likes = (
-            self.annotate(all_likes=Coalesce(Sum(F('threads__opinions__likes') + F('opinions__likes')), 0))
+        """ordered by all_likes, see Post.all_likes"""
+        return self.order_by('-all_likes', 'id')
+
+    def hot(self):
+        """ordered by hot_score, see :update_hot_scores:"""
+        return self.order_by('-hot_score', '-id')
+
+    def rebuild_all_likes(self):
+        """
+        Recalculate all_likes from scores of posts and threads (rebuild
+        opinion counters first).
+        :return: number of updated posts
+        """
+        threads = (Thread.objects
+                   .filter(post=OuterRef('pk'))
+                   .order_by()
+                   .values('post'))
+        threads_score = Coalesce(
+            Subquery(
+                threads.annotate(total=Sum('score')).values('total'),
+                output_field=IntegerField()
+            ),
+            0
         )
-        ordered_posts = posts_with_likes.order_by('-all_likes')
-        return ordered_posts
+        return self.update(all_likes=F('score') + threads_score)
+
+    def update_hot_scores(self, now=None):
+        """
+        Time-decayed ranking:
+            hot_score = rating / (age in hours + 2) ** HOT_GRAVITY
+        Posts older than HOT_AGE only fall further, so they get 0 and
+        are not recalculated. It should be run periodically
+        (update_hot_scores command).
+        :return: number of updated posts
+        """
+        now = now or timezone.now()
+        since = now - Post.HOT_AGE
+        updated = (self.filter(date__lt=since)
+                       .exclude(hot_score=0)
+                       .update(hot_score=0))
+        recent = (self.filter(date__gte=since)
+                      .annotate(thread_count=Count('threads'))
+                      .only('id', 'date', 'all_likes', 'hot_score'))
+        posts = []
+        for post in recent.iterator():
+            age = (now - post.date).total_seconds() / 3600
+            rating = post.all_likes + post.thread_count
+            hot_score = rating / (age + 2) ** Post.HOT_GRAVITY
+            # every write updates all indexes of the row
+            if hot_score != post.hot_score:
+                post.hot_score = hot_score
+                posts.append(post)
+        Post.objects.bulk_update(posts, ['hot_score'], batch_size=500)
+        return updated + len(posts)
 
 
-class Post(models.Model):
+class Post(OpinionCounters):
     room = models.ForeignKey(
         Room, on_delete=models.CASCADE,
         related_name='posts'
@@ -69,73 +236,152 @@ class Post(models.Model):
     subject = models.CharField('Tytuł', max_length=100)
     content = models.CharField('Treść', max_length=500)
     date = models.DateTimeField(auto_now_add=True)
+    # room, author and threads of the post, see search.py
+    search_document = models.TextField(blank=True, editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
+    # score of the post and all its threads
+    all_likes = models.IntegerField(default=0, editable=False)
+    hot_score = models.FloatField(default=0, editable=False)
 
     visible = PostQuerySet.as_manager()
-    objects = models.Manager()
+    objects = PostQuerySet.as_manager()
+
+    opinion_field = 'post'
+    HOT_GRAVITY = 1.5
+    HOT_AGE = timedelta(days=7)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['room', 'id'], name='post_room_id'),
+            models.Index(fields=['-all_likes', 'id'], name='post_all_likes'),
+            models.Index(fields=['-hot_score', '-id'], name='post_hot_score'),
+        ]
 
     def __str__(self):
         return self.subject
 
     @property
-    def score(self):
-        all_likes = self.all_likes
-        if not all_likes:
-            all_likes = 0
-        num_threads = self.threads.count()
-        return all_likes + num_threads
+    def rating(self):
+        """thread_count is annotated by PostQuerySet.with_thread_count"""
+        thread_count = getattr(self, 'thread_count', None)
+        if thread_count is None:
+            thread_count = self.threads.count()
+        return self.all_likes + thread_count
 
-    def get_likes(self):
-        likes = self.opinions.aggregate(likes__sum=Coalesce(Sum('likes'), 0))
-        return likes['likes__sum']
-
-    def add_like(self, user):
-        Opinion.objects.create(
-            post=self,
-            user=user,
-            likes=1
+    def score_changed(self, change):
+        Post.objects.filter(pk=self.pk).update(
+            all_likes=F('all_likes') + change
         )
-
-    def add_dislike(self, user):
-        Opinion.objects.create(
-            post=self,
-            user=user,
-            likes=-1
+        Room.objects.filter(pk=self.room_id).add_engagement(
+            like_total=change
         )
 
 
-class ThreadQuerySet(models.QuerySet):
+def build_tree(threads):
+    """
+    :param threads: threads ordered by path (whole subtrees)
+    :return: nested list [{thread: [{child: [...]}, ...]}, ...] of
+    the threads without a parent in :threads:. Every thread gets
+    'descendant_count' attribute.
+    """
+    roots = []
+    stack = []   # (thread, list of its children) from root to current
+    for thread in threads:
+        thread.descendant_count = 0
+        while stack and not thread.path.startswith(stack[-1][0].path):
+            stack.pop()
+        for ancestor, _ in stack:
+            ancestor.descendant_count += 1
+        children = []
+        node = {thread: children}
+        if stack:
+            stack[-1][1].append(node)
+        else:
+            roots.append(node)
+        stack.append((thread, children))
+    return roots
+
+
+class ThreadQuerySet(OpinionCountersQuerySet):
+    def subtree(self, thread):
+        """the thread and all its descendants in tree order"""
+        return self.filter(path__startswith=thread.path).order_by('path')
+
     def get_all_children(self):
-        node = []
-        for thread in self.filter(parent__isnull=True):
-            data = thread.show_children()
-            node.append(data)
-        return node
+        """
+        children trees (see :build_tree:) of every main thread from
+        the queryset, read with a single query
+        """
+        main_threads = self.filter(parent__isnull=True)
+        # threads of the same posts (index of post), path of a thread
+        # starts with the path of its main thread
+        threads = (Thread.objects
+                   .filter(post__in=main_threads.values('post'))
+                   .annotate(main_path=Substr('path', 1, Thread.PATH_STEP))
+                   .filter(main_path__in=main_threads.values('path'))
+                   .order_by('path'))
+        return [
+            children
+            for tree in build_tree(threads)
+            for children in tree.values()
+        ]
+
+    def summarise(self):
+        """
+        Thread.summarise of every thread from a single query: children
+        are counted by a subquery, author name is joined.
+        """
+        children = (Thread.objects
+                    .filter(parent=OuterRef('pk'))
+                    .order_by()
+                    .values('parent'))
+        rows = self.annotate(
+            author_name=F('author__username'),
+            likes=F('score'),
+            children_count=Coalesce(
+                Subquery(
+                    children.annotate(num=Count('id')).values('num'),
+                    output_field=IntegerField()
+                ),
+                0
+            ),
+        ).values(
+            'id', 'author_name', 'post_id', 'subject', 'content',
+            'parent_id', 'date', 'likes', 'children_count'
+        )
+        return [
+            {
+                'id': row['id'],
+                'author': row['author_name'],
+                'post': row['post_id'],
+                'subject': row['subject'],
+                'content': row['content'],
+                'parent': row['parent_id'],
+                'date': row['date'].strftime('%d.%m.%y %H:%M'),
+                'likes': row['likes'],
+                'children_count': row['children_count'],
+                'thread_parent': row['parent_id'],
+            }
+            for row in rows
+        ]
 
     def get_main(self, post_id):
         main_threads = (self.filter(post_id=post_id, parent__isnull=True)
-                        .prefetch_related('author')
-                        .prefetch_related('children')
-                        .prefetch_related('opinions'))
+                        .order_by('path'))
         threads_dict = {}
-        for num, thread in enumerate(main_threads):
-            one_thread_dict = {str(num): thread.summarise()}
-            threads_dict.update(one_thread_dict)
+        for num, summary in enumerate(main_threads.summarise()):
+            threads_dict[str(num)] = summary
         return threads_dict
 
     def get_secondary(self, thread_id):
-        threads = (self.filter(parent_id=thread_id)
-                   .prefetch_related('author')
-                   .prefetch_related('children')
-                   .select_related('parent')
-                   .prefetch_related('opinions'))
+        threads = self.filter(parent_id=thread_id).order_by('path')
         threads_dict = {}
-        for num, thread in enumerate(threads):
-            one_thread_dict = {num: thread.summarise()}
-            threads_dict.update(one_thread_dict)
+        for num, summary in enumerate(threads.summarise()):
+            threads_dict[num] = summary
         return threads_dict
 
 
-class Thread(models.Model):
+class Thread(OpinionCounters):
     author = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True
     )
@@ -151,52 +397,60 @@ class Thread(models.Model):
         related_name='children'
     )
 
+    # materialized path: ids of ancestors and the thread, every id is
+    # padded to PATH_STEP digits, so ordering by path gives tree order
+    path = models.TextField(editable=False, db_index=True, default='')
+    depth = models.PositiveSmallIntegerField(editable=False, default=0)
+
     objects = ThreadQuerySet.as_manager()
 
+    opinion_field = 'thread'
+    PATH_STEP = 10
+
+    def save(self, *args, **kwargs):
+        """path is set after insert, when id is known"""
+        is_new = self.pk is None
+        super().save(*args, **kwargs)
+        if is_new:
+            self.set_path()
+
+    def set_path(self):
+        path, depth = '', 0
+        if self.parent_id:
+            parent_path, parent_depth = (Thread.objects
+                                         .filter(pk=self.parent_id)
+                                         .values_list('path', 'depth')
+                                         .get())
+            path, depth = parent_path, parent_depth + 1
+        self.path = path + str(self.pk).zfill(self.PATH_STEP)
+        self.depth = depth
+        Thread.objects.filter(pk=self.pk).update(
+            path=self.path, depth=self.depth
+        )
+
+    def score_changed(self, change):
+        Post.objects.filter(pk=self.post_id).update(
+            all_likes=F('all_likes') + change
+        )
+        Room.objects.filter(posts=self.post_id).add_engagement(
+            like_total=change
+        )
+
     def has_parent(self):
         if self.parent:
             return True
         return False
 
     def summarise(self):
-        summary = model_to_dict(self)
-        summary['author'] = self.author.username
-        summary['date'] = self.date.strftime('%d.%m.%y %H:%M')
-        summary['likes'] = self.get_likes()
-        thread_parent = self.parent.id if self.parent else None
-        summary.update({
-            'children_count': self.children.count(),
-            'thread_parent': thread_parent
-        })
-        return summary
-
-    def get_likes(self):
-        likes = 0
-        for opinion in self.opinions.all():
-            likes += opinion.likes
-        return likes
+        """see ThreadQuerySet.summarise"""
+        return Thread.objects.filter(pk=self.pk).summarise()[0]
 
     def show_children(self):
-        all_threads = []
-        if not self.children.all():
-            return all_threads
-        for thread in self.children.all():
-            all_threads.append({thread: thread.show_children()})
-        return all_threads
-
-    def add_like(self, user):
-        Opinion.objects.create(
-            thread=self,
-            user=user,
-            likes=1
-        )
-
-    def add_dislike(self, user):
-        Opinion.objects.create(
-            thread=self,
-            user=user,
-            likes=-1
-        )
+        """tree of descendants [{child: [...]}, ...] from one query"""
+        tree = build_tree(Thread.objects.subtree(self))
+        if not tree:
+            return []
+        return tree[0][next(iter(tree[0]))]
 
 
 class Opinion(models.Model):
@@ -224,3 +478,62 @@ class Opinion(models.Model):
     )
     likes = models.IntegerField(choices=OPINION_CHOICES)
     date = models.DateField(auto_now_add=True)
+
+    class Meta:
+        # one opinion of the user about a post or a thread
+        unique_together = [('user', 'post'), ('user', 'thread')]
+
+
+@receiver(post_save, sender=Post)
+def update_post_index(sender, instance, **kwargs):
+    search.update_index(Post.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Thread)
+def update_thread_post_index(sender, instance, created, **kwargs):
+    if created:
+        search.add_thread(Post.objects.filter(pk=instance.post_id), instance)
+    else:
+        search.update_index_on_commit(Post, instance.post_id)
+
+
+@receiver(post_delete, sender=Thread)
+def remove_thread_from_index(sender, instance, **kwargs):
+    # threads of a deleted post are removed before the post
+    search.update_index_on_commit(Post, instance.post_id)
+
+
+@receiver(post_delete, sender=Post)
+def remove_post_from_index(sender, instance, **kwargs):
+    search.cancel_update(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def count_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        Room.objects.filter(pk=instance.room_id).add_engagement(post_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def remove_post_counters(sender, instance, **kwargs):
+    # scores of threads are removed when threads are deleted
+    Room.objects.filter(pk=instance.room_id).add_engagement(
+        post_count=-1, like_total=-instance.score
+    )
+
+
+@receiver(post_save, sender=Thread)
+def count_thread(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        Room.objects.filter(posts=instance.post_id).add_engagement(
+            thread_count=1
+        )
+
+
+@receiver(post_delete, sender=Thread)
+def remove_thread_counters(sender, instance, **kwargs):
+    Room.objects.filter(posts=instance.post_id).add_engagement(
+        thread_count=-1
+    )
+    if instance.score:
+        instance.score_changed(-instance.score)
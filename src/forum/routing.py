@@ -3,5 +3,5 @@ from django.urls import path
 from . import consumers
 
 websocket_urlpatterns = [
-    path('ws/room/<room_id>/post/', consumers.ThreadConsumer),
+    path('ws/room/<int:room_id>/post/', consumers.ThreadConsumer),
 ]
@@ -0,0 +1,152 @@
+"""
+Search index of the forum. Every post has a denormalized document
+(search_document) with the gift of the room, the author and the text
+of all threads of the post, so search does not join threads.
+Text of a new thread is appended to the document, a post with changed
+or deleted threads is rebuilt once after the transaction commits.
+Backend is chosen like in src/rooms/search.py (FORUM_SEARCH_BACKEND).
+"""
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, IntegerField, Q, TextField, Value
+from django.db.models.functions import Concat
+
+from src import pagination, search
+
+SEARCH_FIELDS = ['subject', 'content', 'search_document']
+
+BACKENDS = {
+    'postgresql': 'src.forum.search.PostgresSearchBackend',
+    'sqlite': 'src.forum.search.TrigramSearchBackend',
+}
+DEFAULT_BACKEND = 'src.forum.search.IcontainsSearchBackend'
+
+
+def get_backend():
+    return search.get_backend(
+        settings.FORUM_SEARCH_BACKEND, BACKENDS, DEFAULT_BACKEND
+    )
+
+
+class JoinSearchBackend(search.IcontainsSearchBackend):
+    """
+    Search used before the index. It joins threads and needs DISTINCT.
+    Kept for comparison in benchmark_forum_search.
+    """
+    def search(self, queryset, phrase):
+        return queryset.filter(
+            Q(room__gift__icontains=phrase) |
+            Q(author__username__icontains=phrase) |
+            Q(subject__icontains=phrase) |
+            Q(content__icontains=phrase) |
+            Q(threads__subject__icontains=phrase) |
+            Q(threads__content__icontains=phrase)
+        ).distinct().annotate(
+            search_rank=Value(0, output_field=IntegerField())
+        )
+
+
+class IcontainsSearchBackend(search.IcontainsSearchBackend):
+    fields = SEARCH_FIELDS
+
+
+class PostgresSearchBackend(search.PostgresSearchBackend):
+    fields = SEARCH_FIELDS
+    weights = {'subject': 'A', 'content': 'B', 'search_document': 'C'}
+
+
+class TrigramSearchBackend(search.TrigramSearchBackend):
+    fields = SEARCH_FIELDS
+    table = 'forum_post_search'
+    weights = {'subject': 10.0, 'content': 4.0, 'search_document': 1.0}
+
+
+def build_document(post):
+    """post has to be fetched with room, author and threads"""
+    parts = [post.room.gift, post.author.username]
+    for thread in post.threads.all():
+        parts.extend([thread.subject, thread.content])
+    return '\n'.join(parts)
+
+
+def update_index(posts):
+    """rebuild documents of the posts (queryset) and the search index"""
+    posts = posts.select_related('room', 'author').prefetch_related('threads')
+    changed = []
+    for post in posts:
+        post.search_document = build_document(post)
+        changed.append(post)
+    posts.model.objects.bulk_update(changed, ['search_document'])
+    get_backend().update_index(posts)
+
+
+def add_thread(posts, thread):
+    """
+    append text of a new thread to the document of its post (queryset),
+    other threads are not read
+    """
+    posts.update(search_document=Concat(
+        F('search_document'), Value(f'\n{thread.subject}\n{thread.content}'),
+        output_field=TextField()
+    ))
+    get_backend().update_index(posts)
+
+
+# ids of posts rebuilt after the transaction of the thread commits
+pending = threading.local()
+
+
+def pending_ids():
+    if not hasattr(pending, 'ids'):
+        pending.ids = set()
+    return pending.ids
+
+
+def update_pending(model):
+    """
+    rebuild pending posts. Every change registers it, the first one
+    after commit rebuilds all posts and the others find nothing to do.
+    Posts of a rolled back transaction are rebuilt with the next one.
+    """
+    ids = pending_ids()
+    if ids:
+        pending.ids = set()
+        update_index(model.objects.filter(pk__in=ids))
+
+
+def update_index_on_commit(model, post_id):
+    """
+    rebuild the post when the transaction is committed, once however
+    many of its threads have changed. Without a transaction it is
+    rebuilt at once.
+    """
+    if not transaction.get_connection().in_atomic_block:
+        return update_index(model.objects.filter(pk=post_id))
+    pending_ids().add(post_id)
+    transaction.on_commit(lambda: update_pending(model))
+
+
+def cancel_update(post_id):
+    """deleted post (with its threads) is not rebuilt"""
+    pending_ids().discard(post_id)
+
+
+ORDERING = ['-search_rank', '-id']
+
+
+def encode_cursor(post):
+    """opaque cursor of the post in results ordered by rank"""
+    return pagination.encode_cursor([post.search_rank, post.id])
+
+
+def after_cursor(queryset, cursor):
+    """
+    results after the post from :encode_cursor: (keyset pagination).
+    Invalid cursor is ignored.
+    """
+    decoded = pagination.decode_cursor(cursor)
+    if decoded is None or len(decoded[1]) != len(ORDERING):
+        return queryset
+    return pagination.keyset_filter(queryset, ORDERING, decoded[1])
@@ -0,0 +1,10 @@
+"""Celery tasks of the forum, run periodically by celery beat."""
+from celery import shared_task
+
+from .models import Post
+
+
+@shared_task
+def update_hot_scores():
+    """:return: number of updated posts, see Post.update_hot_scores"""
+    return Post.objects.update_hot_scores()
@@ -0,0 +1,142 @@
+from datetime import date
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TransactionTestCase, override_settings
+
+from src.rooms.models import Room
+
+from ..consumers import ThreadConsumer, new_threads
+from ..models import Post, Thread
+from ..routing import websocket_urlpatterns
+
+User = get_user_model()
+
+IN_MEMORY_LAYER = {
+    'default': {'BACKEND': 'src.layers.LocalChannelLayer'}
+}
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYER)
+class ThreadConsumerTest(TransactionTestCase):
+    """threads are saved in other threads, so data has to be committed"""
+
+    def setUp(self):
+        cache.clear()   # token buckets
+        self.user = User.objects.create_user(
+            username='testuser', password='12345'
+        )
+        self.room = Room.objects.create(
+            receiver='receiver1', gift='gift1', price=1000,
+            to_collect=1000, visible=True, date_expires=date(2030, 1, 1)
+        )
+        self.post = Post.objects.create(
+            room=self.room, author=self.user, subject='s', content='c'
+        )
+
+    async def connect(self):
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns),
+            f'/ws/room/{self.room.id}/post/'
+        )
+        communicator.scope['user'] = self.user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    def send(self, *messages):
+        """
+        send messages from one socket
+        :return: frames received by another socket of the room
+        """
+        async def send():
+            author = await self.connect()
+            watcher = await self.connect()
+            for message in messages:
+                await author.send_json_to(message)
+            received = [await watcher.receive_json_from()]
+            while not await watcher.receive_nothing(0.2):
+                received.append(await watcher.receive_json_from())
+            await author.disconnect()
+            await watcher.disconnect()
+            return received
+
+        return async_to_sync(send)()
+
+    def test_new_thread_is_sent_to_room(self):
+        with self.assertLogs('src.forum.consumers', 'INFO') as logs:
+            received = self.send({
+                'post_id': self.post.id, 'subject': 'Temat',
+                'content': 'Treść'
+            })
+        thread = Thread.objects.get()
+        self.assertEqual(len(received), 1)
+        self.assertEqual(received[0][0]['id'], thread.id)
+        self.assertEqual(received[0][0]['author'], 'testuser')
+        self.assertEqual(received[0][0]['subject'], 'Temat')
+        self.assertIn(f'thread={thread.id}', logs.output[0])
+
+    def test_reply_post_is_cached(self):
+        parent = Thread.objects.create(
+            author=self.user, post=self.post, subject='s', content='c'
+        )
+        reply = {'parent': parent.id, 'subject': 's', 'content': 'c'}
+        with mock.patch.object(
+            ThreadConsumer, 'get_parent_post_id', return_value=self.post.id
+        ) as get_parent_post_id:
+            self.send(reply, reply)
+        get_parent_post_id.assert_called_once_with(parent.id)
+        self.assertEqual(parent.children.count(), 2)
+
+    def test_burst_of_threads_is_one_message(self):
+        thread = {'post_id': self.post.id, 'subject': 's', 'content': 'c'}
+        with mock.patch.object(new_threads, 'window', 0.5):
+            received = self.send(thread, thread, thread)
+        self.assertEqual(len(received), 1)
+        self.assertEqual(len(received[0]), 3)
+
+    def test_unknown_parent(self):
+        async def send():
+            author = await self.connect()
+            await author.send_json_to(
+                {'parent': 999, 'subject': 's', 'content': 'c'}
+            )
+            response = await author.receive_json_from()
+            await author.disconnect()
+            return response
+
+        response = async_to_sync(send)()
+        self.assertIn('parent', response)
+        self.assertFalse(Thread.objects.exists())
+
+    @override_settings(THREAD_RATE_LIMITS={'room': (0.01, 1)})
+    def test_too_fast_threads_are_rejected(self):
+        async def send():
+            author = await self.connect()
+            thread = {'post_id': self.post.id, 'subject': 's', 'content': 'c'}
+            await author.send_json_to(thread)
+            await author.send_json_to(thread)
+            response = await author.receive_json_from()
+            await author.disconnect()
+            return response
+
+        response = async_to_sync(send)()
+        self.assertEqual(
+            response['__all__'], [ThreadConsumer.rate_limited_message]
+        )
+        self.assertGreater(response['retry_after'], 0)
+        self.assertEqual(Thread.objects.count(), 1)
+
+    def test_disconnect_leaves_group(self):
+        async def connect_and_leave():
+            communicator = await self.connect()
+            await communicator.disconnect()
+
+        async_to_sync(connect_and_leave)()
+        groups = get_channel_layer().groups
+        self.assertFalse(groups.get(f'forum_{self.room.id}'))
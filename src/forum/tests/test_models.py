@@ -1,12 +1,14 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from unittest import skip
 
 from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.utils import timezone
 
 from src.rooms.models import Room
 
-from ..models import Opinion, Post
+from ..models import Opinion, Post, Thread
+from ..tasks import update_hot_scores
 
 User = get_user_model()
 
@@ -52,7 +54,21 @@ class PostModelTest(TestCase):
         self.assertEqual(found.count(), 1)
 
     def test_summarise(self):
-        pass
+        thread = Thread.objects.create(
+            author=self.user, post=self.post, subject='s', content='c'
+        )
+        Thread.objects.create(
+            author=self.user, post=self.post, subject='s', content='c',
+            parent=thread
+        )
+        self.post.add_like(self.user)
+        with self.assertNumQueries(1):
+            rows = list(Post.objects.order_by('id').summarise())
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['author_name'], 'testuser')
+        self.assertEqual(rows[0]['thread_count'], 1)
+        self.assertEqual(rows[0]['likes'], 1)
+        self.assertEqual(rows[1]['thread_count'], 0)
 
     def test_add_like(self):
         self.post.add_like(self.user)
@@ -84,3 +100,169 @@ class LikeModelTest(TestCase):
     def test_create(self):
         self.post.add_like(self.user)
         self.assertEqual(Opinion.objects.count(), 1)
+
+    def test_counters(self):
+        other = User.objects.create_user(username='other', password='12345')
+        self.assertEqual(self.post.add_like(self.user), 1)
+        self.assertEqual(self.post.add_dislike(other), 0)
+        self.assertEqual(self.post.like_count, 1)
+        self.assertEqual(self.post.dislike_count, 1)
+
+    def test_toggle(self):
+        self.post.add_like(self.user)
+        self.assertEqual(self.post.add_like(self.user), 0)
+        self.assertFalse(Opinion.objects.exists())
+        self.post.add_like(self.user)
+        self.assertEqual(self.post.add_dislike(self.user), -1)
+        self.assertEqual(Opinion.objects.get().likes, Opinion.DISLIKE)
+        self.assertEqual(self.post.like_count, 0)
+        self.assertEqual(self.post.dislike_count, 1)
+
+    def test_rebuild_opinion_counters(self):
+        thread = Thread.objects.create(
+            author=self.user, post=self.post, subject='s', content='c'
+        )
+        thread.add_dislike(self.user)
+        self.post.add_like(self.user)
+        Post.objects.update(like_count=5, score=5)
+        Thread.objects.update(dislike_count=0, score=3)
+        self.assertEqual(Post.objects.rebuild_opinion_counters(), 1)
+        Thread.objects.rebuild_opinion_counters()
+        self.assertEqual(self.post.get_likes(), 1)
+        self.assertEqual(self.post.like_count, 1)
+        self.assertEqual(thread.get_likes(), -1)
+        self.assertEqual(thread.dislike_count, 1)
+
+
+class ThreadModelTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser', password='12345'
+        )
+        room = Room.objects.create(
+            receiver='receiver1', gift='gift1', price=1000, description='test',
+            to_collect=1000, visible=True, date_expires=datetime(2019, 6, 6)
+        )
+        self.post = Post.objects.create(
+            room=room, author=self.user, subject='Test', content='Test content'
+        )
+        self.root = self.create_thread('root')
+        self.child = self.create_thread('child', self.root)
+        self.grandchild = self.create_thread('grandchild', self.child)
+        self.child2 = self.create_thread('child2', self.root)
+
+    def create_thread(self, subject, parent=None):
+        return Thread.objects.create(
+            author=self.user, post=self.post, subject=subject,
+            content=subject, parent=parent
+        )
+
+    def test_path_on_insert(self):
+        self.grandchild.refresh_from_db()
+        self.assertEqual(self.grandchild.depth, 2)
+        self.assertEqual(
+            self.grandchild.path,
+            self.root.path + self.child.path[-Thread.PATH_STEP:]
+            + str(self.grandchild.pk).zfill(Thread.PATH_STEP)
+        )
+        self.assertEqual(self.root.depth, 0)
+
+    def test_subtree(self):
+        subtree = Thread.objects.subtree(self.child)
+        self.assertEqual(list(subtree), [self.child, self.grandchild])
+
+    def test_show_children(self):
+        with self.assertNumQueries(1):
+            children = self.root.show_children()
+        self.assertEqual(children, [
+            {self.child: [{self.grandchild: []}]},
+            {self.child2: []},
+        ])
+        self.assertEqual(list(children[0])[0].descendant_count, 1)
+        self.assertEqual(self.grandchild.show_children(), [])
+
+    def test_get_all_children(self):
+        other_root = self.create_thread('other')
+        with self.assertNumQueries(1):
+            trees = Thread.objects.filter(post=self.post).get_all_children()
+        self.assertEqual(trees, [
+            [{self.child: [{self.grandchild: []}]}, {self.child2: []}],
+            [],
+        ])
+        self.assertEqual(other_root.depth, 0)
+
+
+class PostRankingTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser', password='12345'
+        )
+        self.other = User.objects.create_user(
+            username='other', password='12345'
+        )
+        room = Room.objects.create(
+            receiver='receiver1', gift='gift1', price=1000, description='test',
+            to_collect=1000, visible=True, date_expires=datetime(2019, 6, 6)
+        )
+        self.post = Post.objects.create(
+            room=room, author=self.user, subject='Test', content='Test'
+        )
+        self.post2 = Post.objects.create(
+            room=room, author=self.user, subject='Test2', content='Test2'
+        )
+        self.thread = Thread.objects.create(
+            author=self.user, post=self.post2, subject='s', content='c'
+        )
+
+    def test_all_likes(self):
+        self.post.add_like(self.user)
+        self.thread.add_like(self.user)
+        self.thread.add_like(self.other)
+        self.post2.add_dislike(self.user)
+        self.post.refresh_from_db()
+        self.post2.refresh_from_db()
+        self.assertEqual(self.post.all_likes, 1)
+        self.assertEqual(self.post2.all_likes, 1)
+        self.thread.delete()
+        self.post2.refresh_from_db()
+        self.assertEqual(self.post2.all_likes, -1)
+
+    def test_data_with_likes(self):
+        # opinions of threads do not multiply opinions of the post
+        self.post2.add_like(self.user)
+        self.post2.add_like(self.other)
+        self.thread.add_like(self.user)
+        self.post.add_like(self.user)
+        posts = list(Post.objects.data_with_likes())
+        self.assertEqual(posts, [self.post2, self.post])
+        self.assertEqual(posts[0].all_likes, 3)
+
+    def test_rebuild_all_likes(self):
+        self.thread.add_like(self.user)
+        Post.objects.update(all_likes=10)
+        Post.objects.rebuild_all_likes()
+        self.post.refresh_from_db()
+        self.post2.refresh_from_db()
+        self.assertEqual(self.post.all_likes, 0)
+        self.assertEqual(self.post2.all_likes, 1)
+
+    def test_update_hot_scores(self):
+        self.post.add_like(self.user)
+        Post.objects.filter(pk=self.post2.pk).update(
+            date=self.post2.date - timedelta(days=2)
+        )
+        now = timezone.now()
+        self.assertEqual(Post.objects.update_hot_scores(now), 2)
+        self.assertEqual(list(Post.objects.hot()), [self.post, self.post2])
+        Post.objects.filter(pk=self.post.pk).update(
+            date=now - Post.HOT_AGE - timedelta(hours=1)
+        )
+        Post.objects.update_hot_scores(now)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.hot_score, 0)
+
+    def test_update_hot_scores_task(self):
+        self.post.add_like(self.user)
+        self.assertEqual(update_hot_scores.apply().get(), 2)
+        self.post.refresh_from_db()
+        self.assertGreater(self.post.hot_score, 0)
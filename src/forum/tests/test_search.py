@@ -0,0 +1,178 @@
+from datetime import datetime
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from src.rooms.models import Room
+
+from .. import search
+from ..models import Post, Thread
+from ..search import JoinSearchBackend, after_cursor, encode_cursor
+from ..views import AllPostListView
+
+User = get_user_model()
+
+
+def run_on_commit():
+    """run callbacks of the test transaction, it is never committed"""
+    callbacks, connection.run_on_commit = connection.run_on_commit, []
+    for _, callback in callbacks:
+        callback()
+
+
+class ForumSearchTransactionTest(TransactionTestCase):
+    def test_update_after_rollback(self):
+        user = User.objects.create_user(username='autor', password='12345')
+        room = Room.objects.create(
+            receiver='receiver1', gift='Rower', price=1000, description='test',
+            to_collect=1000, visible=True, date_expires=datetime(2019, 6, 6)
+        )
+        post = Post.objects.create(
+            room=room, author=user, subject='Kolor', content='Jaki?'
+        )
+        thread = Thread.objects.create(
+            author=user, post=post, subject='Odpowiedź', content='Czerwony'
+        )
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                thread.content = 'Niebieski'
+                thread.save()
+                raise ValueError
+        with transaction.atomic():
+            thread.content = 'Zielony'
+            thread.save()
+        post.refresh_from_db()
+        self.assertIn('Zielony', post.search_document)
+        self.assertNotIn('Czerwony', post.search_document)
+
+
+class ForumSearchTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='autor', password='12345'
+        )
+        self.room = Room.objects.create(
+            receiver='receiver1', gift='Rower', price=1000, description='test',
+            to_collect=1000, visible=True, date_expires=datetime(2019, 6, 6)
+        )
+        self.post1 = Post.objects.create(
+            room=self.room, author=self.user,
+            subject='Kolor ramy', content='Jaki kolor wybrać?'
+        )
+        self.post2 = Post.objects.create(
+            room=self.room, author=self.user,
+            subject='Dzwonek', content='Czy kupujemy dzwonek?'
+        )
+
+    def ids(self, phrase):
+        posts = Post.visible.search(phrase).order_by('-search_rank', '-id')
+        return [post.id for post in posts]
+
+    def test_document(self):
+        Thread.objects.create(
+            author=self.user, post=self.post2,
+            subject='Odpowiedź', content='Czerwony kolor'
+        )
+        self.post2.refresh_from_db()
+        self.assertIn('Rower', self.post2.search_document)
+        self.assertIn('Czerwony kolor', self.post2.search_document)
+
+    def test_thread_text_found(self):
+        self.assertEqual(self.ids('czerwony'), [])
+        thread = Thread.objects.create(
+            author=self.user, post=self.post2,
+            subject='Odpowiedź', content='Czerwony kolor'
+        )
+        self.assertEqual(self.ids('czerwony'), [self.post2.id])
+        thread.delete()
+        run_on_commit()
+        self.assertEqual(self.ids('czerwony'), [])
+
+    def test_changed_threads_rebuild_post_once(self):
+        threads = [
+            Thread.objects.create(
+                author=self.user, post=self.post2,
+                subject='Odpowiedź', content=f'Kolor {num}'
+            ) for num in range(3)
+        ]
+        with mock.patch.object(
+            search, 'update_index', wraps=search.update_index
+        ) as update_index:
+            for thread in threads:
+                thread.content = 'Zielony'
+                thread.save()
+            threads[0].delete()
+            self.assertFalse(update_index.called)
+            run_on_commit()
+        update_index.assert_called_once()
+        self.assertEqual(self.ids('zielony'), [self.post2.id])
+
+    def test_deleted_post_is_not_rebuilt(self):
+        for num in range(3):
+            Thread.objects.create(
+                author=self.user, post=self.post2,
+                subject='Odpowiedź', content=f'Kolor {num}'
+            )
+        with mock.patch.object(search, 'update_index') as update_index:
+            self.post2.delete()
+            run_on_commit()
+        self.assertFalse(update_index.called)
+
+    def test_post_edited(self):
+        self.post1.subject = 'Siodełko'
+        self.post1.content = 'Jakie siodełko?'
+        self.post1.save()
+        self.assertEqual(self.ids('kolor'), [])
+        self.assertEqual(self.ids('siodełko'), [self.post1.id])
+
+    def test_rank(self):
+        Thread.objects.create(
+            author=self.user, post=self.post2,
+            subject='Odpowiedź', content='Kolor czerwony'
+        )
+        self.assertEqual(self.ids('kolor'), [self.post1.id, self.post2.id])
+
+    def test_room_and_author_found(self):
+        self.assertEqual(len(self.ids('rower')), 2)
+        self.assertEqual(len(self.ids('autor')), 2)
+
+    def test_join_backend(self):
+        Thread.objects.create(
+            author=self.user, post=self.post2,
+            subject='Odpowiedź', content='Kolor czerwony'
+        )
+        found = Post.visible.search('kolor', backend=JoinSearchBackend())
+        self.assertEqual(
+            sorted(post.id for post in found), [self.post1.id, self.post2.id]
+        )
+
+    def test_cursor(self):
+        posts = list(
+            Post.visible.search('autor').order_by('-search_rank', '-id')
+        )
+        rest = after_cursor(
+            Post.visible.search('autor').order_by('-search_rank', '-id'),
+            encode_cursor(posts[0])
+        )
+        self.assertEqual(list(rest), posts[1:])
+
+    def test_invalid_cursor(self):
+        posts = Post.visible.search('autor')
+        self.assertEqual(after_cursor(posts, 'xyz').count(), 2)
+
+    def test_view_keyset_pagination(self):
+        url = reverse('forum:all')
+        with mock.patch.object(AllPostListView, 'paginate_by', 1):
+            response = self.client.get(url, {'search': 'autor'})
+            first = list(response.context['posts'])
+            cursor = response.context['next_cursor']
+            response = self.client.get(
+                url, {'search': 'autor', 'after': cursor}
+            )
+            second = list(response.context['posts'])
+        self.assertEqual(len(first), 1)
+        self.assertEqual(len(second), 1)
+        self.assertNotEqual(first, second)
@@ -1,14 +1,19 @@
 import json
+import re
 from datetime import datetime
+from unittest import mock
 
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.db.models import F, Q, Sum
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from src.rooms.models import Room
 
 from ..models import Post, Thread
+from ..views import PostListView
 
 User = get_user_model()
 
@@ -72,9 +77,32 @@ class AllPostListView(TestCase):
         self.assertEqual(response.status_code, 200)
         queryset = response.context['posts']
         self.assertEqual(queryset.count(), 2)
-        self.assertTrue(queryset.first().score)
+        self.assertTrue(queryset.first().rating)
         self.assertEqual(response.context['num_posts'], Post.objects.count())
 
+    def test_rating_does_not_query_threads(self):
+        response = self.client.get(reverse('forum:all'))
+        posts = list(response.context['posts'])
+        with self.assertNumQueries(0):
+            ratings = {post: post.rating for post in posts}
+        self.assertEqual(ratings, {self.post1: 1, self.post2: 0})
+
+    def test_shown_rating_is_ordered(self):
+        self.post2.add_like(self.user1)
+        response = self.client.get(reverse('forum:all'))
+        self.assertEqual(list(response.context['posts']), [
+            self.post2, self.post1
+        ])
+        shown = re.findall(r'Ocena: (-?\d+)', response.content.decode())
+        self.assertEqual(shown, ['1', '0'])
+
+    def test_hot_view(self):
+        self.post2.add_like(self.user1)
+        Post.objects.update_hot_scores()
+        response = self.client.get(reverse('forum:all'), {'order': 'hot'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['posts'][0], self.post2)
+
     def test_search_view(self):
         url = reverse('forum:all')
         response = self.client.get(url, {'search': self.thread1.subject})
@@ -83,6 +111,56 @@ class AllPostListView(TestCase):
         self.assertEqual(queryset.count(), 1)
 
 
+class PostListViewTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser', password='12345'
+        )
+        self.room = Room.objects.create(
+            receiver='receiver1', gift='gift1', price=1000, description='test',
+            to_collect=1000, visible=True, date_expires=datetime(2019, 6, 6)
+        )
+        self.posts = [
+            Post.objects.create(
+                room=self.room, author=self.user,
+                subject=f'Post{num}', content='Test'
+            )
+            for num in range(5)
+        ]
+        Thread.objects.create(
+            author=self.user, post=self.posts[0], subject='T', content='T'
+        )
+        self.url = reverse('forum:list', kwargs={'pk': self.room.id})
+
+    def test_pages(self):
+        with mock.patch.object(PostListView, 'paginate_by', 3):
+            response = self.client.get(self.url)
+            posts = response.context['posts']
+            self.assertEqual(
+                [post['id'] for post in posts],
+                [post.id for post in self.posts[:3]]
+            )
+            self.assertEqual(posts[0]['thread_count'], 1)
+            self.assertContains(response, 'testuser')
+            cursor = response.context['page_obj'].next_cursor
+            response = self.client.get(self.url, {'cursor': cursor})
+        self.assertEqual(
+            [post['id'] for post in response.context['posts']],
+            [post.id for post in self.posts[3:]]
+        )
+
+    def test_queries_do_not_depend_on_posts(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        for num in range(20):
+            Post.objects.create(
+                room=self.room, author=self.user, subject='P', content='T'
+            )
+        with self.assertNumQueries(len(queries)):
+            self.client.get(self.url)
+
+
 def make_ajax(client, url, data=None):
     response = client.post(
         url,
@@ -147,6 +225,17 @@ class AjaxViewsTest(TestCase):
         expected_response = {'success': 'true', 'num_likes': actual}
         self.assertEqual(json.loads(response.content), expected_response)
 
+    def test_add_like_without_aggregate(self):
+        url = reverse('forum:add_like')
+        data = {'id': self.post1.id}
+        with CaptureQueriesContext(connection) as queries:
+            response = make_ajax(self.client, url, data)
+        for query in queries:
+            self.assertNotIn('SUM(', query['sql'])
+        self.assertEqual(json.loads(response.content)['num_likes'], 1)
+        response = make_ajax(self.client, url, data)
+        self.assertEqual(json.loads(response.content)['num_likes'], 0)
+
     def test_add_dislike_post_view(self):
         initial_likes = self.post1.opinions.aggregate(Sum('likes')).get('likes_sum', 0)
         url = reverse('forum:add_dislike')
@@ -187,6 +276,36 @@ class AjaxViewsTest(TestCase):
         self.assertEqual(actual['is_valid'], 'true')
         # self.assertEqual(actual, expected)
 
+    def test_get_threads_constant_queries(self):
+        url = reverse('forum:thread_list', kwargs={'pk': self.room1.id})
+        data = {'post_id': self.post1.id}
+        with self.assertNumQueries(1):
+            make_ajax(self.client, url, data)
+        for num in range(5):
+            thread = Thread.objects.create(
+                author=self.user2, post=self.post1,
+                subject=f'Thread{num}', content='Test'
+            )
+            thread.add_like(self.user1)
+        with self.assertNumQueries(1):
+            response = make_ajax(self.client, url, data)
+        threads = json.loads(response.content)['threads']
+        self.assertEqual(len(threads), 6)
+        self.assertEqual(threads['0'], {
+            'id': self.thread1.id,
+            'author': 'testuser',
+            'post': self.post1.id,
+            'subject': 'Thread1',
+            'content': 'Test1',
+            'parent': None,
+            'date': self.thread1.date.strftime('%d.%m.%y %H:%M'),
+            'likes': 0,
+            'children_count': 1,
+            'thread_parent': None,
+        })
+        self.assertEqual(threads['1']['author'], 'testuser2')
+        self.assertEqual(threads['1']['likes'], 1)
+
     def test_post_delete_view(self):
         post = self.post1
         room_id = post.room.id
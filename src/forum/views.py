@@ -8,20 +8,36 @@ from django.urls import reverse
 from django.views import View
 from django.views.generic import CreateView, DetailView, ListView, UpdateView
 
+from src.pagination import KeysetPaginationMixin
 from src.rooms.models import Room
 
+from . import search
 from .forms import PostCreateForm, PostUpdateForm, ThreadCreateForm
 from .models import Post, Thread
 
 
 class AllPostListView(ListView):
+    """
+    All visible posts ordered by likes ('order=hot' orders by
+    time-decayed hot_score). Searched posts are ordered by rank of
+    the search and paginated by cursor ('after' param) instead of page
+    number, see search.after_cursor.
+    """
     model = Post
     template_name = 'forum/all_posts.html'
     context_object_name = 'posts'
     paginate_by = 20
 
+    def get_search(self):
+        return self.request.GET.get('search', None)
+
+    def get_paginate_by(self, queryset):
+        if self.get_search():
+            return None
+        return self.paginate_by
+
     def get_queryset(self):
-        field = self.request.GET.get('search', None)
+        field = self.get_search()
         if field:
             queryset = (
                 Post.visible
@@ -29,21 +45,29 @@ class AllPostListView(ListView):
                     .data_with_likes()
                     .select_related('author')
                     .select_related('room')
-                    .prefetch_related('threads')
+                    .with_thread_count()
+                    .order_by(*search.ORDERING)
             )
-            return queryset
+            cursor = self.request.GET.get('after', None)
+            if cursor:
+                queryset = search.after_cursor(queryset, cursor)
+            return queryset[:self.paginate_by]
         queryset = (
             Post.visible
-                .data_with_likes()
                 .select_related('author')
                 .select_related('room')
-                .prefetch_related('threads')
+                .with_thread_count()
         )
-        return queryset
+        if self.request.GET.get('order', None) == 'hot':
+            return queryset.hot()
+        return queryset.data_with_likes()
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['num_posts'] = Post.objects.count()
+        posts = context['posts']
+        if self.get_search() and len(posts) == self.paginate_by:
+            context['next_cursor'] = search.encode_cursor(list(posts)[-1])
         return context
 
 
@@ -71,14 +95,16 @@ class PostCreateView(CreateView):
         return context
 
 
-class PostListView(ListView):
+class PostListView(KeysetPaginationMixin, ListView):
+    """posts of the room in order of writing, pages are addressed by cursor"""
     model = Post
     template_name = 'forum/post_list.html'
     context_object_name = 'posts'
+    paginate_by = 20
 
     def get_queryset(self):
         room_id = self.kwargs.get('pk')
-        queryset = Post.visible.filter(room__id=room_id)
+        queryset = Post.visible.filter(room_id=room_id).order_by('id')
         return queryset.summarise()
 
     def get_context_data(self, **kwargs):
@@ -86,8 +112,8 @@ class PostListView(ListView):
         room_id = self.kwargs.get('pk')
         room = get_object_or_404(Room, pk=room_id)
         context['room'] = room
-        context['all_likes'] = room.all_likes()
-        context['all_comments'] = room.all_comments()
+        context['all_likes'] = room.all_likes
+        context['all_comments'] = room.all_comments
         return context
 
 
@@ -99,16 +125,14 @@ class AddLikeView(LoginRequiredMixin, View):
         msg = {'success': 'true'}
         if is_thread is not None:
             thread = get_object_or_404(Thread, pk=pk)
-            thread.add_like(user=request.user)
             num_likes = {
-                'num_likes': thread.get_likes(),
+                'num_likes': thread.add_like(user=request.user),
             }
             msg.update(num_likes)
             return JsonResponse(msg)
         post = get_object_or_404(Post, pk=pk)
-        post.add_like(user=request.user)
         num_likes = {
-            'num_likes': post.get_likes(),
+            'num_likes': post.add_like(user=request.user),
         }
         msg.update(num_likes)
         return JsonResponse(msg)
@@ -122,16 +146,14 @@ class AddDisLikeView(LoginRequiredMixin, View):
         msg = {'success': 'true'}
         if is_thread is not None:
             thread = get_object_or_404(Thread, pk=pk)
-            thread.add_dislike(user=request.user)
             num_likes = {
-                'num_likes': thread.get_likes()
+                'num_likes': thread.add_dislike(user=request.user)
             }
             msg.update(num_likes)
             return JsonResponse(msg)
         post = get_object_or_404(Post, pk=pk)
-        post.add_dislike(request.user)
         num_likes = {
-            'num_likes': post.get_likes()
+            'num_likes': post.add_dislike(request.user)
         }
         msg.update(num_likes)
         return JsonResponse(msg)
@@ -1,11 +1,13 @@
 from django import forms
-from django.core.mail import EmailMessage
+
+from src.notifications.models import OutgoingEmail
 
 
-# it will be shared task
 def send_email(data):
-    message = EmailMessage(data['subject'], data['message'], to=[data['to']])
-    message.send()
+    """message is saved in the outbox and sent by send_outbox task"""
+    return OutgoingEmail.objects.enqueue(
+        data['subject'], data['message'], data['to']
+    )
 
 
 class ContactForm(forms.Form):
@@ -13,3 +15,9 @@ class ContactForm(forms.Form):
     message = forms.CharField(label='Treść', max_length=250,
                               widget=forms.Textarea({'rows': 5}))
     email = forms.EmailField(label='Email')
+
+    def clean_subject(self):
+        subject = self.cleaned_data['subject']
+        if '\n' in subject or '\r' in subject:
+            raise forms.ValidationError('Tytuł musi być w jednej linii')
+        return subject
@@ -6,6 +6,9 @@ from django.core import mail
 from django.test import TestCase
 from django.urls import reverse
 
+from src.notifications.models import OutgoingEmail
+from src.notifications.tasks import send_outbox
+
 from .forms import ContactForm
 
 User = get_user_model()
@@ -37,8 +40,14 @@ class HomeViewsTests(TestCase):
         data = {'subject': 'Tytuł', 'message': 'Treść', 'email': 'bartosz@wp.com'}
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, 302)
-        self.assertEqual(len(mail.outbox), 1)
-        self.assertEqual(*mail.outbox[0].to, data['email'])
+        # message is sent by the worker, not during the request
+        self.assertEqual(len(mail.outbox), 0)
+        email = OutgoingEmail.objects.get(to=data['email'])
+        self.assertEqual(email.status, OutgoingEmail.PENDING)
+        send_outbox()
+        self.assertIn(
+            [data['email']], [message.to for message in mail.outbox]
+        )
 
     def test_get_email_view(self):
         url = reverse('home:get_email', kwargs={'pk': self.user1.id})
@@ -84,3 +93,12 @@ class ContactFormTest(TestCase):
         data = {'subject': 'Tytuł', 'message': 'Treść'}
         form = ContactForm(data)
         self.assertFalse(form.is_valid())
+
+    def test_subject_with_new_line(self):
+        data = {
+            'subject': 'Tytuł\nBcc: x@wp.com', 'message': 'Treść',
+            'email': 'bartosz@wp.com'
+        }
+        form = ContactForm(data)
+        self.assertFalse(form.is_valid())
+        self.assertIn('subject', form.errors)
@@ -1,5 +1,6 @@
 from django.contrib import messages
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, render
 from django.urls import reverse_lazy
@@ -29,8 +30,8 @@ class ContactView(FormView):
             })
         return initial
 
+    @transaction.atomic
     def form_valid(self, form):
-        # form.send_email()
         email = form.cleaned_data['email']
         subject = form.cleaned_data['subject']
         message = form.cleaned_data['message']
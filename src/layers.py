@@ -0,0 +1,46 @@
+"""
+Channel layers. CHANNEL_LAYER setting chooses the layer of
+CHANNEL_LAYERS from CHANNEL_LAYER_BACKENDS:
+    redis - channels_redis, consumers in many processes or nodes,
+    memory - :LocalChannelLayer:, all consumers in one process (tests,
+        development, single-node deployments).
+"""
+import asyncio
+import time
+from copy import deepcopy
+
+from channels.layers import InMemoryChannelLayer
+
+
+class LocalChannelLayer(InMemoryChannelLayer):
+    """
+    InMemoryChannelLayer with cheaper group_send. The stock layer copies
+    a message for every channel of the group and looks through all
+    channels and groups for expired messages on every group_send and
+    receive, so fan-out to a group of n sockets costs O(n^2). Here
+    a message is copied once and shared by all receivers (consumers must
+    not change received messages) and expired messages are removed at
+    most once per :clean_interval: seconds.
+    """
+    def __init__(self, clean_interval=1, **kwargs):
+        super().__init__(**kwargs)
+        self.clean_interval = clean_interval
+        self.cleaned = 0
+
+    def _clean_expired(self):
+        now = time.monotonic()
+        if now - self.cleaned < self.clean_interval:
+            return
+        self.cleaned = now
+        super()._clean_expired()
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), 'Message is not a dict'
+        assert self.valid_group_name(group), 'Invalid group name'
+        self._clean_expired()
+        item = (time.time() + self.expiry, deepcopy(message))
+        for channel in self.groups.get(group, {}):
+            queue = self.channels.setdefault(channel, asyncio.Queue())
+            if queue.qsize() >= self.capacity:
+                continue    # full channel misses it, like in the stock layer
+            queue.put_nowait(item)
@@ -0,0 +1,125 @@
+import socketserver
+import threading
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.mail import EmailMessage
+
+from src.benchmark import BenchmarkCommand
+from src.notifications.models import MassEmailProgress
+from src.notifications.tasks import INTERESTED_EMAIL, notify_interested
+from src.rooms.models import Room
+
+User = get_user_model()
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """SMTP server which accepts every message and forgets it"""
+    disable_nagle_algorithm = True
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 benchmark')
+        data = False
+        for line in self.rfile:
+            if data:
+                if line == b'.\r\n':
+                    data = False
+                    self.server.messages += 1
+                    self.reply('250 OK')
+                continue
+            command = line[:4].upper()
+            if command == b'DATA':
+                data = True
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+            elif command == b'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+class SMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    connections = messages = 0
+
+
+def old_notify_interested(room, connection):
+    """notify_interested before messages were sent in chunks"""
+    with open(INTERESTED_EMAIL, encoding='utf-8') as template:
+        body = template.read().replace('<osiągnięto>', str(room.collected()))
+    interested = room.observers.model.objects.filter(
+        observed_rooms=room
+    ).distinct()
+    messages = []
+    for user in interested:
+        messages.append(EmailMessage(
+            'Zbiórka została zakończona', body, to=[user.email],
+        ))
+    return connection.send_messages(messages)
+
+
+class Command(BenchmarkCommand):
+    help = 'Compare sending a notification to many recipients at once ' \
+           'and in chunks, to a local SMTP server'
+    repeat = 1
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--recipients', type=int, default=100000)
+        parser.add_argument('--chunk-size', type=int, default=100)
+
+    def populate(self, **options):
+        User.objects.bulk_create([
+            User(
+                username=f'benchmark{num}', password='!',
+                email=f'benchmark{num}@example.com'
+            )
+            for num in range(options['recipients'])
+        ])
+        self.room = Room.objects.create(
+            receiver='receiver', gift='gift', price=1000, to_collect=1000,
+            visible=True, date_expires=date.today()
+        )
+        Observer = Room.observers.through
+        Observer.objects.bulk_create([
+            Observer(room_id=self.room.id, user_id=user_id)
+            for user_id in User.objects.filter(
+                username__startswith='benchmark'
+            ).values_list('id', flat=True)
+        ])
+
+    def run(self, **options):
+        server = SMTPServer(('127.0.0.1', 0), SMTPHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = server.server_address
+
+        def connection():
+            return mail.get_connection(
+                'django.core.mail.backends.smtp.EmailBackend',
+                host=host, port=port
+            )
+
+        def new():
+            MassEmailProgress.objects.all().delete()
+            return notify_interested(
+                self.room, connection(), options['chunk_size']
+            )
+
+        for name, func in [
+            ('wszystkie wiadomości naraz',
+             lambda: old_notify_interested(self.room, connection())),
+            (f'partie po {options["chunk_size"]}', new),
+        ]:
+            server.connections = server.messages = 0
+            self.measure_once(name, func)
+            self.stdout.write(
+                f'  wiadomości: {server.messages}, '
+                f'połączenia: {server.connections}'
+            )
+        server.shutdown()
+        server.server_close()
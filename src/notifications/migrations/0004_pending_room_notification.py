@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-17 10:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0029_room_score_index'),
+        ('notifications', '0003_outgoing_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingRoomNotification',
+            fields=[
+                ('room', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='rooms.Room')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('dispatched', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
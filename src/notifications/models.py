@@ -1,3 +1,159 @@
+from datetime import timedelta
+
+from django.core.mail import EmailMessage
 from django.db import models
+from django.utils import timezone
+
+
+class SentNotification(models.Model):
+    """
+    Key of a notification which has been sent. Task saves the key in
+    the same transaction as it sends the message, so a retried task
+    skips messages which were sent before (see tasks.send_once).
+    """
+    key = models.CharField(max_length=150, unique=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.key
+
+
+class MassEmailProgress(models.Model):
+    """
+    Progress of sending one message to many recipients ordered by id.
+    :last_recipient_id: is saved after every sent chunk, so a task
+    started again after a crash continues after it (see
+    tasks.send_streaming).
+    """
+    key = models.CharField(max_length=150, unique=True)
+    last_recipient_id = models.PositiveIntegerField(default=0)
+    sent = models.PositiveIntegerField(default=0)
+    finished = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f'{self.key}: {self.sent}'
+
+
+class PendingRoomNotificationQuerySet(models.QuerySet):
+    def due(self, now=None):
+        """notifications whose task was not started or seems lost"""
+        before = (now or timezone.now()) - PendingRoomNotification.RETRY_AFTER
+        return self.filter(
+            models.Q(dispatched__lte=before) |
+            models.Q(dispatched__isnull=True, created__lte=before)
+        )
+
+
+class PendingRoomNotification(models.Model):
+    """
+    Closed room whose notifications have not been sent yet. It is saved
+    in the transaction which closes the room and deleted by the task
+    which sends them, so notifications whose task was lost (broker
+    unavailable, crashed worker) are sent by the next
+    dispatch_room_notifications task after RETRY_AFTER.
+    """
+    RETRY_AFTER = timedelta(hours=1)
+
+    room = models.OneToOneField(
+        'rooms.Room', on_delete=models.CASCADE, primary_key=True,
+        related_name='+'
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    dispatched = models.DateTimeField(null=True, blank=True)
+
+    objects = PendingRoomNotificationQuerySet.as_manager()
+
+    def __str__(self):
+        return str(self.room_id)
+
+
+class OutgoingEmailQuerySet(models.QuerySet):
+    def enqueue(self, subject, message, to):
+        """
+        Save the message in the outbox, it is sent later by send_outbox
+        task. It is a single INSERT, so it can be called inside
+        the transaction of a request without waiting for SMTP. New
+        lines are removed from the subject, a header cannot have them.
+        """
+        subject = ' '.join(subject.split())
+        max_length = OutgoingEmail._meta.get_field('subject').max_length
+        return self.create(
+            subject=subject[:max_length], message=message, to=to
+        )
+
+    def due(self, now=None):
+        """messages which should be sent now, the oldest first"""
+        return self.filter(
+            status=OutgoingEmail.PENDING,
+            next_attempt__lte=now or timezone.now()
+        ).order_by('next_attempt', 'id')
+
+
+class OutgoingEmail(models.Model):
+    """
+    Outbox. Message is sent by send_outbox task, failed sending is
+    retried after RETRY_DELAY * 2 ** (attempts - 1) until MAX_ATTEMPTS.
+    """
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUSES = [
+        (PENDING, 'Oczekuje'),
+        (SENT, 'Wysłana'),
+        (FAILED, 'Niewysłana'),
+    ]
+    MAX_ATTEMPTS = 6
+    RETRY_DELAY = timedelta(minutes=1)
+    # messages taken by send_outbox are not due for this time, they are
+    # sent again only if the worker died before saving the result
+    CLAIM_TIMEOUT = timedelta(minutes=10)
+
+    subject = models.CharField(max_length=255)
+    message = models.TextField()
+    to = models.EmailField()
+    status = models.CharField(
+        max_length=10, choices=STATUSES, default=PENDING
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    sent = models.DateTimeField(null=True, blank=True)
+
+    objects = OutgoingEmailQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['status', 'next_attempt'],
+                name='outgoing_email_due',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.to}: {self.subject}'
+
+    def email_message(self, connection=None):
+        return EmailMessage(
+            self.subject, self.message, to=[self.to], connection=connection
+        )
+
+    def delivered(self, now):
+        self.status = self.SENT
+        self.sent = now
+        self.attempts += 1
+        self.last_error = ''
 
-# Create your models here.
+    def failed(self, error, now, permanent=False):
+        """
+        schedule next attempt or give up after MAX_ATTEMPTS (at once if
+        the message can never be sent)
+        """
+        self.attempts += 1
+        self.last_error = repr(error)
+        if permanent or self.attempts >= self.MAX_ATTEMPTS:
+            self.status = self.FAILED
+        else:
+            self.next_attempt = (
+                now + self.RETRY_DELAY * 2 ** (self.attempts - 1)
+            )
@@ -1,10 +1,48 @@
-from datetime import datetime
+"""
+Celery tasks of notifications. Rooms are closed in bulk by
+:close_rooms: (run every night by celery beat) and notifications of
+every room are sent by a separate task, so a failing mail server
+retries only one room. A closed room has PendingRoomNotification until
+its notifications are sent, so a task lost before it started is
+dispatched again. A single message has a key saved with
+SentNotification and a message to many recipients saves its progress
+after every chunk (MassEmailProgress), so a retried task does not send
+them again.
+"""
+import logging
+import os
+from functools import lru_cache
+from itertools import islice
 
+from celery import group, shared_task
+from django.conf import settings
 from django.core import mail
 from django.core.mail import EmailMessage
+from django.db import IntegrityError, transaction
+from django.template import Context, Template
+from django.utils import timezone
 
+from src.rooms import leaderboards
 from src.rooms.models import Donation, Room
 
+from .models import (
+    MassEmailProgress, OutgoingEmail, PendingRoomNotification,
+    SentNotification
+)
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500    # rooms closed by one UPDATE
+RETRY = {
+    # SMTPException and connection errors are OSError
+    'autoretry_for': (OSError,),
+    'retry_backoff': True,
+    'max_retries': 5,
+}
+INTERESTED_EMAIL = os.path.join(
+    os.path.dirname(__file__), 'interested_email.txt'
+)
+
 
 def send_email(data):
     message = EmailMessage(data['subject'], data['message'], to=data['to'])
@@ -17,46 +55,222 @@ def send_mass_email(email_message_list):
     return connection.send_messages(messages)
 
 
-# will be shared task
+def send_once(key, message, connection=None):
+    """
+    Send the message unless a message with the same key has been sent.
+    Key is saved in the transaction of sending, so it is rolled back
+    when sending fails.
+    :return: 1 if the message was sent, 0 otherwise
+    """
+    try:
+        with transaction.atomic():
+            SentNotification.objects.create(key=key)
+            message.connection = connection
+            message.send()
+    except IntegrityError:
+        return 0
+    return 1
+
+
+@shared_task
+def send_outbox(batch_size=100):
+    """
+    Send due messages of the outbox (OutgoingEmail) over one
+    connection. Rows are taken with SKIP LOCKED and their next attempt
+    is moved by CLAIM_TIMEOUT, so more workers can send at the same time
+    and no lock is held while SMTP is slow. Result of every message is
+    committed as soon as it is known, so a worker which dies sends
+    again at most the message it was sending. A message which cannot be
+    sent at all (e.g. bad header) fails without blocking the others.
+    It is run every few seconds by celery beat.
+    :return: number of sent messages
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            OutgoingEmail.objects.due(now)
+            .select_for_update(skip_locked=True)[:batch_size]
+        )
+        OutgoingEmail.objects.filter(
+            pk__in=[email.pk for email in emails]
+        ).update(next_attempt=now + OutgoingEmail.CLAIM_TIMEOUT)
+    if not emails:
+        return 0
+    connection = mail.get_connection()
+    try:
+        connection.open()
+    except OSError:
+        pass    # every message fails below and it is retried
+    sent = 0
+    for email in emails:
+        try:
+            email.email_message(connection).send()
+        except OSError as error:
+            email.failed(error, now)
+        except Exception as error:
+            logger.exception('outgoing email %s cannot be sent', email.pk)
+            email.failed(error, now, permanent=True)
+        else:
+            email.delivered(now)
+            sent += 1
+        email.save(update_fields=[
+            'status', 'attempts', 'next_attempt', 'last_error', 'sent'
+        ])
+    connection.close()
+    return sent
+
+
+def send_streaming(key, recipients, build_message, connection=None,
+                   chunk_size=None):
+    """
+    Send a message to every recipient in chunks of :chunk_size: over
+    one connection. :recipients: is a queryset of (id, email) rows,
+    it is read with iterator() after the last recipient saved in
+    MassEmailProgress of the :key:, so only the current chunk is in
+    memory and a task started again after a crash continues with
+    the first chunk which was not sent.
+    :param build_message: function (email) -> EmailMessage
+    :return: number of messages sent by this call
+    """
+    chunk_size = chunk_size or settings.NOTIFICATION_CHUNK_SIZE
+    progress, _ = MassEmailProgress.objects.get_or_create(key=key)
+    if progress.finished:
+        return 0
+    rows = (recipients
+            .filter(id__gt=progress.last_recipient_id)
+            .order_by('id')
+            .iterator(chunk_size=chunk_size))
+    connection = connection or mail.get_connection()
+    sent = 0
+    with connection:
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            connection.send_messages(
+                [build_message(email) for _, email in chunk]
+            )
+            sent += len(chunk)
+            progress.last_recipient_id = chunk[-1][0]
+            progress.sent += len(chunk)
+            progress.save(update_fields=['last_recipient_id', 'sent'])
+    progress.finished = True
+    progress.save(update_fields=['finished'])
+    return sent
+
+
+@shared_task
 def close_rooms():
-    today = datetime.now().date()
-    outdated_rooms = Room.objects.filter(expires__lt=today)
-    for room in outdated_rooms:
-        notify_creator(room)
-        notify_interested(room)
-        room.is_active = False
-        room.save()
+    """
+    Close active rooms which have expired and start a notification
+    task for every closed room.
+    :return: number of closed rooms
+    """
+    today = timezone.now().date()
+    expired = Room.objects.filter(is_active=True, date_expires__lt=today)
+    with transaction.atomic():
+        room_ids = list(
+            expired.select_for_update().order_by('id')
+            .values_list('id', flat=True)
+        )
+        for start in range(0, len(room_ids), BATCH_SIZE):
+            Room.objects.filter(
+                id__in=room_ids[start:start + BATCH_SIZE]
+            ).update(is_active=False)
+        save_notifications(room_ids)
+    if room_ids:
+        leaderboards.clear()
+        dispatch_room_notifications(room_ids)
+    return len(room_ids)
 
 
-# will be shared tasks
-def room_collected(id):
-    room = Room.objects.get(id=id)
-    notify_creator(room)
-    notify_interested(room)
-    room.is_active = False
-    room.save()
+def save_notifications(room_ids):
+    """
+    Save notifications of rooms closed in the current transaction, they
+    are sent by :dispatch_room_notifications: after it is committed.
+    """
+    PendingRoomNotification.objects.bulk_create([
+        PendingRoomNotification(room_id=room_id) for room_id in room_ids
+    ], batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+def notify_on_commit(room_id):
+    """the room is closed by the current transaction (see Room.donate)"""
+    save_notifications([room_id])
+    transaction.on_commit(lambda: dispatch_room_notifications([room_id]))
+
+
+@shared_task
+def dispatch_room_notifications(room_ids=None):
+    """
+    Start notification tasks of :room_ids: or of all due
+    PendingRoomNotification (run periodically by celery beat). A room
+    whose task is lost is dispatched again after RETRY_AFTER, sending
+    is idempotent. Broker errors are logged, pending notifications are
+    kept.
+    :return: number of started tasks
+    """
+    now = timezone.now()
+    pending = PendingRoomNotification.objects.all()
+    if room_ids is None:
+        pending = pending.due(now)
+    else:
+        pending = pending.filter(room_id__in=room_ids)
+    room_ids = list(pending.values_list('room_id', flat=True))
+    if not room_ids:
+        return 0
+    try:
+        group(
+            notify_room_closed.s(room_id) for room_id in room_ids
+        ).apply_async()
+    except Exception:
+        logger.exception('notifications of closed rooms not dispatched')
+        return 0
+    PendingRoomNotification.objects.filter(
+        room_id__in=room_ids
+    ).update(dispatched=now)
+    return len(room_ids)
+
+
+@shared_task(**RETRY)
+def notify_room_closed(room_id):
+    """:return: number of sent messages"""
+    room = Room.objects.select_related('creator').get(pk=room_id)
+    sent = notify_creator(room) + notify_interested(room)
+    PendingRoomNotification.objects.filter(room_id=room_id).delete()
+    return sent
 
 
 def notify_creator(room):
+    creator = room.creator
+    if creator is None or not creator.email:
+        return 0
     resume = Donation.objects.filter(room_id=room.id).resume()
-    message = {
-        'subject': 'Tytuł',
-        'message': resume,
-        'to': ['bartosz@wp.com',]
-    }
-    return send_email(message)
-
-
-def notify_interested(room):
-    subject = f'Została zakończona zbiórka {room.gift}'
-    with open('./interested_email.txt') as body:
-        body = body.replace('<osiąginięto>', room.collected)
-    interested = room.get_interested()
-    messages = []
-    for user in interested:
-        messages.append(EmailMessage(
-            'Zbiórka została zakończona',
-            body,
-            to=[user.email],
-        ))
-    send_mass_email(messages)
+    message = EmailMessage(
+        f'Zbiórka {room.gift} została zakończona', resume,
+        to=[creator.email]
+    )
+    return send_once(f'room-closed:{room.id}:creator', message)
+
+
+@lru_cache(maxsize=None)
+def interested_template():
+    """template of the message to patrons and observers, compiled once"""
+    with open(INTERESTED_EMAIL, encoding='utf-8') as template:
+        return Template(template.read())
+
+
+def notify_interested(room, connection=None, chunk_size=None):
+    body = interested_template().render(Context({'room': room}))
+    interested = (room.get_interested()
+                  .exclude(email='')
+                  .values_list('id', 'email'))
+    return send_streaming(
+        f'room-closed:{room.id}:interested',
+        interested,
+        lambda email: EmailMessage(
+            'Zbiórka została zakończona', body, to=[email]
+        ),
+        connection,
+        chunk_size,
+    )
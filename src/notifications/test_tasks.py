@@ -1,11 +1,21 @@
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from unittest import mock
 
 from django.contrib.auth import get_user_model
 from django.core import mail
 from django.core.mail import EmailMessage
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
 
-from src.notifications.tasks import notify_creator, send_email, send_mass_email
+from src.notifications.models import (
+    MassEmailProgress, OutgoingEmail, PendingRoomNotification,
+    SentNotification
+)
+from src.notifications.tasks import (
+    close_rooms, dispatch_room_notifications, notify_creator,
+    notify_interested, notify_room_closed, send_email, send_mass_email,
+    send_once, send_outbox
+)
 from src.rooms.models import Room
 
 User = get_user_model()
@@ -43,3 +53,219 @@ class TasksTest(TestCase):
     def test_notify_interested(self):
         notify_interested(self.room1)
     """
+
+
+@override_settings(
+    CELERY_TASK_ALWAYS_EAGER=True,
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'
+)
+class CloseRoomsTest(TestCase):
+    def setUp(self):
+        self.creator = User.objects.create_user(
+            username='creator', password='12345', email='creator@test.pl'
+        )
+        self.patron = User.objects.create_user(
+            username='patron', password='12345', email='patron@test.pl'
+        )
+        self.observer = User.objects.create_user(
+            username='observer', password='12345', email='observer@test.pl'
+        )
+        yesterday = date.today() - timedelta(days=1)
+        self.expired = self.create_room('expired', yesterday)
+        self.expired.donate({'user': self.patron, 'amount': 100})
+        self.expired.observers.add(self.observer, self.patron)
+        self.active = self.create_room('active', date.today())
+        self.active.observers.add(self.observer)
+        mail.outbox = []
+
+    def create_room(self, gift, date_expires):
+        return Room.objects.create(
+            receiver='receiver', creator=self.creator, gift=gift,
+            price=1000, to_collect=1000, visible=True,
+            date_expires=date_expires
+        )
+
+    def test_close_rooms(self):
+        self.assertEqual(close_rooms.apply().get(), 1)
+        self.expired.refresh_from_db()
+        self.active.refresh_from_db()
+        self.assertFalse(self.expired.is_active)
+        self.assertTrue(self.active.is_active)
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            ['creator@test.pl', 'observer@test.pl', 'patron@test.pl']
+        )
+        self.assertIn('100', mail.outbox[-1].body)
+
+    def test_closed_rooms_are_skipped(self):
+        close_rooms()
+        self.assertEqual(close_rooms(), 0)
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_retry_does_not_send_again(self):
+        close_rooms()
+        self.assertEqual(notify_room_closed.apply([self.expired.id]).get(), 0)
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_failed_message_is_sent_by_retry(self):
+        message = EmailMessage('Tytuł', 'Treść', to=['creator@test.pl'])
+        with mock.patch.object(EmailMessage, 'send', side_effect=OSError):
+            with self.assertRaises(OSError):
+                send_once('key', message)
+        self.assertFalse(SentNotification.objects.exists())
+        self.assertEqual(send_once('key', message), 1)
+        self.assertEqual(send_once('key', message), 0)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_notify_interested_resumes_after_crash(self):
+        for num in range(5):
+            user = User.objects.create_user(
+                username=f'user{num}', password='12345',
+                email=f'user{num}@test.pl'
+            )
+            self.expired.observers.add(user)
+        connection = mail.get_connection()
+        send_messages = connection.send_messages
+        calls = []
+
+        def crash_on_third_chunk(messages):
+            calls.append(len(messages))
+            if len(calls) == 3:
+                raise OSError
+            return send_messages(messages)
+
+        connection.send_messages = crash_on_third_chunk
+        with self.assertRaises(OSError):
+            notify_interested(self.expired, connection, chunk_size=2)
+        self.assertEqual(len(mail.outbox), 4)
+        progress = MassEmailProgress.objects.get()
+        self.assertEqual(progress.sent, 4)
+        self.assertFalse(progress.finished)
+
+        self.assertEqual(notify_interested(self.expired, chunk_size=2), 3)
+        self.assertEqual(len(mail.outbox), 7)
+        self.assertEqual(
+            len({message.to[0] for message in mail.outbox}), 7
+        )
+        self.assertEqual(notify_interested(self.expired), 0)
+
+    def test_lost_dispatch_is_repeated(self):
+        with mock.patch(
+            'src.notifications.tasks.group.apply_async', side_effect=OSError
+        ), self.assertLogs('src.notifications.tasks', 'ERROR'):
+            self.assertEqual(close_rooms(), 1)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(dispatch_room_notifications(), 0)     # not due
+        later = timezone.now() + PendingRoomNotification.RETRY_AFTER
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            self.assertEqual(dispatch_room_notifications(), 1)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse(PendingRoomNotification.objects.exists())
+
+    def test_collected_room_is_notified(self):
+        self.active.donate({'user': self.patron, 'amount': 1000})
+        self.assertTrue(PendingRoomNotification.objects.filter(
+            room_id=self.active.id
+        ).exists())
+        self.assertEqual(dispatch_room_notifications([self.active.id]), 1)
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            ['creator@test.pl', 'observer@test.pl', 'patron@test.pl']
+        )
+
+
+@override_settings(
+    CELERY_TASK_ALWAYS_EAGER=True,
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'
+)
+class CollectedRoomTest(TransactionTestCase):
+    def test_notified_after_commit(self):
+        creator = User.objects.create_user(
+            username='creator', password='12345', email='creator@test.pl'
+        )
+        room = Room.objects.create(
+            receiver='receiver', creator=creator, gift='gift', price=100,
+            to_collect=100, visible=True, date_expires=date.today()
+        )
+        room.donate({'user': creator, 'amount': 100})
+        self.assertFalse(room.is_active)
+        self.assertEqual(len(mail.outbox), 2)    # creator is a patron
+        self.assertFalse(PendingRoomNotification.objects.exists())
+
+
+class OutboxTest(TestCase):
+    def setUp(self):
+        self.email = OutgoingEmail.objects.enqueue(
+            'Tytuł', 'Treść', 'bartosz@wp.com'
+        )
+        mail.outbox = []
+
+    def test_send_outbox(self):
+        self.assertEqual(send_outbox(), 1)
+        self.email.refresh_from_db()
+        self.assertEqual(self.email.status, OutgoingEmail.SENT)
+        self.assertIsNotNone(self.email.sent)
+        self.assertEqual(mail.outbox[0].to, ['bartosz@wp.com'])
+        self.assertEqual(send_outbox(), 0)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_failed_message_is_retried_later(self):
+        with mock.patch.object(EmailMessage, 'send', side_effect=OSError):
+            self.assertEqual(send_outbox(), 0)
+        self.email.refresh_from_db()
+        self.assertEqual(self.email.status, OutgoingEmail.PENDING)
+        self.assertEqual(self.email.attempts, 1)
+        self.assertIn('OSError', self.email.last_error)
+        self.assertGreater(self.email.next_attempt, timezone.now())
+        self.assertFalse(OutgoingEmail.objects.due().exists())
+        later = self.email.next_attempt
+        self.assertTrue(OutgoingEmail.objects.due(later).exists())
+
+    def test_unsendable_message_does_not_block_outbox(self):
+        bad = OutgoingEmail.objects.create(
+            subject='Tytuł\nBcc: x@wp.com', message='Treść', to='a@wp.com'
+        )
+        OutgoingEmail.objects.filter(pk=bad.pk).update(
+            next_attempt=self.email.next_attempt - timedelta(seconds=1)
+        )
+        with self.assertLogs('src.notifications.tasks', 'ERROR'):
+            self.assertEqual(send_outbox(), 1)
+        bad.refresh_from_db()
+        self.assertEqual(bad.status, OutgoingEmail.FAILED)
+        self.assertEqual(bad.attempts, 1)
+        self.assertIn('BadHeaderError', bad.last_error)
+        self.assertEqual(mail.outbox[0].to, ['bartosz@wp.com'])
+
+    def test_delivered_messages_are_saved_one_by_one(self):
+        OutgoingEmail.objects.enqueue('Tytuł 2', 'Treść', 'b@wp.com')
+
+        class WorkerDied(BaseException):
+            pass
+
+        send = mock.Mock(side_effect=[1, WorkerDied])
+        with mock.patch.object(EmailMessage, 'send', send):
+            with self.assertRaises(WorkerDied):
+                send_outbox()
+        self.email.refresh_from_db()
+        self.assertEqual(self.email.status, OutgoingEmail.SENT)
+        other = OutgoingEmail.objects.get(to='b@wp.com')
+        self.assertEqual(other.status, OutgoingEmail.PENDING)
+        # it is sent again when CLAIM_TIMEOUT passes
+        self.assertFalse(OutgoingEmail.objects.due().exists())
+        later = timezone.now() + OutgoingEmail.CLAIM_TIMEOUT
+        self.assertEqual(list(OutgoingEmail.objects.due(later)), [other])
+
+    def test_enqueue_removes_new_lines_from_subject(self):
+        email = OutgoingEmail.objects.enqueue(
+            'Tytuł\r\nBcc: x@wp.com', 'Treść', 'a@wp.com'
+        )
+        self.assertEqual(email.subject, 'Tytuł Bcc: x@wp.com')
+
+    def test_give_up_after_max_attempts(self):
+        now = timezone.now()
+        for attempt in range(OutgoingEmail.MAX_ATTEMPTS):
+            self.email.failed(OSError(), now)
+        self.assertEqual(self.email.status, OutgoingEmail.FAILED)
+        self.assertEqual(
+            self.email.next_attempt - now, OutgoingEmail.RETRY_DELAY * 16
+        )
@@ -0,0 +1,180 @@
+"""
+Keyset (cursor) pagination. The next page is read with a condition on
+the ordering fields of the last row (WHERE (date, id) < (...)) instead
+of OFFSET, so every page costs the same and no COUNT(*) is needed.
+Cursor is an opaque string with values of the ordering fields.
+Ordering fields must not be NULL.
+"""
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Q
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def encode_cursor(values, direction=NEXT):
+    data = json.dumps([direction, list(values)], cls=DjangoJSONEncoder)
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """:return: (direction, values) or None if cursor is invalid"""
+    try:
+        direction, values = json.loads(base64.urlsafe_b64decode(cursor))
+    except (ValueError, TypeError):
+        return None
+    if direction not in (NEXT, PREVIOUS) or not isinstance(values, list):
+        return None
+    return direction, values
+
+
+def parse_ordering(ordering):
+    """['-date', 'id'] -> [('date', True), ('id', False)]"""
+    return [
+        (field.lstrip('-'), field.startswith('-')) for field in ordering
+    ]
+
+
+def keyset_filter(queryset, ordering, values, reverse=False):
+    """
+    rows after the row with :values: of :ordering: fields (before it
+    if :reverse:). For ['-date', 'id'] it is
+    date < d OR (date = d AND id > i)
+    """
+    condition = Q()
+    equal = {}
+    for (field, descending), value in zip(parse_ordering(ordering), values):
+        lookup = 'lt' if descending != reverse else 'gt'
+        condition |= Q(**equal, **{f'{field}__{lookup}': value})
+        equal[field] = value
+    return queryset.filter(condition)
+
+
+def get_value(obj, field):
+    """value of the field of a model instance or a row of values()"""
+    if isinstance(obj, dict):
+        return obj[field]
+    for name in field.split('__'):
+        obj = getattr(obj, name)
+    return obj
+
+
+def approximate_count(queryset, limit=1000):
+    """
+    Estimated number of rows. PostgreSQL estimate is read from
+    the query plan, other databases count at most :limit: rows.
+    :return: (number, is_exact)
+    """
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows']), False
+    count = queryset.order_by()[:limit + 1].count()
+    return min(count, limit), count <= limit
+
+
+class KeysetPage:
+    """
+    Page of keyset pagination. It has a part of django Page interface
+    used by templates (object_list, has_next, has_previous,
+    has_other_pages) and cursors of neighbouring pages.
+    """
+    def __init__(self, object_list, next_cursor, previous_cursor,
+                 total=None, total_is_exact=True):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.total = total
+        self.total_is_exact = total_is_exact
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginationMixin:
+    """
+    Mixin for ListView which replaces page numbers with cursors
+    (:cursor_param: GET param). Ordering of the queryset (or Meta
+    ordering) is used as the key, primary key is added when it is
+    missing. Set :paginate_total: to add an approximate number of rows
+    (see :approximate_count:). Page is in context as 'page_obj'.
+    """
+    cursor_param = 'cursor'
+    paginate_total = False
+
+    def get_keyset_ordering(self, queryset):
+        ordering = list(
+            queryset.query.order_by or queryset.model._meta.ordering
+        )
+        fields = {field.lstrip('-') for field in ordering}
+        if not fields & {'id', 'pk'}:
+            last_descending = ordering and ordering[-1].startswith('-')
+            ordering.append('-pk' if last_descending else 'pk')
+        return ordering
+
+    def paginate_queryset(self, queryset, page_size):
+        ordering = self.get_keyset_ordering(queryset)
+        total, total_is_exact = None, True
+        if self.paginate_total:
+            total, total_is_exact = approximate_count(queryset)
+        cursor = decode_cursor(self.request.GET.get(self.cursor_param, ''))
+        direction, values = cursor or (NEXT, None)
+        reverse = direction == PREVIOUS
+        rows = queryset
+        if values is not None and len(values) != len(ordering):
+            values, reverse = None, False     # ordering has changed
+        if values is not None:
+            try:
+                rows = keyset_filter(rows, ordering, values, reverse)
+            except (ValidationError, ValueError, TypeError):
+                rows, values, reverse = queryset, None, False
+        if reverse:
+            reversed_ordering = [
+                field[1:] if field.startswith('-') else f'-{field}'
+                for field in ordering
+            ]
+            rows = rows.order_by(*reversed_ordering)
+        else:
+            rows = rows.order_by(*ordering)
+        rows = list(rows[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        def cursor_of(obj, direction):
+            fields = [field for field, _ in parse_ordering(ordering)]
+            return encode_cursor(
+                [get_value(obj, field) for field in fields], direction
+            )
+
+        next_cursor = previous_cursor = None
+        if rows and (has_more or reverse):
+            next_cursor = cursor_of(rows[-1], NEXT)
+        if rows and (values is not None and (not reverse or has_more)):
+            previous_cursor = cursor_of(rows[0], PREVIOUS)
+        page = KeysetPage(
+            rows, next_cursor, previous_cursor, total, total_is_exact
+        )
+        return None, page, rows, page.has_other_pages()
@@ -0,0 +1,81 @@
+"""
+Token buckets kept in the cache. A bucket holds at most :burst: tokens
+and gets :rate: tokens per second, every action takes one token.
+State of a bucket is (tokens, time of the last update). It is read and
+written under a lock of the bucket (cache.add is atomic), so actions
+of the same bucket in different processes are not let through twice.
+"""
+import math
+import time
+
+from django.core.cache import cache
+
+LOCK_TIMEOUT = 1        # seconds, a crashed process holds a lock at most that
+LOCK_ATTEMPTS = 50
+LOCK_SLEEP = 0.002
+
+
+def bucket_key(name, ident):
+    return f'ratelimit_{name}_{ident}'
+
+
+def lock_key(key):
+    return f'{key}_lock'
+
+
+def acquire(keys):
+    """
+    lock buckets of :keys: in order (no deadlock of overlapping sets)
+    :return: True if all of them were locked
+    """
+    locked = []
+    for key in sorted(keys):
+        for _ in range(LOCK_ATTEMPTS):
+            if cache.add(lock_key(key), 1, LOCK_TIMEOUT):
+                locked.append(key)
+                break
+            time.sleep(LOCK_SLEEP)
+        else:
+            release(locked)
+            return False
+    return True
+
+
+def release(keys):
+    cache.delete_many([lock_key(key) for key in keys])
+
+
+def take_token(buckets, now=None):
+    """
+    take a token from every bucket if all of them have one
+    :param buckets: [(cache key, rate, burst)]
+    :return: 0 or seconds until every bucket has a token
+    """
+    if not buckets:
+        return 0
+    keys = [key for key, _, _ in buckets]
+    if not acquire(keys):
+        # other actions of the buckets keep them busy
+        return LOCK_ATTEMPTS * LOCK_SLEEP
+    try:
+        now = time.time() if now is None else now
+        states = cache.get_many(keys)
+        tokens = {}
+        wait = 0
+        for key, rate, burst in buckets:
+            level, updated = states.get(key, (burst, now))
+            level = min(burst, level + max(now - updated, 0) * rate)
+            tokens[key] = level
+            if level < 1:
+                wait = max(wait, (1 - level) / rate)
+        if wait:
+            return wait
+        # a full bucket is the same as a missing one
+        timeout = max(math.ceil(burst / rate) for _, rate, burst in buckets)
+        cache.set_many(
+            {key: (level - 1, now) for key, level in tokens.items()},
+            timeout + 1
+        )
+        return 0
+    finally:
+        release(keys)
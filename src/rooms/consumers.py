@@ -1,68 +1,82 @@
-import json
+from django.conf import settings
 
-from asgiref.sync import async_to_sync
-from channels.generic.websocket import WebsocketConsumer
+from src.consumers import (
+    BroadcastCoalescer, QueuedJsonWebsocketConsumer, database_task
+)
 
 from .forms import DonateForm
 from .models import Room
 
+# state of a room sent to its sockets at most once per window
+progress = BroadcastCoalescer(settings.DONATION_BROADCAST_WINDOW)
 
-class DonateConsumer(WebsocketConsumer):
+
+class DonateConsumer(QueuedJsonWebsocketConsumer):
     """
-    Consumer is used for making donations. Consumer is
-    not asynchronous because it would not improve much
-    performance.
+    Consumer is used for making donations. It is asynchronous, so
+    an open socket which only waits for donations of the room does not
+    hold a thread. Validation and the donation transaction run in
+    the database threads (see src/consumers.py) and the new state of
+    the room is sent to every socket of the room by :progress:, so
+    a burst of donations is one message per window. Sequence of
+    the state is the number of donations of the room. Donations of
+    a user and of a room are limited by DONATION_RATE_LIMITS.
     """
-    def connect(self):
+    rate_limit_name = 'donation'
+
+    async def connect(self):
         self.room_id = self.scope['url_route']['kwargs']['room_id']
         self.room_group_name = f'room_{self.room_id}'
 
-        async_to_sync(self.channel_layer.group_add)(
+        await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name,
         )
+        await self.accept()
 
-        self.accept()
-
-    def disconnect(self):
-        async_to_sync(self.channel_layer.group_discard)(
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name,
         )
 
-    def receive(self, text_data):
-        data = json.loads(text_data)
-        form = DonateForm(data)
-        if form.is_valid():
-            amount = form.cleaned_data.get('amount')
-            comment = form.cleaned_data.get('comment')
-            data = {
-                'user': self.scope['user'],
-                'amount': amount,
-                'comment': comment
-            }
-            room_id = int(self.room_id)
-            room = Room.objects.get(id=room_id).donate(data)
-            async_to_sync(self.channel_layer.group_send)(
-                self.room_group_name,
-                {
-                    'type': 'chat_message',
-                    'to_collect': str(room.to_collect),
-                    'collected': str(room.collected()),
-                    'percent_got': str(room.percent_got),
-                }
-            )
-            return self.send(text_data=json.dumps({
-                'is_valid': 'true'
-            }))
-        return self.send(text_data=json.dumps({
-            'is_valid': 'false',
-            'errors': form.errors
-        }))
+    async def handle_json(self, content):
+        result = await self.donate(content)
+        if 'errors' in result:
+            return await self.send_json(self.error_frame(result['errors']))
+        await progress.publish(
+            self.channel_layer,
+            self.room_group_name,
+            {'type': 'chat_message', **result}
+        )
+        await self.send_json({'is_valid': 'true'})
+
+    def error_frame(self, errors, **extra):
+        return {'is_valid': 'false', 'errors': errors, **extra}
+
+    @database_task
+    def donate(self, content):
+        """:return: new state of the room or {'errors': form errors}"""
+        form = DonateForm(content)
+        if not form.is_valid():
+            return {'errors': form.errors}
+        data = {
+            'user': self.scope['user'],
+            'amount': form.cleaned_data.get('amount'),
+            'comment': form.cleaned_data.get('comment'),
+        }
+        room = Room.objects.get(id=self.room_id).donate(data)
+        return {
+            'to_collect': str(room.to_collect),
+            'collected': str(room.collected()),
+            'percent_got': str(room.percent_got),
+            'sequence': room.donation_count,
+        }
 
-    def chat_message(self, event):
-        self.send(text_data=json.dumps({
+    async def chat_message(self, event):
+        await self.send_json({
             'to_collect': event['to_collect'],
             'collected': event['collected'],
             'percent_got': event['percent_got'],
-        }))
+            'sequence': event['sequence'],
+        })
@@ -0,0 +1,145 @@
+"""
+Leaderboards are short rankings of rooms shown in the sidebar of the
+rooms list. Every ranking is computed once, kept in cache and updated
+in place after a donation, so rendering the list does not order the
+whole rooms table on every request.
+Keys of rankings contain a generation number. :clear: increments it
+(atomic in cache), so a ranking written by a process which read it
+before clearing is never read again.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Room
+
+# ranking name (also VisibleManager method) : field used for ordering
+RANKINGS = {
+    'most_popular': 'collected_total',
+    'most_patrons': 'patron_count',
+    'most_to_collect': 'to_collect',
+}
+
+FIELDS = [
+    'id', 'gift', 'price', 'collected_total', 'patron_count', 'to_collect'
+]
+
+
+GENERATION_KEY = 'rooms:leaderboard:generation'
+# cached rankings are changed by one process at a time, a process which
+# cannot take the lock clears them
+LOCK_KEY = 'rooms:leaderboard:lock'
+LOCK_TIMEOUT = 5    # seconds, a process which died does not block others
+
+
+def generation():
+    value = cache.get(GENERATION_KEY)
+    if value is None:
+        cache.add(GENERATION_KEY, 0, None)
+        value = cache.get(GENERATION_KEY, 0)
+    return value
+
+
+def cache_key(name, generation_number=None):
+    if generation_number is None:
+        generation_number = generation()
+    return f'rooms:leaderboard:{generation_number}:{name}'
+
+
+def order_rooms(rooms, name):
+    """order rooms using the ranking. Name has to be in RANKINGS"""
+    if name not in RANKINGS:
+        raise ValueError(f'Unknown ranking: {name}')
+    return getattr(rooms, name)()
+
+
+def compute(name):
+    """top rooms of the ranking as a list of dictionaries"""
+    rooms = Room.objects.filter(visible=True, is_active=True)
+    ranking = order_rooms(rooms, name).values(*FIELDS)
+    return list(ranking[:settings.LEADERBOARD_SIZE])
+
+
+def get_leaderboards():
+    """
+    :return: {ranking name: list of rooms}. Missing rankings are
+    computed and saved in cache.
+    """
+    number = generation()
+    keys = {cache_key(name, number): name for name in RANKINGS}
+    cached = cache.get_many(keys.keys())
+    leaderboards = {}
+    for key, name in keys.items():
+        board = cached.get(key)
+        if board is None:
+            board = compute(name)
+            cache.set(key, board, settings.LEADERBOARD_TIMEOUT)
+        leaderboards[name] = board
+    return leaderboards
+
+
+def is_ranked(room, name):
+    """True if room can be in the ranking"""
+    if not room.visible or not room.is_active:
+        return False
+    if name == 'most_patrons':
+        return room.patron_count > 0
+    return True
+
+
+def update_room(room):
+    """
+    Update cached leaderboards after the room has changed (donation,
+    edition or closing). Room is moved to its new place. If it is not
+    possible without the database (room dropped from the full ranking
+    or it is not ranked anymore) the ranking is removed from cache
+    and it will be computed on the next request. When another process
+    is updating them (LOCK_KEY) all rankings are cleared, rankings
+    read and written back by both would lose one of the changes.
+    """
+    if not cache.add(LOCK_KEY, True, LOCK_TIMEOUT):
+        return clear()
+    try:
+        move_room(room)
+    finally:
+        cache.delete(LOCK_KEY)
+
+
+def move_room(room):
+    """update_room without the lock"""
+    entry = {field: getattr(room, field) for field in FIELDS}
+    size = settings.LEADERBOARD_SIZE
+    number = generation()
+    for name, field in RANKINGS.items():
+        key = cache_key(name, number)
+        board = cache.get(key)
+        if board is None:
+            continue
+        others = [row for row in board if row['id'] != room.id]
+        old_entry = None
+        if len(others) < len(board):
+            old_entry = next(row for row in board if row['id'] == room.id)
+        if not is_ranked(room, name):
+            if old_entry is not None:
+                cache.delete(key)
+            continue
+        new_board = sorted(
+            others + [entry], key=lambda row: row[field], reverse=True
+        )
+        is_last = new_board[-1]['id'] == room.id
+        if len(board) >= size and is_last:
+            if old_entry is None:
+                continue    # room is still not high enough
+            if entry[field] < old_entry[field]:
+                # some room which is not in cache can be higher now
+                cache.delete(key)
+                continue
+        cache.set(key, new_board[:size], settings.LEADERBOARD_TIMEOUT)
+
+
+def clear():
+    """rankings will be computed again, see GENERATION_KEY"""
+    generation()
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        pass    # evicted, rankings of a new generation are not cached
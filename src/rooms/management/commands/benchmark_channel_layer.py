@@ -0,0 +1,112 @@
+import asyncio
+import statistics
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from src.benchmark import BenchmarkCommand
+from src.layers import LocalChannelLayer
+
+# messages of the consumers (src/rooms/consumers.py, src/forum/consumers.py)
+ROOM_MESSAGE = {
+    'type': 'chat_message', 'to_collect': '1000.00', 'collected': '250.00',
+    'percent_got': '25', 'sequence': 25,
+}
+FORUM_MESSAGE = {
+    'type': 'chat_messages',
+    'messages': [{'type': 'chat_message', 'data': {
+        'id': num, 'author': 'user', 'post': 1, 'parent': None,
+        'subject': 'Temat', 'content': 'Treść ' * 20,
+        'date': '17.10.26 12:00', 'thread_parent': None,
+    }} for num in range(5)],
+}
+
+
+class Command(BenchmarkCommand):
+    help = 'Measure group_send latency and fan-out throughput of ' \
+           'channel layers for room_<id> and forum_<id> groups'
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--members', type=int, nargs='+', default=[10, 100, 1000],
+            help='sockets in a group'
+        )
+        parser.add_argument('--messages', type=int, default=100)
+
+    def populate(self, **options):
+        """channel layers do not use the database"""
+
+    def run(self, members, messages, **options):
+        layers = [
+            ('InMemoryChannelLayer', lambda: InMemoryChannelLayer(
+                capacity=messages
+            )),
+            ('LocalChannelLayer (memory)', lambda: LocalChannelLayer(
+                capacity=messages
+            )),
+            ('RedisChannelLayer (redis)', lambda: import_string(
+                settings.CHANNEL_LAYER_BACKENDS['redis']['BACKEND']
+            )(
+                capacity=messages,
+                **settings.CHANNEL_LAYER_BACKENDS['redis']['CONFIG']
+            )),
+        ]
+        for name, make_layer in layers:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            for group, message in [
+                ('room_1', ROOM_MESSAGE), ('forum_1', FORUM_MESSAGE)
+            ]:
+                for size in members:
+                    try:
+                        layer = make_layer()
+                        result = async_to_sync(self.fan_out)(
+                            layer, group, message, size, messages
+                        )
+                    except (ImportError, OSError) as error:
+                        self.stdout.write(f'pominięty: {error!r}')
+                        break
+                    self.report(group, size, *result)
+                else:
+                    continue
+                break
+
+    async def fan_out(self, layer, group, message, size, messages):
+        """
+        send :messages: to a group of :size: channels one after another
+        :return: (latencies of messages until all channels got them,
+                  seconds of all messages)
+        """
+        channels = [await layer.new_channel() for _ in range(size)]
+        for channel in channels:
+            await layer.group_add(group, channel)
+        latencies = []
+        start = time.perf_counter()
+        try:
+            for _ in range(messages):
+                sent = time.perf_counter()
+                await layer.group_send(group, message)
+                await asyncio.gather(*[
+                    layer.receive(channel) for channel in channels
+                ])
+                latencies.append(time.perf_counter() - sent)
+            return latencies, time.perf_counter() - start
+        finally:
+            for channel in channels:
+                await layer.group_discard(group, channel)
+            if hasattr(layer, 'flush'):
+                await layer.flush()
+
+    def report(self, group, size, latencies, elapsed):
+        latencies.sort()
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        deliveries = len(latencies) * size
+        self.stdout.write(
+            f'{group}, {size} gniazd: '
+            f'opóźnienie mediana {statistics.median(latencies) * 1000:.2f}'
+            f' ms, p99 {p99 * 1000:.2f} ms, '
+            f'{deliveries / elapsed:.0f} dostarczeń/s'
+        )
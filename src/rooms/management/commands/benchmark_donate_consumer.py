@@ -0,0 +1,191 @@
+import asyncio
+import json
+import threading
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from asgiref.sync import async_to_sync
+from channels.generic.websocket import WebsocketConsumer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from django.urls import path
+
+from src.benchmark import BenchmarkCommand
+from src.rooms.consumers import DonateConsumer, progress
+from src.rooms.forms import DonateForm
+from src.rooms.models import Room
+
+User = get_user_model()
+
+TIMEOUT = 600
+
+
+class OldDonateConsumer(WebsocketConsumer):
+    """DonateConsumer before it was asynchronous"""
+    def connect(self):
+        self.room_id = self.scope['url_route']['kwargs']['room_id']
+        self.room_group_name = f'room_{self.room_id}'
+        async_to_sync(self.channel_layer.group_add)(
+            self.room_group_name,
+            self.channel_name,
+        )
+        self.accept()
+
+    def disconnect(self, close_code):
+        async_to_sync(self.channel_layer.group_discard)(
+            self.room_group_name,
+            self.channel_name,
+        )
+
+    def receive(self, text_data):
+        form = DonateForm(json.loads(text_data))
+        if form.is_valid():
+            data = {
+                'user': self.scope['user'],
+                'amount': form.cleaned_data.get('amount'),
+                'comment': form.cleaned_data.get('comment'),
+            }
+            room = Room.objects.get(id=int(self.room_id)).donate(data)
+            async_to_sync(self.channel_layer.group_send)(
+                self.room_group_name,
+                {
+                    'type': 'chat_message',
+                    'to_collect': str(room.to_collect),
+                    'collected': str(room.collected()),
+                    'percent_got': str(room.percent_got),
+                }
+            )
+            return self.send(text_data=json.dumps({'is_valid': 'true'}))
+        return self.send(text_data=json.dumps({
+            'is_valid': 'false',
+            'errors': form.errors
+        }))
+
+    def chat_message(self, event):
+        self.send(text_data=json.dumps({
+            'to_collect': event['to_collect'],
+            'collected': event['collected'],
+            'percent_got': event['percent_got'],
+        }))
+
+
+class Command(BenchmarkCommand):
+    help = 'Compare sockets held, donations per second and sent ' \
+           'states of the room of the old and new DonateConsumer ' \
+           '(in-process ASGI application and in-memory channel layer)'
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--sockets', type=int, default=1000)
+        parser.add_argument('--donations', type=int, default=50)
+
+    def handle(self, *args, **options):
+        # consumers save donations in their own threads and connections,
+        # so data is committed and removed at the end
+        self.populate(**options)
+        try:
+            layers = {'default': {
+                'BACKEND': 'channels.layers.InMemoryChannelLayer',
+                'CONFIG': {
+                    'capacity': options['donations'] * 2,
+                    'expiry': TIMEOUT,   # slow consumer must not lose them
+                },
+            }}
+            # one user sends everything, so rate limits are turned off
+            with override_settings(
+                CHANNEL_LAYERS=layers, DONATION_RATE_LIMITS={}
+            ):
+                self.run(**options)
+        finally:
+            Room.objects.filter(pk=self.room.pk).delete()
+            self.user.delete()
+
+    def populate(self, **options):
+        self.user = User.objects.create(
+            username='benchmark_donate', password='!'
+        )
+        self.room = Room.objects.create(
+            receiver='receiver', creator=self.user, gift='gift',
+            price=10 ** 8, to_collect=10 ** 8, visible=True,
+            date_expires=date.today() + timedelta(days=30)
+        )
+
+    def run(self, **options):
+        self.collected = 0
+        old_application, self.new_application = [
+            URLRouter([path('ws/room/<int:room_id>/donate/', consumer)])
+            for consumer in [OldDonateConsumer, DonateConsumer]
+        ]
+        for name, application in [
+            ('stary (WebsocketConsumer)', old_application),
+            ('nowy (AsyncJsonWebsocketConsumer)', self.new_application),
+        ]:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            async_to_sync(self.load_test)(application, **options)
+
+    async def load_test(self, application, sockets, donations, **options):
+        url = f'/ws/room/{self.room.id}/donate/'
+        threads = threading.active_count()
+        tracemalloc.start()
+        start = time.perf_counter()
+        communicators = []
+        for _ in range(sockets):
+            communicator = WebsocketCommunicator(application, url)
+            communicator.scope['user'] = self.user
+            connected, _ = await communicator.connect(TIMEOUT)
+            if connected:
+                communicators.append(communicator)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(
+            f'otwarte gniazda: {len(communicators)} w {elapsed:.1f} s, '
+            f'pamięć {peak / len(communicators) / 1024:.1f} kB na gniazdo'
+        )
+
+        donors = [
+            communicators[num % len(communicators)]
+            for num in range(donations)
+        ]
+        answers = {id(communicator): 0 for communicator in communicators}
+        for donor in donors:
+            answers[id(donor)] += 1
+        self.collected += donations     # every donation is 1 zł
+        final = f'{self.collected:.2f}'
+
+        async def read(communicator):
+            """:return: number of received states of the room"""
+            waiting = answers[id(communicator)]
+            states = 0
+            collected = None
+            while waiting or collected != final:
+                message = await communicator.receive_json_from(TIMEOUT)
+                if 'is_valid' in message:
+                    waiting -= 1
+                else:
+                    states += 1
+                    collected = message['collected']
+            return states
+
+        progress.reset()
+        start = time.perf_counter()
+        received = await asyncio.gather(
+            *[read(communicator) for communicator in communicators],
+            *[donor.send_json_to({'amount': '1'}) for donor in donors],
+        )
+        elapsed = time.perf_counter() - start
+        states = sum(received[:len(communicators)])
+        self.stdout.write(
+            f'{donations} wpłat w {elapsed:.2f} s: '
+            f'{donations / elapsed:.0f} wpłat/s, '
+            f'{states} powiadomień ({states / elapsed:.0f}/s), '
+            f'nowe wątki: {threading.active_count() - threads}'
+        )
+        if application is self.new_application:
+            self.stdout.write(f'koalescencja: {progress.metrics()}')
+        await asyncio.gather(*[
+            communicator.disconnect() for communicator in communicators
+        ])
@@ -0,0 +1,77 @@
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+
+from src.benchmark import BenchmarkCommand
+from src.rooms.models import Room
+
+User = get_user_model()
+
+BATCH = 10000
+
+
+class Command(BenchmarkCommand):
+    help = 'Measure time and memory of recalculating scores of all rooms'
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--rooms', type=int, default=1000000)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def populate(self, **options):
+        random.seed(0)
+        self.user = User.objects.create(
+            username='benchmark_score', password='!'
+        )
+        today = date.today()
+        rooms = []
+        for num in range(options['rooms']):
+            price = random.randint(100, 10000)
+            collected = random.randint(0, price)
+            rooms.append(Room(
+                receiver=f'receiver{num}', creator=self.user,
+                gift=f'gift{num}', price=price, to_collect=price - collected,
+                collected_total=collected,
+                patron_count=random.randint(0, 50),
+                post_count=random.randint(0, 20),
+                thread_count=random.randint(0, 60),
+                like_total=random.randint(-10, 100),
+                visible=True,
+                date_expires=today + timedelta(days=random.randint(1, 183)),
+            ))
+            if len(rooms) == BATCH:
+                Room.objects.bulk_create(rooms)
+                rooms = []
+        Room.objects.bulk_create(rooms)
+        Observer = Room.observers.through
+        room_ids = Room.objects.filter(creator=self.user).values_list(
+            'id', flat=True
+        )
+        Observer.objects.bulk_create([
+            Observer(room_id=room_id, user_id=self.user.id)
+            for room_id in random.sample(
+                list(room_ids), options['rooms'] // 10
+            )
+        ])
+
+    def run(self, **options):
+        rooms = Room.objects.filter(creator=self.user)
+        self.explain(
+            'Najlepsze zbiórki', Room.objects.order_by_score()[:20]
+        )
+        updated = self.measure_once(
+            f'update_scores (partie po {options["batch_size"]})',
+            lambda: rooms.update_scores(options['batch_size'])
+        )
+        self.stdout.write(f'Zmienione wyniki: {updated}')
+        self.measure_once(
+            'wszystkie zbiórki w pamięci (dla porównania)',
+            lambda: len(list(rooms.only(
+                'id', 'score', 'patron_count', 'collected_total'
+            )))
+        )
+        self.measure(
+            'pierwsza strona order_by_score',
+            lambda: list(Room.objects.order_by_score()[:20])
+        )
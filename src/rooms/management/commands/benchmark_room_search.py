@@ -0,0 +1,69 @@
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+
+from src.benchmark import BenchmarkCommand
+from src.rooms.models import Room
+from src.rooms.search import IcontainsSearchBackend, get_backend
+
+User = get_user_model()
+
+WORDS = [
+    'rower', 'laptop', 'telefon', 'książka', 'wycieczka', 'koncert',
+    'prezent', 'urodziny', 'ślub', 'rocznica', 'mama', 'tata', 'babcia',
+    'szkoła', 'klasa', 'drużyna', 'aparat', 'zegarek', 'gitara', 'namiot',
+]
+# about 5000 words, so a phrase is found in a small part of rooms
+VOCABULARY = [f'{word}{num}' for word in WORDS for num in range(100, 350)]
+PHRASES = ['rower123', 'gitara200', 'urodziny345', 'zegarek150']
+
+
+class Command(BenchmarkCommand):
+    help = 'Compare icontains search of rooms with the search backend'
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--rooms', type=int, default=500000)
+
+    def populate(self, **options):
+        random.seed(0)
+        user = User.objects.create(username='benchmark_search', password='!')
+        today = date.today()
+        rooms = []
+        for num in range(options['rooms']):
+            price = random.randint(100, 10000)
+            rooms.append(Room(
+                receiver=f'{random.choice(VOCABULARY)} {num}',
+                creator=user,
+                gift=' '.join(random.sample(VOCABULARY, 2)),
+                price=price,
+                to_collect=price,
+                description=' '.join(random.choices(VOCABULARY, k=12)),
+                visible=True,
+                date_expires=today + timedelta(days=random.randint(1, 183)),
+            ))
+        Room.objects.bulk_create(rooms)
+        # bulk_create does not send post_save
+        get_backend().update_index(Room.objects.all())
+
+    def run(self, **options):
+        old_backend = IcontainsSearchBackend()
+        backend = get_backend()
+        name = type(backend).__name__
+        phrase = PHRASES[0]
+        self.explain('icontains', Room.objects.search(phrase, old_backend))
+        self.explain(name, Room.objects.search(phrase, backend))
+
+        def first_page(backend):
+            for phrase in PHRASES:
+                rooms = Room.objects.search(phrase, backend)
+                rooms.count()
+                list(rooms.order_by('-search_rank')[:20])
+
+        self.stdout.write(
+            f'Liczba wyników i pierwsza strona dla {len(PHRASES)} fraz:'
+        )
+        old = self.measure('icontains', lambda: first_page(old_backend))
+        new = self.measure(name, lambda: first_page(backend))
+        self.stdout.write(f'Przyspieszenie: {old / new:.1f}x')
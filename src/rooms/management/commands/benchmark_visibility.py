@@ -0,0 +1,112 @@
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Q
+
+from src.benchmark import BenchmarkCommand
+from src.rooms.models import Room, private_rooms_key
+
+User = get_user_model()
+
+
+def old_get_visible(user):
+    """get_visible before the rooms ids of user were cached"""
+    visible_query = Room.objects.filter(visible=True)
+    room_created = user.rooms.all()
+    room_guests = user.guest_rooms.all()
+    return (visible_query | room_created | room_guests).distinct()
+
+
+class Command(BenchmarkCommand):
+    help = 'Compare old and new query of rooms visible for the user'
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--rooms', type=int, default=100000)
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument(
+            '--guests', type=int, default=5,
+            help='number of guests of every private room'
+        )
+        parser.add_argument(
+            '--private', type=float, default=0.3,
+            help='part of rooms which are not visible'
+        )
+
+    def populate(self, **options):
+        random.seed(0)
+        User.objects.bulk_create(
+            [User(username=f'benchmark{num}', password='!')
+             for num in range(options['users'])]
+        )
+        user_ids = list(
+            User.objects
+            .filter(username__startswith='benchmark')
+            .values_list('id', flat=True)
+        )
+        today = date.today()
+        rooms = []
+        for num in range(options['rooms']):
+            price = random.randint(100, 10000)
+            rooms.append(Room(
+                receiver=f'receiver{num}',
+                creator_id=random.choice(user_ids),
+                gift=f'gift{num}',
+                price=price,
+                to_collect=price,
+                visible=random.random() > options['private'],
+                date_expires=today + timedelta(days=random.randint(1, 183)),
+            ))
+        Room.objects.bulk_create(rooms)
+        Guest = Room.guests.through
+        private_ids = Room.objects.filter(visible=False).values_list(
+            'id', flat=True
+        )
+        guests = []
+        for room_id in private_ids.iterator():
+            for user_id in random.sample(user_ids, options['guests']):
+                guests.append(Guest(room_id=room_id, user_id=user_id))
+        Guest.objects.bulk_create(guests)
+        self.users = list(User.objects.filter(id__in=random.sample(
+            user_ids, min(50, len(user_ids))
+        )))
+
+    def run(self, **options):
+        user = self.users[0]
+        self.explain('Stare zapytanie', old_get_visible(user)[:20])
+        self.explain('Nowe zapytanie', Room.objects.get_visible(user)[:20])
+
+        def first_page(get_visible):
+            for user in self.users:
+                rooms = get_visible(user)
+                rooms.count()
+                list(rooms[:20])
+
+        def new_get_visible_cold(user):
+            # only entries of the benchmark, cache can be shared
+            cache.delete(private_rooms_key(user.id))
+            return Room.objects.get_visible(user)
+
+        self.stdout.write(
+            f'Pierwsza strona i liczba zbiórek dla {len(self.users)} '
+            f'użytkowników:'
+        )
+        old = self.measure('stare', lambda: first_page(old_get_visible))
+        cold = self.measure(
+            'nowe (pusty cache)', lambda: first_page(new_get_visible_cold)
+        )
+        warm = self.measure(
+            'nowe', lambda: first_page(Room.objects.get_visible)
+        )
+        self.stdout.write(
+            f'Przyspieszenie: {old / cold:.1f}x (pusty cache), '
+            f'{old / warm:.1f}x'
+        )
+        room = Room.objects.filter(~Q(creator=user), visible=False).first()
+        self.measure('can_see', lambda: [
+            room.can_see(user) for user in self.users
+        ])
+        # users are rolled back, their ids can be used again
+        cache.delete_many([private_rooms_key(user.id) for user in self.users])
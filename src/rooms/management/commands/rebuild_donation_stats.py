@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from src.rooms.models import DonationDailyStats, Room
+
+
+class Command(BaseCommand):
+    help = 'Rebuild daily donation stats of rooms from Donation table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'room_ids', nargs='*', type=int,
+            help='ids of rooms to rebuild. All rooms if empty'
+        )
+
+    def handle(self, *args, **options):
+        rooms = Room.objects.all()
+        if options['room_ids']:
+            rooms = rooms.filter(id__in=options['room_ids'])
+        created = DonationDailyStats.objects.rebuild(rooms)
+        self.stdout.write(self.style.SUCCESS(f'Utworzono {created} wierszy'))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from src.rooms.models import Room
+
+
+class Command(BaseCommand):
+    help = (
+        'Find rooms whose forum counters (post_count, thread_count, '
+        'like_total) differ from the forum and rebuild them'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'room_ids', nargs='*', type=int,
+            help='ids of rooms to check. All rooms if empty'
+        )
+        parser.add_argument(
+            '--check', action='store_true',
+            help='only report rooms with wrong counters, fail if any'
+        )
+
+    def handle(self, *args, **options):
+        rooms = Room.objects.all()
+        if options['room_ids']:
+            rooms = rooms.filter(id__in=options['room_ids'])
+        drift = rooms.engagement_drift().order_by('id').values(
+            'id', 'post_count', 'expected_post_count', 'thread_count',
+            'expected_thread_count', 'like_total', 'expected_like_total'
+        )
+        drift_ids = []
+        for room in drift:
+            drift_ids.append(room['id'])
+            self.stdout.write(
+                f"Zbiórka {room['id']}: "
+                f"posty {room['post_count']} -> "
+                f"{room['expected_post_count']}, "
+                f"wątki {room['thread_count']} -> "
+                f"{room['expected_thread_count']}, "
+                f"polubienia {room['like_total']} -> "
+                f"{room['expected_like_total']}"
+            )
+        if not drift_ids:
+            self.stdout.write(self.style.SUCCESS('Liczniki są poprawne'))
+            return
+        if options['check']:
+            # non-zero exit code, so the check can be run by a monitor
+            raise CommandError(
+                f'Błędne liczniki w {len(drift_ids)} zbiórkach'
+            )
+        updated = Room.objects.filter(id__in=drift_ids).rebuild_engagement()
+        self.stdout.write(self.style.SUCCESS(f'Przeliczono {updated} zbiórek'))
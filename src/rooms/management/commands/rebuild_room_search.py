@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from src.rooms.models import Room
+from src.rooms.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild search index of rooms'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'room_ids', nargs='*', type=int,
+            help='ids of rooms to rebuild. All rooms if empty'
+        )
+
+    def handle(self, *args, **options):
+        rooms = Room.objects.all()
+        if options['room_ids']:
+            rooms = rooms.filter(id__in=options['room_ids'])
+        backend = get_backend()
+        backend.update_index(rooms)
+        self.stdout.write(self.style.SUCCESS(
+            f'Zaktualizowano indeks ({type(backend).__name__})'
+        ))
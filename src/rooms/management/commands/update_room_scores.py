@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from src.rooms.models import Room
+
+
+class Command(BaseCommand):
+    help = 'Recalculate scores of all rooms, run it periodically'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='number of rooms updated by one query'
+        )
+
+    def handle(self, *args, **options):
+        updated = Room.objects.update_scores(options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Zmieniono wynik {updated} zbiórek')
+        )
@@ -0,0 +1,55 @@
+# Generated by Django 2.2.28 on 2026-10-17 06:08
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_counters(apps, schema_editor):
+    Room = apps.get_model('rooms', 'Room')
+    Donation = apps.get_model('rooms', 'Donation')
+    totals = (
+        Donation.objects
+        .order_by()
+        .values('room')
+        .annotate(
+            total=Sum('amount'),
+            num=Count('id'),
+            patrons=Count('user', distinct=True),
+        )
+    )
+    for row in totals:
+        Room.objects.filter(pk=row['room']).update(
+            collected_total=row['total'],
+            donation_count=row['num'],
+            patron_count=row['patrons'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0022_auto_20190704_1923'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='room',
+            options={'ordering': ['-date_expires']},
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='collected_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=11, verbose_name='Zebrano'),
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='donation_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='patron_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-17 06:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0023_room_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['visible', 'is_active', 'date_expires'], name='room_visible_active_expires'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+import django.contrib.postgres.search
+from django.db import migrations
+
+FIELDS = 'receiver, gift, description'
+# configuration of the default SEARCH_CONFIG. Migration does not
+# read settings, run rebuild_room_search after switching to another one.
+CONFIG = 'simple'
+
+
+def create_search_index(apps, schema_editor):
+    """
+    PostgreSQL: GIN index on search_vector,
+    SQLite: FTS5 table with trigram tokenizer (if SQLite supports it)
+    """
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute(
+            "UPDATE rooms_room SET search_vector = "
+            "setweight(to_tsvector(%s::regconfig, COALESCE(gift, '')), 'A') || "
+            "setweight(to_tsvector(%s::regconfig, COALESCE(receiver, '')), 'B') || "
+            "setweight(to_tsvector(%s::regconfig, COALESCE(description, '')), 'C')",
+            [CONFIG, CONFIG, CONFIG]
+        )
+        schema_editor.execute(
+            'CREATE INDEX room_search_vector ON rooms_room '
+            'USING gin (search_vector)'
+        )
+    elif connection.vendor == 'sqlite':
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'CREATE VIRTUAL TABLE rooms_room_search '
+                    f'USING fts5({FIELDS}, tokenize="trigram")'
+                )
+        except Exception:
+            return  # search uses icontains without the table
+        schema_editor.execute(
+            f'INSERT INTO rooms_room_search (rowid, {FIELDS}) '
+            f'SELECT id, {FIELDS} FROM rooms_room'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS room_search_vector')
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS rooms_room_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0024_room_visibility_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
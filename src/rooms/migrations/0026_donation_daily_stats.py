@@ -0,0 +1,55 @@
+# Generated by Django 2.2.28 on 2026-10-17 06:41
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+import django.db.models.deletion
+
+
+def fill_stats(apps, schema_editor):
+    Donation = apps.get_model('rooms', 'Donation')
+    DonationDailyStats = apps.get_model('rooms', 'DonationDailyStats')
+    totals = (
+        Donation.objects
+        .order_by()
+        .values('room', 'date')
+        .annotate(
+            total=Sum('amount'),
+            num=Count('id'),
+            donors=Count('user', distinct=True),
+        )
+    )
+    DonationDailyStats.objects.bulk_create(
+        DonationDailyStats(
+            room_id=row['room'],
+            day=row['date'],
+            amount=row['total'],
+            donation_count=row['num'],
+            donor_count=row['donors'],
+        )
+        for row in totals.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0025_room_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DonationDailyStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=11)),
+                ('donation_count', models.PositiveIntegerField(default=0)),
+                ('donor_count', models.PositiveIntegerField(default=0)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='rooms.Room')),
+            ],
+            options={
+                'unique_together': {('room', 'day')},
+            },
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
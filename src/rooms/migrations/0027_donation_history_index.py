@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-17 06:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0026_donation_daily_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='donation',
+            index=models.Index(fields=['room', 'date', 'id'], name='donation_room_date_id'),
+        ),
+    ]
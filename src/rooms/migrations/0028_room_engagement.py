@@ -0,0 +1,60 @@
+# Generated by Django 2.2.28 on 2026-10-17 07:10
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_engagement(apps, schema_editor):
+    Room = apps.get_model('rooms', 'Room')
+    Post = apps.get_model('forum', 'Post')
+    Thread = apps.get_model('forum', 'Thread')
+    Opinion = apps.get_model('forum', 'Opinion')
+
+    def total(model, field, aggregate):
+        return Coalesce(
+            Subquery(
+                model._default_manager
+                     .filter(**{field: OuterRef('pk')})
+                     .order_by()
+                     .values(field)
+                     .annotate(total=aggregate)
+                     .values('total'),
+                output_field=IntegerField()
+            ),
+            0
+        )
+
+    Room._default_manager.update(
+        post_count=total(Post, 'room', Count('id')),
+        thread_count=total(Thread, 'post__room', Count('id')),
+        like_total=(total(Opinion, 'post__room', Sum('likes'))
+                    + total(Opinion, 'thread__post__room', Sum('likes'))),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0027_donation_history_index'),
+        ('forum', '0017_post_room_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='like_total',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='thread_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_engagement, migrations.RunPython.noop),
+    ]
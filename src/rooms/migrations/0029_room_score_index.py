@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-17 07:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0028_room_engagement'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['-score', '-id'], name='room_score'),
+        ),
+    ]
@@ -1,6 +1,18 @@
 from django.conf import settings
-from django.db import models
-from django.db.models import Count, F, Q, Sum
+from django.contrib.postgres.search import SearchVectorField
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import (
+    BooleanField, Count, DecimalField, Exists, ExpressionWrapper, F,
+    FloatField, IntegerField, OuterRef, Q, Subquery, Sum, Value
+)
+from django.db.models.functions import (
+    Cast, Coalesce, Greatest, TruncMonth, TruncWeek
+)
+from django.db.models.signals import m2m_changed, post_save
+from django.dispatch import receiver
+
+from .search import SEARCH_FIELDS, get_backend
 
 
 class VisibleManager(models.QuerySet):
@@ -11,42 +23,203 @@ class VisibleManager(models.QuerySet):
             room's attribute is_visible == True,
             the creator of room is the user,
             the user is in room's guests
+        Ids of rooms from the last two points are cached per user (see
+        :private_room_ids:) so the query does not join guests and
+        it does not need DISTINCT.
         """
-        visible_query = self.filter(visible=True)
-        room_created = user.rooms.all()
-        room_guests = user.guest_rooms.all()
-        return (visible_query | room_created | room_guests).distinct()
-
-    def summarise_for_list(self):
-        """method used for optimalisation"""
-        return self.prefetch_related('observers').prefetch_related('patrons')
-
-    def search(self, field):
-        """General method used for searching in views"""
-        return self.filter(
-            Q(receiver__icontains=field) |
-            Q(gift__icontains=field) |
-            Q(description__icontains=field)
+        private_ids = private_room_ids(user)
+        return self.filter(Q(visible=True) | Q(id__in=private_ids))
+
+    def summarise_for_list(self, user=None):
+        """
+        Annotate everything the list of rooms needs, so template does
+        not make any query per room:
+            is_observed - True if the user observes the room,
+            activity - see :activity: (list can be ordered by it).
+        Number of patrons and collected money are read from
+        patron_count and collected_total columns.
+        """
+        if user is not None and user.is_authenticated:
+            observed = Room.observers.through.objects.filter(
+                room_id=OuterRef('pk'),
+                user_id=user.id,
+            )
+            is_observed = Exists(observed)
+        else:
+            is_observed = Value(False, output_field=BooleanField())
+        return self.annotate(
+            is_observed=is_observed,
+            activity=activity(),
         )
 
+    def search(self, field, backend=None):
+        """
+        General method used for searching in views. Found rooms are
+        annotated with 'search_rank' (higher is better).
+        :param backend: search backend, by default from :get_backend:
+        """
+        if backend is None:
+            backend = get_backend()
+        return backend.search(self, field)
+
     def most_popular(self):
-        popular = (self
-                   .annotate(collected=F('price')-F('to_collect'))
-                   .order_by('-collected')
-                   )
-        return popular
+        return self.order_by('-collected_total')
 
     def most_patrons(self):
-        num_patrons = (self
-                       .annotate(patrons_number=Count('patrons'))
-                       .exclude(patrons_number=0)
-                       .order_by('-patrons_number')
-                       )
-        return num_patrons
+        return self.filter(patron_count__gt=0).order_by('-patron_count')
 
     def most_to_collect(self):
         return self.order_by('-to_collect')
 
+    def rebuild_counters(self):
+        """
+        Recalculate denormalized donation counters (collected_total,
+        patron_count, donation_count and to_collect) from Donation table.
+        It is a single UPDATE so it can be used for all rooms at once.
+        :return: number of updated rooms
+        """
+        donations = (Donation.objects
+                     .filter(room=OuterRef('pk'))
+                     .order_by()
+                     .values('room'))
+        money = DecimalField(max_digits=11, decimal_places=2)
+        collected = Coalesce(
+            Subquery(
+                donations.annotate(total=Sum('amount')).values('total'),
+                output_field=money
+            ),
+            0,
+            output_field=money
+        )
+        donation_count = Coalesce(
+            Subquery(
+                donations.annotate(num=Count('id')).values('num'),
+                output_field=IntegerField()
+            ),
+            0
+        )
+        patron_count = Coalesce(
+            Subquery(
+                donations.annotate(
+                    num=Count('user', distinct=True)
+                ).values('num'),
+                output_field=IntegerField()
+            ),
+            0
+        )
+        return self.update(
+            collected_total=collected,
+            donation_count=donation_count,
+            patron_count=patron_count,
+            to_collect=Greatest(F('price') - collected, 0, output_field=money)
+        )
+
+    def order_by_score(self):
+        return self.order_by('-score', '-id')
+
+    def update_scores(self, batch_size=1000):
+        """
+        Recalculate score (see Room.calculate_score) of every room.
+        Score is computed by the database with one UPDATE for every
+        :batch_size: rooms (ranges of ids), so memory and the length
+        of transactions do not depend on the number of rooms and
+        unchanged rows are not written. It should be run periodically
+        (update_room_scores command).
+        :return: number of updated rooms
+        """
+        observers = (Room.observers.through.objects
+                     .filter(room_id=OuterRef('pk'))
+                     .order_by()
+                     .values('room_id')
+                     .annotate(num=Count('id'))
+                     .values('num'))
+        new_score = score(Coalesce(
+            Subquery(observers, output_field=IntegerField()), 0
+        ))
+        updated = 0
+        last_id = 0
+        while True:
+            rooms = self.filter(id__gt=last_id).order_by()
+            end = list(
+                rooms.order_by('id')
+                .values_list('id', flat=True)[batch_size - 1:batch_size]
+            )
+            if end:
+                rooms = rooms.filter(id__lte=end[0])
+            updated += (rooms
+                        .exclude(score=new_score)
+                        .update(score=new_score))
+            if not end:
+                return updated
+            last_id = end[0]
+
+    def most_active(self):
+        return self.annotate(activity=activity()).order_by('-activity')
+
+    def add_engagement(self, **changes):
+        """
+        add :changes: to engagement counters (post_count, thread_count,
+        like_total), used by the forum after every write
+        """
+        return self.update(**{
+            field: F(field) + change for field, change in changes.items()
+        })
+
+    def engagement_expected(self):
+        """annotate engagement counters calculated from the forum"""
+        return self.annotate(**{
+            f'expected_{field}': expression
+            for field, expression in engagement_from_forum().items()
+        })
+
+    def engagement_drift(self):
+        """rooms whose engagement counters differ from the forum"""
+        return self.engagement_expected().filter(
+            ~Q(post_count=F('expected_post_count'))
+            | ~Q(thread_count=F('expected_thread_count'))
+            | ~Q(like_total=F('expected_like_total'))
+        )
+
+    def rebuild_engagement(self):
+        """
+        Recalculate engagement counters from the forum with a single
+        UPDATE.
+        :return: number of updated rooms
+        """
+        return self.update(**engagement_from_forum())
+
+
+def engagement_from_forum():
+    """
+    expressions of engagement counters of a room calculated from posts,
+    threads and opinions
+    """
+    from src.forum.models import Opinion, Post, Thread   # forum imports rooms
+
+    def total(queryset, field, aggregate):
+        return Coalesce(
+            Subquery(
+                queryset.filter(**{field: OuterRef('pk')})
+                        .order_by()
+                        .values(field)
+                        .annotate(total=aggregate)
+                        .values('total'),
+                output_field=IntegerField()
+            ),
+            0
+        )
+
+    return {
+        'post_count': total(Post.objects.all(), 'room', Count('id')),
+        'thread_count': total(
+            Thread.objects.all(), 'post__room', Count('id')
+        ),
+        'like_total': (
+            total(Opinion.objects.all(), 'post__room', Sum('likes'))
+            + total(Opinion.objects.all(), 'thread__post__room', Sum('likes'))
+        ),
+    }
+
 
 class Room(models.Model):
     receiver = models.CharField('odbiorca', max_length=50)
@@ -69,6 +242,18 @@ class Room(models.Model):
     date_expires = models.DateField('Data wygaśnięcia')
     is_active = models.BooleanField(default=True)
     score = models.FloatField(default=0)
+    # counters below are maintained by :donate: method
+    collected_total = models.DecimalField(
+        'Zebrano', max_digits=11, decimal_places=2, default=0
+    )
+    patron_count = models.PositiveIntegerField(default=0)
+    donation_count = models.PositiveIntegerField(default=0)
+    # engagement counters are maintained by the forum (see
+    # VisibleManager.add_engagement)
+    post_count = models.PositiveIntegerField(default=0, editable=False)
+    thread_count = models.PositiveIntegerField(default=0, editable=False)
+    like_total = models.IntegerField(default=0, editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
     guests = models.ManyToManyField(
         settings.AUTH_USER_MODEL,
         blank=True,
@@ -90,6 +275,13 @@ class Room(models.Model):
 
     class Meta:
         ordering = ['-date_expires']
+        indexes = [
+            models.Index(
+                fields=['visible', 'is_active', 'date_expires'],
+                name='room_visible_active_expires',
+            ),
+            models.Index(fields=['-score', '-id'], name='room_score'),
+        ]
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
@@ -104,7 +296,7 @@ class Room(models.Model):
 
     @property
     def num_patrons(self):
-        return self.patrons.count()
+        return self.patron_count
 
     def __str__(self):
         return f'{self.receiver} - {self.gift}'
@@ -122,20 +314,35 @@ class Room(models.Model):
         """
         if self.visible:
             return True
-        can_see = list(self.guests.all()) if self.guests.exists() else []
-        can_see.append(self.creator)
-        if user in can_see:
+        if user.is_authenticated and self.creator_id == user.id:
             return True
-        return False
+        return self.id in private_room_ids(user)
+
+    @staticmethod
+    def calculate_score(patron_count, observer_count, collected_total,
+                        activity):
+        """ranking of rooms, :activity: is the forum activity"""
+        return (
+            patron_count * 2
+            + observer_count
+            + float(collected_total) / 1000
+            + activity / 2
+        )
 
     def update_score(self):
-        # It needs more development - unfortunately...
-        # Problem is a recursion when signals
-        patrons_rank = self.patrons.count() * 2
-        observers_rank = self.observers.count()
-        collected_rank = self.collected() / 1000
-        total_rank = patrons_rank + observers_rank + collected_rank
-        self.score = total_rank
+        """
+        Recalculate score of the room from its counters. It is saved
+        with update(), so no signals are sent. Scores of all rooms are
+        recalculated by VisibleManager.update_scores.
+        """
+        self.score = self.calculate_score(
+            self.patron_count,
+            self.observers.count(),
+            self.collected_total,
+            self.post_count + self.thread_count + self.like_total,
+        )
+        Room.objects.filter(pk=self.pk).update(score=self.score)
+        return self.score
 
     def is_visible(self):
         """True if room is visible for everyone else false"""
@@ -149,12 +356,33 @@ class Room(models.Model):
             return {'is_valid': 'false'}
         return {'is_valid': 'true'}
 
+    def save_details(self, fields):
+        """
+        Save :fields: edited by the creator. Counters (changed by
+        donations since the room was loaded) are not overwritten and
+        to_collect is recalculated from the new price. The first
+        UPDATE locks the row, so a donation waits for the transaction.
+        """
+        with transaction.atomic():
+            self.save(update_fields=fields)
+            Room.objects.filter(pk=self.pk).update(to_collect=Greatest(
+                F('price') - F('collected_total'), 0,
+                output_field=DecimalField(max_digits=11, decimal_places=2)
+            ))
+        self.refresh_from_db(fields=[
+            'to_collect', 'collected_total', 'donation_count',
+            'patron_count', 'is_active'
+        ])
+
     def donate(self, data):
         """
         method is responsible for making donation. If donation is
         bigger than amount to collect the room's attribute is_visible
-        will be change to not active. It is not a problem if amount
-        is bigger than to collect attribute.
+        will be change to not active and its notifications are sent
+        after commit. It is not a problem if amount is bigger than to
+        collect attribute.
+        Room's row is locked for the whole transaction and counters are
+        changed with F() expressions so concurrent donations are safe.
         :param data: dictionary for making donations
             {'user': int - required - user who makes the donation,
              'amount': decimal - required - amount of the donation,
@@ -169,24 +397,65 @@ class Room(models.Model):
             return {'error': 'Brak wszystkich danych'}
         date = data.get('date', None)
         comment = data.get('comment', amount)
-        actual_amount = amount if amount < self.to_collect else self.to_collect
-        full_collection = self.to_collect <= amount
-        if full_collection:
-            self.to_collect = 0
-            self.is_active = False
-        else:
-            self.to_collect -= amount
-        donation = Donation(
-            user=user,
-            room=self,
-            date=date,
-            amount=actual_amount,
-            comment=comment
-        )
-        donation.save()
-        self.save()
+        with transaction.atomic():
+            room = Room.objects.select_for_update().get(pk=self.pk)
+            actual_amount = min(amount, room.to_collect)
+            new_patron = not room.donations.filter(user=user).exists()
+            donation = Donation.objects.create(
+                user=user,
+                room=room,
+                date=date,
+                amount=actual_amount,
+                comment=comment
+            )
+            new_donor = new_patron or not room.donations.filter(
+                user=user, date=donation.date
+            ).exclude(pk=donation.pk).exists()
+            self._add_daily_stats(donation, new_donor)
+            counters = {
+                'to_collect': F('to_collect') - actual_amount,
+                'collected_total': F('collected_total') + actual_amount,
+                'donation_count': F('donation_count') + 1,
+                'patron_count': F('patron_count') + int(new_patron),
+            }
+            collected = room.to_collect <= amount
+            if collected:
+                counters['is_active'] = False
+            Room.objects.filter(pk=self.pk).update(**counters)
+            transaction.on_commit(self._update_leaderboards)
+            if collected and room.is_active:
+                self._notify_collected()
+        self.refresh_from_db(fields=[
+            'to_collect', 'collected_total', 'donation_count',
+            'patron_count', 'is_active'
+        ])
         return self
 
+    def _add_daily_stats(self, donation, new_donor):
+        """has to be called in transaction which locks the room"""
+        stats = DonationDailyStats.objects.filter(
+            room_id=self.pk, day=donation.date
+        )
+        updated = stats.update(
+            amount=F('amount') + donation.amount,
+            donation_count=F('donation_count') + 1,
+            donor_count=F('donor_count') + int(new_donor),
+        )
+        if not updated:
+            DonationDailyStats.objects.create(
+                room_id=self.pk, day=donation.date, amount=donation.amount,
+                donation_count=1, donor_count=1,
+            )
+
+    def _notify_collected(self):
+        """has to be called in transaction which closes the room"""
+        from src.notifications.tasks import notify_on_commit  # imports rooms
+        notify_on_commit(self.pk)
+
+    def _update_leaderboards(self):
+        from .leaderboards import update_room   # leaderboards import models
+        update_room(Room.objects.get(pk=self.pk))
+
     def get_patrons(self):
         """
         :return: list of patrons in format [username1, username2, ...]
@@ -198,6 +467,17 @@ class Room(models.Model):
         )
         return patrons
 
+    def get_interested(self):
+        """
+        users who donated to the room or observe it. Subqueries
+        instead of joins, so no DISTINCT is needed.
+        """
+        observers = Room.observers.through.objects.filter(room=self)
+        return self.observers.model.objects.filter(
+            Q(id__in=self.donations.values('user_id'))
+            | Q(id__in=observers.values('user_id'))
+        )
+
     def guest_remove(self, guest_name):
         guest = self.guests.filter(username=guest_name)
         if guest.count() != 1:
@@ -213,28 +493,91 @@ class Room(models.Model):
 
     def collected(self):
         """money which has been already collected"""
-        return self.price - self.to_collect
+        return self.collected_total
 
+    @property
     def all_likes(self):
-        posts = self.posts
-        likes_per_post = posts.data_with_likes()
-        all_likes = likes_per_post.aggregate(Sum('all_likes'))
-        return all_likes
+        """likes of all posts and threads of the room"""
+        return self.like_total
 
+    @property
     def all_comments(self):
-        """
-        method should not be used for all rooms because it
-        will cause a lot of duplicated queries. Use only number
-        for single room is needed.
-        :return: number of all comments and threads for the room
-        """
-        posts = self.posts
-        num_threads = (
-            posts
-            .annotate(num_threads=Count('threads'))
-            .aggregate(Sum(F'num_threads'))
-        )
-        return num_threads
+        """number of all posts and threads of the room"""
+        return self.post_count + self.thread_count
+
+
+def activity():
+    """activity of the room in the forum, used for ordering"""
+    return ExpressionWrapper(
+        F('post_count') + F('thread_count') + F('like_total'),
+        output_field=IntegerField()
+    )
+
+
+def score(observer_count):
+    """database version of Room.calculate_score"""
+    return ExpressionWrapper(
+        Cast('patron_count', FloatField()) * 2
+        + Cast(observer_count, FloatField())
+        + Cast('collected_total', FloatField()) / 1000
+        + Cast(activity(), FloatField()) / 2,
+        output_field=FloatField()
+    )
+
+
+def private_rooms_key(user_id):
+    return f'rooms:private:{user_id}'
+
+
+def private_room_ids(user):
+    """
+    :return: frozenset of ids of rooms created by the user or rooms where
+    the user is a guest. It is cached and removed from cache by signals
+    below whenever the user creates a room or guests are changed.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+    key = private_rooms_key(user.id)
+    room_ids = cache.get(key)
+    if room_ids is None:
+        created = (Room.objects
+                   .filter(creator_id=user.id)
+                   .order_by()
+                   .values_list('id', flat=True))
+        invited = (Room.guests.through.objects
+                   .filter(user_id=user.id)
+                   .order_by()
+                   .values_list('room_id', flat=True))
+        room_ids = frozenset(created.union(invited))
+        cache.set(key, room_ids, settings.PRIVATE_ROOMS_TIMEOUT)
+    return room_ids
+
+
+@receiver(post_save, sender=Room)
+def forget_creator_rooms(sender, instance, created, **kwargs):
+    if created and instance.creator_id:
+        cache.delete(private_rooms_key(instance.creator_id))
+
+
+@receiver(post_save, sender=Room)
+def update_search_index(sender, instance, created, update_fields, **kwargs):
+    if update_fields and not set(update_fields) & set(SEARCH_FIELDS):
+        return
+    get_backend().update_index(Room.objects.filter(pk=instance.pk))
+
+
+@receiver(m2m_changed, sender=Room.guests.through)
+def forget_guest_rooms(sender, instance, action, reverse, pk_set, **kwargs):
+    """guests of the room has changed so their cached rooms are outdated"""
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:     # user.guest_rooms was changed
+        user_ids = [instance.pk]
+    elif action == 'pre_clear':
+        user_ids = list(instance.guests.values_list('id', flat=True))
+    else:
+        user_ids = pk_set
+    cache.delete_many([private_rooms_key(user_id) for user_id in user_ids])
 
 
 class DonationQuerySet(models.QuerySet):
@@ -242,14 +585,16 @@ class DonationQuerySet(models.QuerySet):
     def resume(self):   # will be change
         return 'wiadomość'
 
-    def get_chart_data(self):
-        categories = [1, 2, 3, 4, 5]
-        data = self.values('date').annotate(amount__sum=Sum('amount'))
-        chart_data = {
-            'categories': [x['date'] for x in data],
-            'data': [int(x['amount__sum']) for x in data]
-        }
-        return chart_data
+    def daily_totals(self):
+        """sum, count and distinct donors of donations per room and day"""
+        return (self
+                .order_by()
+                .values('room', 'date')
+                .annotate(
+                    amount=Sum('amount'),
+                    donation_count=Count('id'),
+                    donor_count=Count('user', distinct=True),
+                ))
 
 
 class Donation(models.Model):
@@ -268,11 +613,93 @@ class Donation(models.Model):
     class Meta:
         ordering = ['date', ]
         get_latest_by = ['date', ]
+        indexes = [
+            # history of donations of the room (keyset pagination)
+            models.Index(
+                fields=['room', 'date', 'id'], name='donation_room_date_id'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.room} - {self.amount}'
 
 
+class DonationDailyStatsQuerySet(models.QuerySet):
+    BUCKETS = {
+        'day': None,
+        'week': TruncWeek,
+        'month': TruncMonth,
+    }
+
+    def get_chart_data(self, bucket='day'):
+        """
+        :param bucket: 'day', 'week' or 'month'. Week starts on Monday
+        and it is represented by its first day, month by the first day.
+        :return: {'categories': [date], 'data': [amount as int]}
+        """
+        if bucket not in self.BUCKETS:
+            raise ValueError(f'Unknown bucket: {bucket}')
+        trunc = self.BUCKETS[bucket]
+        if trunc is None:
+            rows = self.order_by('day').values_list('day', 'amount')
+        else:
+            rows = (self
+                    .annotate(period=trunc('day'))
+                    .order_by('period')
+                    .values('period')
+                    .annotate(total=Sum('amount'))
+                    .values_list('period', 'total'))
+        categories, data = [], []
+        for period, amount in rows:
+            categories.append(period)
+            data.append(int(amount))
+        return {'categories': categories, 'data': data}
+
+    def rebuild(self, rooms):
+        """
+        Recalculate stats of the rooms (queryset) from Donation table.
+        Rooms are locked like in Room.donate, so no donation is lost.
+        :return: number of created rows
+        """
+        with transaction.atomic():
+            list(rooms.select_for_update().values_list('id', flat=True))
+            self.filter(room__in=rooms).delete()
+            totals = Donation.objects.filter(room__in=rooms).daily_totals()
+            return len(self.bulk_create(
+                DonationDailyStats(
+                    room_id=row['room'],
+                    day=row['date'],
+                    amount=row['amount'],
+                    donation_count=row['donation_count'],
+                    donor_count=row['donor_count'],
+                )
+                for row in totals.iterator()
+            ))
+
+
+class DonationDailyStats(models.Model):
+    """
+    Daily rollup of donations of the room used by the chart. It is
+    updated in the donation transaction (see Room.donate) and it can be
+    rebuilt with rebuild_donation_stats command.
+    """
+    room = models.ForeignKey(
+        Room, on_delete=models.CASCADE, related_name='daily_stats'
+    )
+    day = models.DateField()
+    amount = models.DecimalField(max_digits=11, decimal_places=2, default=0)
+    donation_count = models.PositiveIntegerField(default=0)
+    donor_count = models.PositiveIntegerField(default=0)
+
+    objects = DonationDailyStatsQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ['room', 'day']
+
+    def __str__(self):
+        return f'{self.room} - {self.day}'
+
+
 class Message(models.Model):
     sender = models.ForeignKey(
         settings.AUTH_USER_MODEL,
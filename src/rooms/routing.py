@@ -3,5 +3,5 @@ from django.urls import path
 from . import consumers
 
 websocket_urlpatterns = [
-    path('ws/room/<room_id>/donate/', consumers.DonateConsumer),
+    path('ws/room/<int:room_id>/donate/', consumers.DonateConsumer),
 ]
@@ -0,0 +1,41 @@
+"""
+Full-text search of rooms. Backend is chosen by ROOM_SEARCH_BACKEND
+setting or, when it is empty, by the database:
+    PostgreSQL - precomputed search_vector column with GIN index,
+    SQLite - FTS5 table with trigram tokenizer (rooms_room_search),
+    others - icontains over receiver, gift and description.
+Index is refreshed by :update_index: after a room is saved.
+"""
+from django.conf import settings
+
+from src import search
+
+SEARCH_FIELDS = ['receiver', 'gift', 'description']
+
+BACKENDS = {
+    'postgresql': 'src.rooms.search.PostgresSearchBackend',
+    'sqlite': 'src.rooms.search.TrigramSearchBackend',
+}
+DEFAULT_BACKEND = 'src.rooms.search.IcontainsSearchBackend'
+
+
+def get_backend():
+    return search.get_backend(
+        settings.ROOM_SEARCH_BACKEND, BACKENDS, DEFAULT_BACKEND
+    )
+
+
+class IcontainsSearchBackend(search.IcontainsSearchBackend):
+    """search used before full-text search"""
+    fields = SEARCH_FIELDS
+
+
+class PostgresSearchBackend(search.PostgresSearchBackend):
+    fields = SEARCH_FIELDS
+    weights = {'gift': 'A', 'receiver': 'B', 'description': 'C'}
+
+
+class TrigramSearchBackend(search.TrigramSearchBackend):
+    fields = SEARCH_FIELDS
+    table = 'rooms_room_search'
+    weights = {'gift': 10.0, 'receiver': 4.0, 'description': 1.0}
@@ -0,0 +1,10 @@
+"""Celery tasks of rooms, run periodically by celery beat."""
+from celery import shared_task
+
+from .models import Room
+
+
+@shared_task
+def update_room_scores(batch_size=1000):
+    """:return: number of updated rooms, see VisibleManager.update_scores"""
+    return Room.objects.update_scores(batch_size)
@@ -1,6 +1,9 @@
 import datetime
+import re
 
 from django import template
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
 
 register = template.Library()
 
@@ -12,3 +15,18 @@ def time_left(value):
     if left > datetime.timedelta(days=1):
         return f'{left.days} dni'
     return f'{left.seconds // (60 * 60)} godzin i {left.seconds % (60 * 60)} sekund'
+
+
+@register.filter
+def highlight(value, phrase):
+    """wrap words of the searched phrase in <mark>. Text is escaped"""
+    words = [re.escape(word) for word in str(phrase or '').split()]
+    if not words:
+        return value
+    pattern = re.compile('({})'.format('|'.join(words)), re.IGNORECASE)
+    parts = pattern.split(str(value))
+    # odd parts are matches of the pattern
+    return mark_safe(''.join(
+        f'<mark>{escape(part)}</mark>' if num % 2 else escape(part)
+        for num, part in enumerate(parts)
+    ))
@@ -29,3 +29,12 @@ def url_replace(request, field, value):
     query_string[field] = value
 
     return query_string.urlencode()
+
+
+@register.simple_tag
+def cursor_url(request, cursor, param='cursor'):
+    """query string of the page with the cursor (keyset pagination)"""
+    query_string = request.GET.copy()
+    query_string.pop('page', None)
+    query_string[param] = cursor
+    return query_string.urlencode()
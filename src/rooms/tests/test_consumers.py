@@ -0,0 +1,314 @@
+import asyncio
+import threading
+import time
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+
+from src.consumers import BroadcastCoalescer
+from src.layers import LocalChannelLayer
+from src.ratelimit import lock_key, take_token
+from src.rooms.consumers import DonateConsumer
+from src.rooms.consumers import progress
+from src.rooms.models import Donation, Room
+from src.rooms.routing import websocket_urlpatterns
+
+User = get_user_model()
+
+IN_MEMORY_LAYER = {
+    'default': {'BACKEND': 'src.layers.LocalChannelLayer'}
+}
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYER)
+class DonateConsumerTest(TransactionTestCase):
+    """donations run in other threads, so data has to be committed"""
+    fixtures = ['src/rooms/tests/fixtures.json']
+
+    def setUp(self):
+        self.user = User.objects.get(username='testuser')
+        self.room = Room.objects.get(gift='gift1')
+        # rooms are loaded again with the same ids
+        progress.reset()
+        cache.clear()   # token buckets
+
+    async def connect(self):
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns),
+            f'/ws/room/{self.room.id}/donate/'
+        )
+        communicator.scope['user'] = self.user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    def test_donation_is_sent_to_every_socket(self):
+        async def donate():
+            donor = await self.connect()
+            watcher = await self.connect()
+            await donor.send_json_to({'amount': '100', 'comment': 'c'})
+            state = await watcher.receive_json_from()
+            # answer and the new state of the room in any order
+            received = [
+                await donor.receive_json_from(),
+                await donor.receive_json_from(),
+            ]
+            self.assertIn(state, received)
+            self.assertIn({'is_valid': 'true'}, received)
+            await donor.disconnect()
+            await watcher.disconnect()
+            return state
+
+        state = async_to_sync(donate)()
+        self.room.refresh_from_db()
+        self.assertEqual(state, {
+            'to_collect': str(self.room.to_collect),
+            'collected': str(self.room.collected()),
+            'percent_got': str(self.room.percent_got),
+            'sequence': 1,
+        })
+        self.assertTrue(Donation.objects.filter(
+            room=self.room, user=self.user, amount=100
+        ).exists())
+
+    def test_invalid_donation(self):
+        async def donate():
+            donor = await self.connect()
+            await donor.send_json_to({'amount': '0'})
+            response = await donor.receive_json_from()
+            await donor.disconnect()
+            return response
+
+        response = async_to_sync(donate)()
+        self.assertEqual(response['is_valid'], 'false')
+        self.assertIn('amount', response['errors'])
+        self.assertFalse(Donation.objects.filter(room=self.room).exists())
+
+    def test_disconnect_leaves_group(self):
+        async def connect_and_leave():
+            communicator = await self.connect()
+            await communicator.disconnect()
+
+        async_to_sync(connect_and_leave)()
+        groups = get_channel_layer().groups
+        self.assertFalse(groups.get(f'room_{self.room.id}'))
+
+    def test_burst_of_donations_is_one_message(self):
+        async def donate():
+            donor = await self.connect()
+            watcher = await self.connect()
+            for _ in range(5):
+                await donor.send_json_to({'amount': '10'})
+            state = await watcher.receive_json_from()
+            nothing = await watcher.receive_nothing(0.2)
+            await donor.disconnect()
+            await watcher.disconnect()
+            return state, nothing
+
+        with mock.patch.object(progress, 'window', 0.5):
+            state, nothing = async_to_sync(donate)()
+        self.assertEqual(state['sequence'], 5)
+        self.assertEqual(state['collected'], '50.00')
+        self.assertTrue(nothing)
+
+    @override_settings(DONATION_RATE_LIMITS={'user': (0.01, 2)})
+    def test_too_fast_donations_are_rejected(self):
+        async def donate():
+            donor = await self.connect()
+            for _ in range(3):
+                await donor.send_json_to({'amount': '10'})
+            answers = []
+            while len(answers) < 3:
+                message = await donor.receive_json_from()
+                if 'is_valid' in message:
+                    answers.append(message)
+            await donor.disconnect()
+            return answers
+
+        answers = async_to_sync(donate)()
+        self.assertEqual(answers[:2], [{'is_valid': 'true'}] * 2)
+        self.assertEqual(answers[2]['is_valid'], 'false')
+        self.assertEqual(
+            answers[2]['errors'],
+            {'__all__': [DonateConsumer.rate_limited_message]}
+        )
+        self.assertGreater(answers[2]['retry_after'], 0)
+        self.assertEqual(Donation.objects.filter(room=self.room).count(), 2)
+
+    @override_settings(CONSUMER_QUEUE_SIZE=1)
+    def test_frame_over_full_queue_is_rejected(self):
+        async def slow_donation(consumer, content):
+            await asyncio.sleep(0.5)
+
+        async def donate():
+            donor = await self.connect()
+            for _ in range(3):
+                await donor.send_json_to({'amount': '10'})
+            response = await donor.receive_json_from()
+            await donor.disconnect()
+            return response
+
+        with mock.patch.object(DonateConsumer, 'handle_json', slow_donation):
+            response = async_to_sync(donate)()
+        self.assertEqual(response, {
+            'is_valid': 'false',
+            'errors': {'__all__': [DonateConsumer.queue_full_message]},
+        })
+
+
+class TakeTokenTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_bucket_is_refilled(self):
+        bucket = [('user', 1, 2)]
+        self.assertEqual(take_token(bucket, now=0), 0)
+        self.assertEqual(take_token(bucket, now=0), 0)
+        self.assertEqual(take_token(bucket, now=0), 1)
+        self.assertEqual(take_token(bucket, now=0.5), 0.5)
+        self.assertEqual(take_token(bucket, now=1), 0)
+
+    def test_token_is_taken_only_when_every_bucket_has_one(self):
+        user, room = ('user', 1, 1), ('room', 1, 1)
+        self.assertEqual(take_token([user], now=0), 0)
+        self.assertEqual(take_token([user, room], now=0), 1)
+        # room bucket is still full
+        self.assertEqual(take_token([room], now=0), 0)
+
+    def test_concurrent_takers(self):
+        bucket = [('user', 0.01, 5)]
+        barrier = threading.Barrier(20)
+        results = []
+
+        # threads have their own cache objects of the same class
+        backend = type(caches['default'])
+        get_many = backend.get_many
+
+        def slow_get_many(self, keys):
+            # a cache over the network, others read before we write
+            states = get_many(self, keys)
+            time.sleep(0.01)
+            return states
+
+        def take():
+            barrier.wait()
+            results.append(take_token(bucket, now=0))
+
+        threads = [threading.Thread(target=take) for _ in range(20)]
+        with mock.patch.object(backend, 'get_many', slow_get_many):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(results.count(0), 5)
+
+    def test_busy_bucket(self):
+        cache.add(lock_key('user'), 1)
+        with mock.patch('src.ratelimit.time.sleep'):
+            self.assertGreater(take_token([('user', 1, 1)], now=0), 0)
+        # the token was not taken
+        cache.delete(lock_key('user'))
+        self.assertEqual(take_token([('user', 1, 1)], now=0), 0)
+
+
+class FakeChannelLayer:
+    def __init__(self):
+        self.sent = []
+
+    async def group_send(self, group, message):
+        self.sent.append((group, message))
+
+
+class BroadcastCoalescerTest(SimpleTestCase):
+    def publish(self, coalescer, layer, *sequences):
+        async def publish():
+            for sequence in sequences:
+                await coalescer.publish(
+                    layer, 'room_1', {'sequence': sequence}
+                )
+            await asyncio.sleep(coalescer.window * 2)
+
+        async_to_sync(publish)()
+
+    def test_newest_message_is_sent(self):
+        coalescer = BroadcastCoalescer(window=0.01)
+        layer = FakeChannelLayer()
+        self.publish(coalescer, layer, 1, 3, 2)
+        self.assertEqual(layer.sent, [('room_1', {'sequence': 3})])
+        self.assertEqual(
+            coalescer.metrics(), {'published': 3, 'sent': 1, 'saved': 2}
+        )
+
+    def test_stale_message_is_dropped(self):
+        coalescer = BroadcastCoalescer(window=0.01)
+        layer = FakeChannelLayer()
+        self.publish(coalescer, layer, 3)
+        self.publish(coalescer, layer, 2)
+        self.publish(coalescer, layer, 4)
+        self.assertEqual(
+            [message['sequence'] for _, message in layer.sent], [3, 4]
+        )
+        self.assertEqual(coalescer.metrics()['saved'], 1)
+
+    def test_sequences_of_old_groups_are_forgotten(self):
+        coalescer = BroadcastCoalescer(window=0.01, max_groups=2)
+        layer = FakeChannelLayer()
+
+        async def publish():
+            for group in ['room_1', 'room_2', 'room_2', 'room_3', 'room_1']:
+                await coalescer.publish(layer, group, {'sequence': 1})
+                await asyncio.sleep(coalescer.window * 2)
+
+        async_to_sync(publish)()
+        self.assertEqual(list(coalescer.last_sent), ['room_3', 'room_1'])
+        # stale message of room_2 is dropped, room_1 was forgotten
+        self.assertEqual(
+            [group for group, _ in layer.sent],
+            ['room_1', 'room_2', 'room_3', 'room_1']
+        )
+
+
+class LocalChannelLayerTest(SimpleTestCase):
+    def test_group_send(self):
+        layer = LocalChannelLayer(capacity=1)
+
+        async def send():
+            channels = [await layer.new_channel() for _ in range(3)]
+            for channel in channels:
+                await layer.group_add('room_1', channel)
+            await layer.send(channels[0], {'type': 'first'})
+            message = {'type': 'chat_message', 'data': [1]}
+            await layer.group_send('room_1', message)
+            message['data'].append(2)
+            return [
+                await layer.receive(channel) for channel in channels
+            ]
+
+        received = async_to_sync(send)()
+        # the first channel was full
+        self.assertEqual(received[0], {'type': 'first'})
+        self.assertEqual(
+            received[1:], [{'type': 'chat_message', 'data': [1]}] * 2
+        )
+
+    def test_expired_channel_leaves_groups(self):
+        layer = LocalChannelLayer(expiry=0, clean_interval=60)
+
+        async def send():
+            channel = await layer.new_channel()
+            await layer.group_add('room_1', channel)
+            await layer.group_send('room_1', {'type': 'chat_message'})
+            await asyncio.sleep(0.01)
+            layer._clean_expired()      # not yet, it was cleaned now
+            in_group = bool(layer.groups.get('room_1'))
+            layer.cleaned = 0
+            layer._clean_expired()
+            return in_group, bool(layer.groups.get('room_1'))
+
+        self.assertEqual(async_to_sync(send)(), (True, False))
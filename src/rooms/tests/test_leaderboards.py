@@ -0,0 +1,107 @@
+from datetime import datetime
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from src.rooms import leaderboards
+from src.rooms.models import Room
+
+User = get_user_model()
+
+
+@override_settings(LEADERBOARD_SIZE=2)
+class LeaderboardsTest(TestCase):
+    fixtures = ['src/rooms/tests/fixtures.json']
+
+    def setUp(self):
+        leaderboards.clear()
+        self.user1 = User.objects.get(username='testuser')
+        self.user2 = User.objects.get(username='testuser2')
+        self.room1 = Room.objects.get(gift='gift1')
+        self.room2 = Room.objects.get(gift='gift2')
+        self.room1.donate({'user': self.user1, 'amount': 100})
+        self.room2.donate({'user': self.user1, 'amount': 200})
+        self.room2.donate({'user': self.user2, 'amount': 100})
+
+    def ids(self, name):
+        board = leaderboards.get_leaderboards()[name]
+        return [row['id'] for row in board]
+
+    def test_compute(self):
+        first, second = self.room2.id, self.room1.id
+        self.assertEqual(self.ids('most_popular'), [first, second])
+        self.assertEqual(self.ids('most_patrons'), [first, second])
+        self.assertEqual(self.ids('most_to_collect'), [second, first])
+
+    def test_private_rooms_are_not_ranked(self):
+        room3 = Room.objects.get(gift='gift3')
+        room3.donate({'user': self.user1, 'amount': 500})
+        self.assertNotIn(room3.id, self.ids('most_popular'))
+
+    def test_cached(self):
+        leaderboards.get_leaderboards()
+        with self.assertNumQueries(0):
+            leaderboards.get_leaderboards()
+
+    def test_update_after_donation(self):
+        leaderboards.get_leaderboards()
+        self.room1.donate({'user': self.user2, 'amount': 500})
+        leaderboards.update_room(self.room1)
+        popular = cache.get(leaderboards.cache_key('most_popular'))
+        self.assertEqual(popular[0]['id'], self.room1.id)
+        self.assertEqual(popular[0]['collected_total'], 600)
+        self.assertEqual(len(popular), 2)
+
+    def test_update_during_other_update_clears_rankings(self):
+        leaderboards.get_leaderboards()
+        # another process is updating the rankings
+        cache.add(leaderboards.LOCK_KEY, True)
+        self.room1.donate({'user': self.user2, 'amount': 500})
+        leaderboards.update_room(self.room1)
+        self.assertIsNone(cache.get(leaderboards.cache_key('most_popular')))
+        cache.delete(leaderboards.LOCK_KEY)
+        self.assertEqual(self.ids('most_popular')[0], self.room1.id)
+
+    def test_ranking_written_before_clear_is_not_read(self):
+        number = leaderboards.generation()
+        leaderboards.clear()
+        cache.set(leaderboards.cache_key('most_popular', number), [])
+        self.assertEqual(len(self.ids('most_popular')), 2)
+
+    def test_new_room_enters_full_ranking(self):
+        leaderboards.get_leaderboards()
+        room = Room.objects.create(
+            receiver='receiver4', gift='gift4', price=5000,
+            description='test', to_collect=5000, visible=True,
+            date_expires=datetime(2019, 6, 6)
+        )
+        room.donate({'user': self.user1, 'amount': 1000})
+        leaderboards.update_room(room)
+        self.assertEqual(self.ids('most_popular'), [room.id, self.room2.id])
+
+    def test_closed_room_is_removed(self):
+        leaderboards.get_leaderboards()
+        self.room2.is_active = False
+        self.room2.save()
+        leaderboards.update_room(self.room2)
+        self.assertEqual(self.ids('most_popular'), [self.room1.id])
+
+    def test_room_dropping_from_full_ranking(self):
+        leaderboards.get_leaderboards()
+        self.room1.donate({'user': self.user2, 'amount': 850})
+        leaderboards.update_room(self.room1)
+        # room1 has 50 to collect now and it is the last one so
+        # cached ranking is removed and computed again
+        key = leaderboards.cache_key('most_to_collect')
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(
+            self.ids('most_to_collect'),
+            [self.room2.id, self.room1.id]
+        )
+
+    def test_list_view_context(self):
+        response = self.client.get(reverse('rooms:list'))
+        popular = response.context['most_popular']
+        self.assertEqual(popular[0]['gift'], 'gift2')
@@ -1,10 +1,21 @@
+import threading
 from datetime import datetime
+from decimal import Decimal
+from io import StringIO
 
 from django.contrib.auth import get_user_model
-from django.db.models import Count, Sum
-from django.test import TestCase
-
-from src.rooms.models import Donation, Room
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Count, F, Sum
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+
+from src.forum.models import Post, Thread
+from src.rooms.models import (
+    Donation, DonationDailyStats, Room, private_room_ids
+)
+from src.rooms.tasks import update_room_scores
 
 User = get_user_model()
 
@@ -13,6 +24,7 @@ class RoomTransactionModelTest(TestCase):
     fixtures = ['src/rooms/tests/fixtures.json', ]
 
     def setUp(self):
+        cache.clear()
         self.user1 = User.objects.get(username='testuser')
         self.user2 = User.objects.get(username='testuser2')
         self.user3 = User.objects.get(username='testuser3')
@@ -128,6 +140,40 @@ class RoomTransactionModelTest(TestCase):
         query = Room.objects.get_visible(self.user2)
         self.assertTrue(room3 in query)
 
+    def test_get_visible_after_guest_removed(self):
+        room = Room.objects.get(gift='gift3')
+        room.guests.add(self.user2)
+        self.assertTrue(
+            Room.objects.get_visible(self.user2).filter(id=room.id)
+        )
+        room.guests.remove(self.user2)
+        self.assertFalse(
+            Room.objects.get_visible(self.user2).filter(id=room.id)
+        )
+        self.user2.guest_rooms.add(room)
+        self.assertTrue(room.can_see(self.user2))
+        room.guests.clear()
+        self.assertFalse(room.can_see(self.user2))
+
+    def test_get_visible_anonymous(self):
+        query = Room.objects.get_visible(AnonymousUser())
+        self.assertFalse(query.filter(visible=False).exists())
+        self.assertEqual(
+            query.count(), Room.objects.filter(visible=True).count()
+        )
+
+    def test_private_room_ids_cached(self):
+        room = Room.objects.get(gift='gift3')
+        room.guests.add(self.user2)
+        expected = {room.id}
+        self.assertEqual(private_room_ids(self.user2), expected)
+        private_room_ids(self.user1)
+        with self.assertNumQueries(0):
+            self.assertEqual(private_room_ids(self.user2), expected)
+            self.assertTrue(room.can_see(self.user2))
+            self.assertTrue(room.can_see(self.user1))
+            self.assertFalse(room.can_see(AnonymousUser()))
+
     def test_get_patrons(self):
         room3 = Room.objects.get(receiver='receiver2')
         patrons = room3.get_patrons()
@@ -171,3 +217,270 @@ class DonationModelTest(TestCase):
         donation = Donation.objects.first()
         expected = f'{donation.room} - {donation.amount}'
         self.assertEqual(str(donation), expected)
+
+
+class RoomCountersTest(TestCase):
+    fixtures = ['src/rooms/tests/fixtures.json']
+
+    def setUp(self):
+        self.user1 = User.objects.get(username='testuser')
+        self.user2 = User.objects.get(username='testuser2')
+        self.room = Room.objects.get(gift='gift1')
+
+    def test_counters_after_donations(self):
+        self.room.donate({'user': self.user1, 'amount': 100})
+        self.room.donate({'user': self.user1, 'amount': 200})
+        self.room.donate({'user': self.user2, 'amount': 300})
+        room = Room.objects.get(gift='gift1')
+        self.assertEqual(room.collected_total, 600)
+        self.assertEqual(room.to_collect, 400)
+        self.assertEqual(room.donation_count, 3)
+        self.assertEqual(room.patron_count, 2)
+        self.assertEqual(room.collected(), 600)
+
+    def test_donation_bigger_than_to_collect(self):
+        self.room.donate({'user': self.user1, 'amount': 1500})
+        room = Room.objects.get(gift='gift1')
+        self.assertEqual(room.collected_total, 1000)
+        self.assertEqual(room.to_collect, 0)
+        self.assertFalse(room.is_active)
+
+    def test_rebuild_counters_command(self):
+        self.room.donate({'user': self.user1, 'amount': 100})
+        self.room.donate({'user': self.user2, 'amount': 300})
+        Room.objects.update(
+            collected_total=0, patron_count=0, donation_count=0,
+            to_collect=F('price')
+        )
+        call_command('rebuild_room_counters', stdout=StringIO())
+        room = Room.objects.get(gift='gift1')
+        self.assertEqual(room.collected_total, 400)
+        self.assertEqual(room.to_collect, 600)
+        self.assertEqual(room.donation_count, 2)
+        self.assertEqual(room.patron_count, 2)
+        empty_room = Room.objects.get(gift='gift2')
+        self.assertEqual(empty_room.collected_total, 0)
+        self.assertEqual(empty_room.to_collect, empty_room.price)
+
+
+class RoomEngagementTest(TestCase):
+    fixtures = ['src/rooms/tests/fixtures.json']
+
+    def setUp(self):
+        self.user1 = User.objects.get(username='testuser')
+        self.user2 = User.objects.get(username='testuser2')
+        self.room = Room.objects.get(gift='gift1')
+        self.post = Post.objects.create(
+            room=self.room, author=self.user1, subject='s', content='c'
+        )
+        self.thread = Thread.objects.create(
+            author=self.user1, post=self.post, subject='s', content='c'
+        )
+        Thread.objects.create(
+            author=self.user1, post=self.post, subject='s', content='c',
+            parent=self.thread
+        )
+        self.post.add_like(self.user1)
+        self.thread.add_like(self.user1)
+        self.thread.add_like(self.user2)
+
+    def test_counters(self):
+        room = Room.objects.get(pk=self.room.pk)
+        self.assertEqual(room.post_count, 1)
+        self.assertEqual(room.thread_count, 2)
+        self.assertEqual(room.all_likes, 3)
+        self.assertEqual(room.all_comments, 3)
+        self.thread.add_like(self.user2)
+        self.thread.delete()
+        room = Room.objects.get(pk=self.room.pk)
+        self.assertEqual(room.thread_count, 0)
+        self.assertEqual(room.like_total, 1)
+        self.post.delete()
+        room = Room.objects.get(pk=self.room.pk)
+        self.assertEqual(room.all_comments, 0)
+        self.assertEqual(room.like_total, 0)
+        self.assertFalse(Room.objects.engagement_drift().exists())
+
+    def test_most_active(self):
+        self.assertEqual(Room.objects.most_active().first(), self.room)
+
+    def test_rebuild_engagement_command(self):
+        Room.objects.filter(pk=self.room.pk).update(
+            post_count=5, thread_count=0, like_total=-1
+        )
+        self.assertEqual(
+            list(Room.objects.engagement_drift()), [self.room]
+        )
+        with self.assertRaises(CommandError):
+            call_command(
+                'rebuild_room_engagement', '--check', stdout=StringIO()
+            )
+        call_command('rebuild_room_engagement', stdout=StringIO())
+        room = Room.objects.get(pk=self.room.pk)
+        self.assertEqual(room.post_count, 1)
+        self.assertEqual(room.thread_count, 2)
+        self.assertEqual(room.like_total, 3)
+        self.assertFalse(Room.objects.engagement_drift().exists())
+
+
+class RoomScoreTest(TestCase):
+    fixtures = ['src/rooms/tests/fixtures.json']
+
+    def setUp(self):
+        self.user1 = User.objects.get(username='testuser')
+        self.user2 = User.objects.get(username='testuser2')
+        self.room = Room.objects.get(gift='gift1')
+
+    def test_update_score(self):
+        self.room.donate({'user': self.user1, 'amount': 500})
+        self.room.observers.add(self.user2)
+        Post.objects.create(
+            room=self.room, author=self.user1, subject='s', content='c'
+        )
+        self.room.refresh_from_db()
+        # 1 patron, 1 observer, 500 collected, 1 post
+        self.assertEqual(self.room.update_score(), 2 + 1 + 0.5 + 0.5)
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.score, 4)
+
+    def test_update_scores_in_batches(self):
+        self.room.donate({'user': self.user1, 'amount': 1000})
+        other = Room.objects.get(gift='gift2')
+        other.observers.add(self.user1)
+        with self.assertNumQueries(4):
+            # end of the range and UPDATE for both batches of 3 rooms
+            updated = Room.objects.update_scores(batch_size=2)
+        self.assertEqual(updated, 2)
+        expected = {}
+        for room in Room.objects.all():
+            expected[room.pk] = room.score
+            self.assertEqual(room.update_score(), room.score)
+        self.assertEqual(
+            list(Room.objects.order_by_score().values_list('pk', flat=True)),
+            sorted(expected, key=lambda pk: (-expected[pk], -pk))
+        )
+        self.assertEqual(Room.objects.update_scores(), 0)
+
+    def test_update_room_scores_task(self):
+        self.room.donate({'user': self.user1, 'amount': 1000})
+        self.assertEqual(update_room_scores.apply().get(), 1)
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.score, self.room.update_score())
+
+
+class DonationDailyStatsTest(TestCase):
+    fixtures = ['src/rooms/tests/fixtures.json']
+
+    def setUp(self):
+        self.user1 = User.objects.get(username='testuser')
+        self.user2 = User.objects.get(username='testuser2')
+        self.room = Room.objects.get(gift='gift1')
+
+    def stats(self):
+        return list(self.room.daily_stats.values_list(
+            'day', 'amount', 'donation_count', 'donor_count'
+        ))
+
+    def test_updated_by_donation(self):
+        self.room.donate({'user': self.user1, 'amount': 100})
+        self.room.donate({'user': self.user1, 'amount': 200})
+        self.room.donate({'user': self.user2, 'amount': 50})
+        today = datetime.now().date()
+        self.assertEqual(self.stats(), [(today, 350, 3, 2)])
+
+    def test_rebuild_command(self):
+        self.room.donate({'user': self.user1, 'amount': 100})
+        self.room.donate({'user': self.user2, 'amount': 50})
+        Donation.objects.create(user=self.user1, room=self.room, amount=20)
+        Donation.objects.filter(amount=20).update(
+            date=datetime(2019, 6, 6).date()
+        )
+        call_command('rebuild_donation_stats', stdout=StringIO())
+        today = datetime.now().date()
+        self.assertEqual(sorted(self.stats()), [
+            (datetime(2019, 6, 6).date(), 20, 1, 1),
+            (today, 150, 2, 2),
+        ])
+
+    def test_chart_buckets(self):
+        room = self.room
+        for day, amount in (((2019, 6, 3), 10), ((2019, 6, 9), 20),
+                            ((2019, 6, 10), 30), ((2019, 7, 1), 40)):
+            DonationDailyStats.objects.create(
+                room=room, day=datetime(*day).date(), amount=amount,
+                donation_count=1, donor_count=1,
+            )
+        stats = room.daily_stats.all()
+        self.assertEqual(stats.get_chart_data()['data'], [10, 20, 30, 40])
+        week = stats.get_chart_data('week')
+        self.assertEqual(week['data'], [30, 30, 40])
+        self.assertEqual(
+            week['categories'],
+            [datetime(2019, 6, 3).date(), datetime(2019, 6, 10).date(),
+             datetime(2019, 7, 1).date()]
+        )
+        self.assertEqual(stats.get_chart_data('month')['data'], [60, 40])
+        with self.assertRaises(ValueError):
+            stats.get_chart_data('year')
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentDonationTest(TransactionTestCase):
+    """many threads donate to the same room at the same time"""
+    num_threads = 20
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(username=f'patron{num}', password='12345')
+            for num in range(5)
+        ]
+
+    def make_room(self, price):
+        return Room.objects.create(
+            receiver='receiver1', gift='gift1', price=price,
+            description='test', to_collect=price, visible=True,
+            date_expires=datetime(2019, 6, 6)
+        )
+
+    def donate_concurrently(self, room, amount):
+        barrier = threading.Barrier(self.num_threads)
+        errors = []
+
+        def donate(user):
+            try:
+                barrier.wait()
+                Room.objects.get(pk=room.pk).donate(
+                    {'user': user, 'amount': amount}
+                )
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=donate, args=(self.users[num % 5],))
+            for num in range(self.num_threads)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        room.refresh_from_db()
+        return room
+
+    def test_no_lost_updates(self):
+        room = self.donate_concurrently(self.make_room(1000), Decimal(10))
+        self.assertEqual(room.to_collect, 800)
+        self.assertEqual(room.collected_total, 200)
+        self.assertEqual(room.donation_count, self.num_threads)
+        self.assertEqual(room.patron_count, 5)
+        self.assertTrue(room.is_active)
+
+    def test_never_collects_more_than_price(self):
+        room = self.donate_concurrently(self.make_room(100), Decimal(10))
+        collected = room.donations.aggregate(Sum('amount'))['amount__sum']
+        self.assertEqual(collected, 100)
+        self.assertEqual(room.collected_total, 100)
+        self.assertEqual(room.to_collect, 0)
+        self.assertFalse(room.is_active)
@@ -0,0 +1,123 @@
+from datetime import date, timedelta
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.template import Context, Template
+from django.test import TestCase
+from django.urls import reverse
+
+from src.rooms.models import Room
+from src.rooms.search import (
+    IcontainsSearchBackend, PostgresSearchBackend, TrigramSearchBackend
+)
+
+User = get_user_model()
+
+
+class SearchBackendMixin:
+    backend_class = None
+
+    def setUp(self):
+        self.backend = self.backend_class()
+        user = User.objects.create_user(username='searcher', password='pass')
+        expires = date.today() + timedelta(days=10)
+        self.bike = Room.objects.create(
+            receiver='Kasia', creator=user, gift='Rower górski',
+            price=1000, to_collect=1000, visible=True, date_expires=expires,
+            description='Na urodziny',
+        )
+        self.guitar = Room.objects.create(
+            receiver='Tomek', creator=user, gift='Gitara',
+            price=500, to_collect=500, visible=True, date_expires=expires,
+            description='Gitara albo rower',
+        )
+
+    def search(self, phrase):
+        rooms = Room.objects.search(phrase, backend=self.backend)
+        return list(rooms.order_by('-search_rank'))
+
+    def test_search(self):
+        self.assertEqual(self.search('gitara'), [self.guitar])
+        self.assertEqual(self.search('KASIA'), [self.bike])
+        self.assertEqual(self.search('samochód'), [])
+
+    def test_rank(self):
+        # gift is more important than description
+        self.assertEqual(self.search('rower'), [self.bike, self.guitar])
+
+    def test_index_updated_after_save(self):
+        self.guitar.gift = 'Skrzypce'
+        self.guitar.description = ''
+        self.guitar.save()
+        self.assertEqual(self.search('gitara'), [])
+        self.assertEqual(self.search('skrzypce'), [self.guitar])
+
+
+class IcontainsSearchBackendTest(SearchBackendMixin, TestCase):
+    backend_class = IcontainsSearchBackend
+
+    def test_rank(self):
+        rooms = Room.objects.search('rower', backend=self.backend)
+        ranks = dict(rooms.values_list('id', 'search_rank'))
+        self.assertEqual(ranks, {self.bike.id: 1, self.guitar.id: 1})
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite only')
+class TrigramSearchBackendTest(SearchBackendMixin, TestCase):
+    backend_class = TrigramSearchBackend
+
+    def setUp(self):
+        super().setUp()
+        if not self.backend.is_available():
+            self.skipTest('SQLite without FTS5 trigram tokenizer')
+
+    def test_part_of_word(self):
+        self.assertEqual(self.search('górs'), [self.bike])
+
+    def test_short_phrase(self):
+        self.assertEqual(self.search('ka'), [self.bike])
+
+    def test_quotes(self):
+        self.assertEqual(self.search('"rower'), [])
+
+    def test_table_is_checked_once(self):
+        with self.assertNumQueries(0):
+            self.assertTrue(self.backend.is_available())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'PostgreSQL only')
+class PostgresSearchBackendTest(SearchBackendMixin, TestCase):
+    backend_class = PostgresSearchBackend
+
+
+class RoomListSearchTest(TestCase):
+    fixtures = ['src/rooms/tests/fixtures.json']
+
+    def test_search_ordered_by_rank(self):
+        Room.objects.filter(gift='gift2').update(description='gift1')
+        response = self.client.get(reverse('rooms:list'), {'search': 'gift1'})
+        gifts = [room.gift for room in response.context['rooms']]
+        self.assertEqual(gifts[0], 'gift1')
+        self.assertIn('<mark>gift1</mark>', response.content.decode())
+
+
+class HighlightFilterTest(TestCase):
+    def render(self, value, phrase):
+        template = Template(
+            '{% load custom_tags %}{{ value|highlight:phrase }}'
+        )
+        return template.render(Context({'value': value, 'phrase': phrase}))
+
+    def test_highlight(self):
+        self.assertEqual(
+            self.render('Rower dla Rowerzysty', 'rower'),
+            '<mark>Rower</mark> dla <mark>Rower</mark>zysty'
+        )
+
+    def test_escape(self):
+        self.assertEqual(
+            self.render('<b>gitara</b>', 'gitara'),
+            '&lt;b&gt;<mark>gitara</mark>&lt;/b&gt;'
+        )
+        self.assertEqual(self.render('<b>', ''), '&lt;b&gt;')
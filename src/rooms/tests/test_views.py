@@ -1,13 +1,19 @@
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
+from unittest import mock
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.views.generic import ListView
 
-from src.rooms.models import Donation, Message, Room
-from src.rooms.views import FilterSearchMixin
+from src.pagination import decode_cursor
+from src.rooms.forms import RoomUpdateForm
+from src.rooms.models import Donation, DonationDailyStats, Message, Room
+from src.rooms.views import FilterSearchMixin, RoomDetailView, RoomListView
 
 User = get_user_model()
 
@@ -74,6 +80,121 @@ class RoomListViewTest(TestCase):
     def test_response_code(self):
         self.assertEqual(self.response.status_code, 200)
 
+    def test_private_rooms_hidden(self):
+        user = User.objects.create_user(username='Tom', password='Test')
+        guest = User.objects.create_user(username='Guest', password='Test')
+        room = Room.objects.create(
+            receiver='receiver1', creator=user, gift='gift1', price=1000,
+            description='test', to_collect=1000, visible=False,
+            date_expires=datetime(2019, 6, 6)
+        )
+        url = reverse('rooms:list')
+        response = self.client.get(url)
+        self.assertNotIn(room, response.context['rooms'])
+        self.client.force_login(guest)
+        response = self.client.get(url)
+        self.assertNotIn(room, response.context['rooms'])
+        room.guests.add(guest)
+        response = self.client.get(url)
+        self.assertIn(room, response.context['rooms'])
+
+    def test_cursor_pages_keep_order(self):
+        for price in (300, 100, 500, 200, 400):
+            Room.objects.create(
+                receiver='receiver1', gift='gift1', price=price,
+                to_collect=price, visible=True,
+                date_expires=datetime(2019, 6, 6)
+            )
+        url = reverse('rooms:list')
+        prices, params = [], {'order': 'price'}
+        while True:
+            response = self.client.get(url, params)
+            page = response.context['page_obj']
+            prices.extend(int(room.price) for room in page)
+            if not page.has_next():
+                break
+            params['cursor'] = page.next_cursor
+        self.assertEqual(prices, [100, 200, 300, 400, 500])
+        page = response.context['page_obj']
+        if page.total_is_exact:     # PostgreSQL gives the plan estimate
+            self.assertEqual(page.total, 5)
+
+    def test_order_outside_whitelist_is_ignored(self):
+        creator = User.objects.create_user(username='Tom', password='Test')
+        for price in (100, 200, 300, 400):
+            Room.objects.create(
+                receiver='receiver1', creator=creator, gift='gift1',
+                price=price, to_collect=price, visible=True,
+                date_expires=datetime(2019, 6, 6)
+            )
+        url = reverse('rooms:list')
+        default = self.client.get(url).context['page_obj']
+        for order in ['creator__password', '-creator__password', '--score']:
+            response = self.client.get(url, {'order': order})
+            self.assertEqual(response.status_code, 200)
+            page = response.context['page_obj']
+            self.assertEqual(page.object_list, default.object_list)
+            self.assertEqual(page.next_cursor, default.next_cursor)
+            _, values = decode_cursor(page.next_cursor)
+            self.assertNotIn(creator.password, values)
+
+
+class RoomListViewQueriesTest(TestCase):
+    """list of rooms has to make the same number of queries for any data"""
+    # session, user, approximate count and rooms. Rankings are read
+    # from cache
+    num_queries = 4
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='Tom', password='Test')
+        self.client.force_login(self.user)
+        self.url = reverse('rooms:list')
+        self.num_users = 0
+
+    def create_rooms(self, num_rooms, num_patrons):
+        for _ in range(num_rooms):
+            room = Room.objects.create(
+                receiver='receiver1', gift='gift1', price=1000,
+                description='test', to_collect=1000, visible=True,
+                date_expires=datetime(2019, 6, 6)
+            )
+            for _ in range(num_patrons):
+                self.num_users += 1
+                patron = User.objects.create(username=f'user{self.num_users}')
+                room.donate({'user': patron, 'amount': 10})
+                room.observers.add(patron)
+            room.observers.add(self.user)
+
+    def test_constant_number_of_queries(self):
+        self.create_rooms(num_rooms=2, num_patrons=1)
+        # three rankings and user's private rooms are computed only once
+        with self.assertNumQueries(self.num_queries + 4):
+            self.client.get(self.url)
+        with self.assertNumQueries(self.num_queries):
+            self.client.get(self.url)
+        self.create_rooms(num_rooms=10, num_patrons=5)
+        with self.assertNumQueries(self.num_queries):
+            self.client.get(self.url)
+        with mock.patch.object(RoomListView, 'paginate_by', 10):
+            with self.assertNumQueries(self.num_queries):
+                self.client.get(self.url)
+
+    def test_annotated_data(self):
+        self.create_rooms(num_rooms=1, num_patrons=3)
+        response = self.client.get(self.url)
+        room = response.context['rooms'][0]
+        self.assertTrue(room.is_observed)
+        self.assertEqual(room.patron_count, 3)
+        self.assertEqual(room.percent_left, 97)
+        self.assertContains(response, 'Obserwujesz')
+
+    def test_not_observed_for_anonymous(self):
+        self.create_rooms(num_rooms=1, num_patrons=1)
+        self.client.logout()
+        response = self.client.get(self.url)
+        self.assertFalse(response.context['rooms'][0].is_observed)
+
 
 class FilterSearchMixinTest(TestCase):
     def setUp(self):
@@ -122,6 +243,8 @@ class DonationListViewTest(TestCase):
         Donation.objects.filter(amount=200).update(
             date=datetime(2019, 6, 6).date()
         )
+        # chart reads daily stats, donation was made without Room.donate
+        DonationDailyStats.objects.rebuild(Room.objects.all())
         url = reverse('rooms:donation_chart', kwargs={'pk': self.room1.id})
         response = self.client.get(url)
         self.assertEqual(response.status_code, 200)
@@ -133,6 +256,112 @@ class DonationListViewTest(TestCase):
         self.assertEqual(content['xAxis']['categories'], expected)
 
 
+class DonationListPaginationTest(TestCase):
+    fixtures = ['src/rooms/tests/fixtures.json']
+
+    def setUp(self):
+        user = User.objects.get(username='testuser')
+        self.room = Room.objects.get(gift='gift1')
+        Donation.objects.bulk_create([
+            Donation(user=user, room=self.room, amount=num)
+            for num in range(1, 26)
+        ])
+        self.url = reverse('rooms:donation', kwargs={'pk': self.room.id})
+
+    def get_page(self, cursor=None):
+        params = {'cursor': cursor} if cursor else {}
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        amounts = [int(d.amount) for d in response.context['donations']]
+        return amounts, response.context['page_obj']
+
+    def test_walk_pages(self):
+        amounts, page = self.get_page()
+        self.assertEqual(amounts, list(range(25, 15, -1)))
+        self.assertFalse(page.has_previous())
+        amounts, page = self.get_page(page.next_cursor)
+        self.assertEqual(amounts, list(range(15, 5, -1)))
+        last_amounts, last_page = self.get_page(page.next_cursor)
+        self.assertEqual(last_amounts, list(range(5, 0, -1)))
+        self.assertFalse(last_page.has_next())
+        amounts, page = self.get_page(last_page.previous_cursor)
+        self.assertEqual(amounts, list(range(15, 5, -1)))
+        amounts, page = self.get_page(page.previous_cursor)
+        self.assertEqual(amounts, list(range(25, 15, -1)))
+        self.assertFalse(page.has_previous())
+
+    def test_deep_page_without_count(self):
+        _, page = self.get_page()
+        with CaptureQueriesContext(connection) as first:
+            self.get_page()
+        with CaptureQueriesContext(connection) as next_page:
+            self.get_page(page.next_cursor)
+        self.assertEqual(len(first), len(next_page))
+        for query in next_page:
+            self.assertNotIn('COUNT(', query['sql'])
+            self.assertNotIn('OFFSET', query['sql'])
+
+    def test_invalid_cursor(self):
+        amounts, _ = self.get_page('nie-kursor')
+        self.assertEqual(amounts, list(range(25, 15, -1)))
+
+
+class DonationChartViewTest(TestCase):
+    fixtures = ['src/rooms/tests/fixtures.json']
+
+    def setUp(self):
+        self.user1 = User.objects.get(username='testuser')
+        self.room1 = Room.objects.get(gift='gift1')
+        self.url = reverse(
+            'rooms:donation_chart', kwargs={'pk': self.room1.id}
+        )
+        for day, amount in (((2019, 6, 3), 10), ((2019, 6, 10), 30),
+                            ((2019, 7, 1), 40)):
+            DonationDailyStats.objects.create(
+                room=self.room1, day=datetime(*day).date(), amount=amount,
+                donation_count=1, donor_count=1,
+            )
+
+    def get_data(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)['series'][0]['data']
+
+    def test_reads_only_stats(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.assertEqual(len(queries), 2)   # room and stats
+        for query in queries:
+            self.assertNotIn('rooms_donation"', query['sql'])
+
+    def test_range(self):
+        self.assertEqual(self.get_data(**{'from': '2019-06-10'}), [30, 40])
+        self.assertEqual(self.get_data(to='2019-06-10'), [10, 30])
+        self.assertEqual(
+            self.get_data(**{'from': '2019-06-04', 'to': '2019-06-30'}), [30]
+        )
+
+    def test_bucket(self):
+        self.assertEqual(self.get_data(bucket='month'), [40, 40])
+
+    def test_incorrect_params(self):
+        for params in ({'from': '2019-13-01'}, {'to': 'yesterday'},
+                       {'bucket': 'year'}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 400)
+
+    def test_etag(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        self.assertIn('private', response['Cache-Control'])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.room1.donate({'user': self.user1, 'amount': 100})
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
 class DonateViewTest(TestCase):
     fixtures = ['src/rooms/tests/fixtures.json']
 
@@ -161,6 +390,120 @@ class DonateViewTest(TestCase):
         self.assertEqual(response.status_code, 404)
 
 
+class RoomDetailAccessQueriesTest(TestCase):
+    """access check does not depend on the number of guests"""
+
+    def setUp(self):
+        cache.clear()
+        self.creator = User.objects.create_user(
+            username='Tom', password='Test'
+        )
+        self.guest = User.objects.create_user(
+            username='Guest', password='Test'
+        )
+        self.room = Room.objects.create(
+            receiver='receiver1', creator=self.creator, gift='gift1',
+            price=1000, description='test', to_collect=1000, visible=False,
+            date_expires=datetime(2019, 6, 6)
+        )
+        self.room.guests.add(self.guest)
+        self.url = reverse('rooms:detail', kwargs={'pk': self.room.pk})
+        self.client.force_login(self.guest)
+
+    def count_access_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            view = RoomDetailView()
+            view.request = RequestFactory().get(self.url)
+            view.request.user = self.guest
+            view.kwargs = {'pk': self.room.pk}
+            room = view.get_room()
+            self.assertTrue(room.can_see(self.guest))
+            self.assertIs(view.get_object(), room)
+        return len(queries)
+
+    def test_room_loaded_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        room_queries = [
+            query for query in queries.captured_queries
+            if 'FROM "rooms_room" WHERE "rooms_room"."id" =' in query['sql']
+        ]
+        self.assertEqual(len(room_queries), 1)
+
+    def test_many_guests(self):
+        few_guests = self.count_access_queries()
+        User.objects.bulk_create([
+            User(username=f'user{num}', password='!') for num in range(300)
+        ])
+        self.room.guests.add(*User.objects.filter(username__startswith='user'))
+        self.assertEqual(self.count_access_queries(), few_guests)
+
+    def test_users_not_listed(self):
+        response = self.client.get(self.url)
+        self.assertNotIn('users_list', response.context)
+        with CaptureQueriesContext(connection) as few_users:
+            self.client.get(self.url)
+        User.objects.bulk_create([
+            User(username=f'user{num}', password='!') for num in range(50)
+        ])
+        with CaptureQueriesContext(connection) as many_users:
+            response = self.client.get(self.url)
+        self.assertEqual(len(many_users), len(few_users))
+        self.assertNotContains(response, 'user49')
+
+    def test_creator_redirected_without_query(self):
+        self.client.force_login(self.creator)
+        response = self.client.get(self.url)
+        self.assertRedirects(
+            response, reverse('rooms:edit', kwargs={'pk': self.room.pk}),
+            fetch_redirect_response=False
+        )
+        self.assertTrue(self.room.can_see(self.creator))
+
+
+class RoomEditViewTest(TestCase):
+    def setUp(self):
+        self.creator = User.objects.create_user(username='Tom', password='a')
+        self.patron = User.objects.create_user(username='Ann', password='a')
+        self.room = Room.objects.create(
+            receiver='receiver1', creator=self.creator, gift='gift1',
+            price=1000, description='test', to_collect=1000, visible=True,
+            date_expires=datetime.now().date() + timedelta(days=30)
+        )
+        self.room.donate({'user': self.patron, 'amount': 100})
+        self.client.force_login(self.creator)
+        self.url = reverse('rooms:edit', kwargs={'pk': self.room.pk})
+        self.data = {
+            'receiver': 'receiver2', 'price': 800, 'gift': 'gift2',
+            'gift_url': '', 'description': 'changed', 'visible': True,
+            'date_expires': self.room.date_expires.isoformat(),
+        }
+
+    def test_donation_during_edit_is_kept(self):
+        clean_price = RoomUpdateForm.clean_price
+
+        def donate_meanwhile(form):
+            # the form has already loaded the room
+            Room.objects.get(pk=self.room.pk).donate(
+                {'user': self.patron, 'amount': 50}
+            )
+            return clean_price(form)
+
+        with mock.patch.object(
+            RoomUpdateForm, 'clean_price', donate_meanwhile
+        ):
+            response = self.client.post(self.url, self.data)
+        self.assertEqual(response.status_code, 302)
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.gift, 'gift2')
+        self.assertEqual(self.room.price, 800)
+        self.assertEqual(self.room.collected_total, 150)
+        self.assertEqual(self.room.donation_count, 2)
+        self.assertEqual(self.room.to_collect, 650)
+
+
 def make_ajax(client, url, data=None):
     response = client.post(
         url,
@@ -7,11 +7,18 @@ from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, quote_etag
+)
+from django.utils.dateparse import parse_date
 from django.views import View
 from django.views.generic import (
     CreateView, DetailView, ListView, UpdateView
 )
 
+from src.pagination import KeysetPaginationMixin
+
+from . import leaderboards
 from .forms import MessageForm, RoomRegisterForm, RoomUpdateForm, VisibleForm
 from .models import Donation, Message, Room
 
@@ -41,67 +48,103 @@ class FilterSearchMixin:
     request and model. If you want to use it just add the class to
     inheritance tree. Alternatively in :get_queryset: method use
     super().get_queryset.
+    Searched rooms without 'order' are ordered by rank of the search.
+    Only fields of :orderings: (ascending or with '-') are accepted as
+    'order', others are ignored. Values of the ordering are put in
+    cursors of pages, so it must not reach other fields or relations.
     """
     request = None
     model = None
+    search_backend = None
+    orderings = ('date_expires', 'to_collect', 'score', 'activity', 'price')
+
+    def get_order(self, searched):
+        """:return: valid 'order' GET param or None"""
+        order = self.request.GET.get('order', '')
+        field = order[1:] if order.startswith('-') else order
+        if field in self.orderings or (searched and field == 'search_rank'):
+            return order
+        return None
 
     def get_queryset(self):
         queryset = super().get_queryset()
         field = self.request.GET.get('search', None)
         if field:
-            queryset = queryset.search(field)
-        order = self.request.GET.get('order', None)
+            queryset = queryset.search(field, backend=self.search_backend)
+        order = self.get_order(searched=bool(field))
         if order:
             queryset = queryset.order_by(order)
+        elif field:
+            queryset = queryset.order_by('-search_rank')
         return queryset
 
 
-class RoomListView(FilterSearchMixin, ListView):
+class RoomListView(KeysetPaginationMixin, FilterSearchMixin, ListView):
     """
     View is responsible for showing all visible rooms. User can filter or
-    search rooms providing 'search' or 'order' params.
+    search rooms providing 'search' or 'order' params. Pages are
+    addressed by cursor.
     Additionally most popular, rooms with most patrons and rooms
-    with most collected money are added to context
+    with most collected money are added to context. They are read
+    from cached leaderboards.
     """
-    queryset = Room.get_visible.all()
+    queryset = Room.objects.all()
     template_name = 'rooms/list.html'
     context_object_name = 'rooms'
     paginate_by = 3
+    paginate_total = True
 
     def get_queryset(self):
-        """prefetch_related is required to improve performance"""
-        queryset = super().get_queryset()
-        return queryset.summarise_for_list().prefetch_related('patrons')
+        """
+        all data for room cards is annotated so the whole page is
+        rendered from a single query (plus approximate count)
+        """
+        user = self.request.user
+        queryset = super().get_queryset().get_visible(user)
+        return queryset.summarise_for_list(user)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['most_popular'] = Room.get_visible.most_popular()
-        context['most_patrons'] = Room.get_visible.most_patrons()
-        context['most_to_collect'] = Room.get_visible.most_to_collect()
+        context.update(leaderboards.get_leaderboards())
+        context['search'] = self.request.GET.get('search', '')
         return context
 
 
-class OwnershipMixin:
+class RoomObjectMixin:
+    """
+    Room is loaded only once. Access checks in dispatch and get_object
+    of the view share the same instance.
+    """
+    room = None
+
+    def get_room(self):
+        if self.room is None:
+            self.room = get_object_or_404(Room, pk=self.kwargs['pk'])
+        return self.room
+
+    def get_object(self, queryset=None):
+        return self.get_room()
+
+
+class OwnershipMixin(RoomObjectMixin):
     """
     Mixin check if user can see the room. Next it redirect to edit
     or read-only mode.
     """
     def dispatch(self, *args, **kwargs):
         user = self.request.user
-        pk = self.kwargs['pk']
-        room = get_object_or_404(Room, pk=pk)
-        if room.creator == user:
-            return redirect(reverse('rooms:edit', kwargs={'pk': pk}))
+        room = self.get_room()
+        if user.is_authenticated and room.creator_id == user.id:
+            return redirect(reverse('rooms:edit', kwargs={'pk': room.pk}))
         if room.can_see(user):
             return super().dispatch(*args, **kwargs)
         raise Http404
 
 
-class IsOwnerMixin(UserPassesTestMixin):
+class IsOwnerMixin(RoomObjectMixin, UserPassesTestMixin):
     def test_func(self):
-        pk = self.kwargs['pk']
-        room = get_object_or_404(Room, pk=pk)
-        return room.creator == self.request.user
+        user = self.request.user
+        return user.is_authenticated and self.get_room().creator_id == user.id
 
 
 class RoomEditView(IsOwnerMixin, UpdateView):
@@ -109,14 +152,25 @@ class RoomEditView(IsOwnerMixin, UpdateView):
     template_name = 'rooms/edit.html'
     form_class = RoomUpdateForm
 
+    def form_valid(self, form):
+        """only fields of the form are saved, see Room.save_details"""
+        self.object = form.save(commit=False)
+        self.object.save_details(list(form.fields))
+        leaderboards.update_room(self.object)
+        return redirect(self.get_success_url())
+
+    def get_success_url(self):
+        return reverse('rooms:edit', kwargs={'pk': self.object.pk})
+
 
 class RoomDeleteView(IsOwnerMixin, View):
     msg = "Zbiórka została anulowana!"
 
     def delete(self, request, pk):
-        room = get_object_or_404(Room, pk=pk)
+        room = self.get_room()
         room.is_active = False
-        room.save()
+        room.save(update_fields=['is_active'])
+        leaderboards.update_room(room)
         messages.success(request, self.msg)
         return redirect('accounts:home')
 
@@ -131,34 +185,65 @@ class RoomDetailView(OwnershipMixin, DetailView):
         donations = self.object.donations.all()
         context['donations'] = (
             donations.order_by('-date').select_related('user__profile')[:5])
-        context['many_donations'] = donations.count() > 3
-        context['users_list'] = User.objects.all()
+        context['many_donations'] = self.object.donation_count > 3
         return context
 
 
-class DonationListView(ListView):
+class DonationListView(KeysetPaginationMixin, ListView):
+    """newest donations first, pages are addressed by cursor"""
     model = Donation
     template_name = 'rooms/donations.html'
+    context_object_name = 'donations'
     paginate_by = 10
-    order_by = 'id'
 
     def get_queryset(self):
         pk = self.kwargs['pk']
-        queryset = Donation.objects.filter(room_id=pk)
+        queryset = (Donation.objects
+                    .filter(room_id=pk)
+                    .select_related('user__profile')
+                    .order_by('-date', '-id'))
         return queryset
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['donations'] = self.object_list.select_related('user__profile')
-        context['room'] = Room.objects.get(pk=self.kwargs['pk'])
+        context['room'] = get_object_or_404(Room, pk=self.kwargs['pk'])
         return context
 
 
 class DonationChartView(View):
-    """ajax returns data of donations for displaying chart"""
+    """
+    ajax returns data of donations for displaying chart. Data is read
+    from daily stats of the room. Optional params:
+        from, to - range of days (YYYY-MM-DD),
+        bucket - 'day' (default), 'week' or 'month'
+    Response has ETag which changes after every donation.
+    """
     def get(self, request, pk):
         room = get_object_or_404(Room, pk=pk)
-        chart_data = room.donations.get_chart_data()
+        etag = quote_etag(f'{room.pk}-{room.donation_count}')
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            return response
+        stats = room.daily_stats.all()
+        for param, lookup in (('from', 'day__gte'), ('to', 'day__lte')):
+            value = request.GET.get(param)
+            if not value:
+                continue
+            try:
+                day = parse_date(value)
+            except ValueError:
+                day = None
+            if day is None:
+                return JsonResponse(
+                    {'error': f'Niepoprawna data: {param}'}, status=400
+                )
+            stats = stats.filter(**{lookup: day})
+        try:
+            chart_data = stats.get_chart_data(request.GET.get('bucket', 'day'))
+        except ValueError:
+            return JsonResponse(
+                {'error': 'Niepoprawny parametr: bucket'}, status=400
+            )
         chart_data = {
             'chart': {
                 'type': 'column'
@@ -180,7 +265,11 @@ class DonationChartView(View):
                 'data': chart_data['data']
             }]
         }
-        return JsonResponse(chart_data)
+        response = JsonResponse(chart_data)
+        response['ETag'] = etag
+        # browser asks every time but it gets 304 until next donation
+        patch_cache_control(response, private=True, max_age=0)
+        return response
 
 
 @login_required
@@ -239,7 +328,6 @@ def guests(request, pk):
             form = VisibleForm(data, instance=room)
             if form.is_valid():
                 room.guests.add(user.id)
-                room.save()
                 message = {
                     'guests': room.get_guests_dict()
                 }
@@ -0,0 +1,158 @@
+"""
+Base classes of full-text search backends. An app subclasses them and
+sets the searched fields (see src/rooms/search.py):
+    IcontainsSearchBackend - icontains over fields, no index,
+    PostgresSearchBackend - precomputed search_vector column with
+        GIN index,
+    TrigramSearchBackend - SQLite FTS5 table with trigram tokenizer.
+Every backend annotates 'search_rank' (higher is better) and its index
+is refreshed by :update_index:.
+"""
+from django.conf import settings
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector
+)
+from django.db import connection
+from django.db.models import (
+    Case, F, FloatField, IntegerField, Q, Value, When
+)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+from django.utils.module_loading import import_string
+
+
+def get_backend(path, backends, default):
+    """
+    :param path: dotted path of the backend class from settings. If it
+    is empty backend is chosen from :backends: by the database vendor
+    """
+    if not path:
+        path = backends.get(connection.vendor, default)
+    return import_string(path)()
+
+
+class IcontainsSearchBackend:
+    """
+    Search without any index, it scans the whole table. Rank is
+    the number of matching fields.
+    """
+    fields = []
+
+    def search(self, queryset, phrase):
+        condition = Q()
+        rank = Value(0, output_field=IntegerField())
+        for field in self.fields:
+            match = Q(**{f'{field}__icontains': phrase})
+            condition |= match
+            rank = rank + Case(
+                When(match, then=Value(1)),
+                default=Value(0),
+                output_field=IntegerField()
+            )
+        return queryset.filter(condition).annotate(search_rank=rank)
+
+    def update_index(self, queryset):
+        """nothing to update"""
+
+
+class PostgresSearchBackend(IcontainsSearchBackend):
+    """weights: {field: 'A'-'D'} used to build search_vector"""
+    weights = {}
+
+    @property
+    def config(self):
+        return settings.SEARCH_CONFIG
+
+    def vector(self):
+        vectors = [
+            SearchVector(field, weight=weight, config=self.config)
+            for field, weight in self.weights.items()
+        ]
+        vector = vectors[0]
+        for other in vectors[1:]:
+            vector = vector + other
+        return vector
+
+    def search(self, queryset, phrase):
+        query = SearchQuery(phrase, config=self.config)
+        # F(): SearchRank would build a new vector from a field name.
+        # Double precision, so the rank read in Python can be compared
+        # again in the database (keyset pagination).
+        rank = Cast(SearchRank(F('search_vector'), query), FloatField())
+        return (queryset
+                .filter(search_vector=query)
+                .annotate(search_rank=rank))
+
+    def update_index(self, queryset):
+        queryset.update(search_vector=self.vector())
+
+
+class TrigramSearchBackend(IcontainsSearchBackend):
+    """
+    SQLite FTS5 table (:table:) with the same columns as :fields: and
+    rowid equal to id of the model. It finds any part of a word, so
+    phrases shorter than three letters use icontains.
+    """
+    table = None
+    # (database alias, name): names of tables, shared by all backends
+    tables = {}
+    min_length = 3
+    batch_size = 500    # ids in one statement
+    # weights of columns for bm25
+    weights = {}
+
+    def is_available(self):
+        """
+        the table exists. It is checked once per database in a process,
+        a table created later is found after a restart.
+        """
+        key = (connection.alias, connection.settings_dict['NAME'])
+        tables = self.tables.get(key)
+        if tables is None:
+            tables = self.tables[key] = set(
+                connection.introspection.table_names()
+            )
+        return self.table in tables
+
+    def search(self, queryset, phrase):
+        if len(phrase) < self.min_length or not self.is_available():
+            return super().search(queryset, phrase)
+        query = '"{}"'.format(phrase.replace('"', '""'))
+        weights = ', '.join(
+            str(self.weights[field]) for field in self.fields
+        )
+        source = queryset.model._meta.db_table
+        # join with FTS table. Unary + stops SQLite from reading the FTS
+        # table by rowid inside loop over rows, so it is read once by
+        # MATCH. Rank column is bm25 with weights of columns.
+        return queryset.extra(
+            tables=[self.table],
+            where=[
+                f'+{self.table}.rowid = {source}.id',
+                f'{self.table} MATCH %s',
+                f'{self.table}.rank MATCH %s',
+            ],
+            params=[query, f'bm25({weights})'],
+        ).annotate(search_rank=RawSQL(f'-{self.table}.rank', []))
+
+    def update_index(self, queryset):
+        if not self.is_available():
+            return
+        ids = list(queryset.values_list('id', flat=True))
+        source = queryset.model._meta.db_table
+        fields = ', '.join(self.fields)
+        with connection.cursor() as cursor:
+            for start in range(0, len(ids), self.batch_size):
+                batch = ids[start:start + self.batch_size]
+                placeholders = ', '.join(['%s'] * len(batch))
+                cursor.execute(
+                    f'DELETE FROM {self.table} '
+                    f'WHERE rowid IN ({placeholders})',
+                    batch
+                )
+                cursor.execute(
+                    f'INSERT INTO {self.table} (rowid, {fields}) '
+                    f'SELECT id, {fields} FROM {source} '
+                    f'WHERE id IN ({placeholders})',
+                    batch
+                )
@@ -231,7 +231,14 @@ let roomSocket = new WebSocket(socket_url)
 roomSocket.onmessage = (e) => {
     let data = JSON.parse(e.data)
     console.log(data)
-    makeThread(data)
+    // new threads come as a list, errors as an object
+    if (Array.isArray(data)) {
+        data.forEach(makeThread)
+    } else if (data['__all__']) {
+        alert(data['__all__'].join(' '))
+    } else {
+        console.error(data)
+    }
 }
 roomSocket.onclose = (e) => {
     console.error('Socket is closed')
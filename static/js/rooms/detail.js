@@ -3,6 +3,8 @@ let room_id = window.location.pathname.split('/')[2]
 let socketUrl = 'ws://' + window.location.host + '/' + 'ws/room/' + room_id + '/donate/'
 console.log(socketUrl)
 let roomSocket = new WebSocket(socketUrl)
+// sequence of the last state of the room, older frames are dropped
+let lastSequence = -1
 
 roomSocket.onmessage = (e) => {
     let data = JSON.parse(e.data)
@@ -11,7 +13,8 @@ roomSocket.onmessage = (e) => {
     if (data['is_valid'] === 'false') {
         console.log(data['errors'])
         for (let field in data['errors']) {
-            inputForm = document.getElementById(field)
+            // errors of the whole frame ('__all__') are shown under amount
+            inputForm = document.getElementById(field) || document.getElementById('amount')
             htmlString = `<div class="invalid-feedback">${data['errors'][field]}</div>`
             inputForm.classList.add('is-invalid')
             console.log(htmlString)
@@ -22,7 +25,8 @@ roomSocket.onmessage = (e) => {
         supportForm = document.getElementById('supportForm')
         supportForm.classList.toggle('hidden')
     }
-    else {
+    else if (data['sequence'] > lastSequence) {
+        lastSequence = data['sequence']
         console.log(data['percent_got'])
 
         progress = data['percent_got']
@@ -91,23 +95,92 @@ submitSupport.onclick = (event) => {
 }
 
 
+// function fills datalist with usernames starting with the typed text.
+// Users are fetched from the server only when typing stops for a while
+// returns a function which gives a promise of the lookup of the current
+// value, the input can be read after it is resolved
+function userAutocomplete(input, datalist, onUsers) {
+    let timeout = null
+    let lookups = 0
+    let done = null
+    let pending = Promise.resolve()
+    input.addEventListener('input', () => {
+        clearTimeout(timeout)
+        let lookup = ++lookups
+        if (!done) {
+            pending = new Promise(resolve => {
+                done = resolve
+            })
+        }
+        let finish = () => {
+            // later input started a new lookup
+            if (lookup === lookups && done) {
+                done()
+                done = null
+            }
+        }
+        timeout = setTimeout(() => {
+            let query = input.value.trim()
+            if (!query) {
+                finish()
+                return
+            }
+            let url = `/accounts/ajax/users/?q=${encodeURIComponent(query)}`
+            let ajax = get_fetch(url).then(response => response.json())
+            ajax.then(response => {
+                datalist.innerHTML = ''
+                for (let user of response['users']) {
+                    let option = document.createElement('option')
+                    option.value = user.username
+                    datalist.append(option)
+                }
+                if (onUsers) {
+                    onUsers(response['users'])
+                }
+            }).finally(finish)
+        }, 250)
+    })
+    return () => pending
+}
+
 let messageForm = document.getElementById('messageForm')
+let receiverIds = {}
+let receiverLookup = userAutocomplete(
+    messageForm.receiver_name,
+    document.getElementById('receiverOptions'),
+    (users) => {
+        for (let user of users) {
+            receiverIds[user.username] = user.id
+        }
+    }
+)
+messageForm.receiver_name.addEventListener('input', (event) => {
+    messageForm.receiver.value = receiverIds[event.target.value] || ''
+})
 messageForm.onsubmit = (event) => {
     event.preventDefault()
-    let receiver = event.target.receiver.value
-    let subject = event.target.subject.value
-    let content = event.target.content.value
-    data = {receiver: receiver, subject: subject, content: content}
-    url = '/rooms/ajax/message/'
-    ajax = post_fetch(url, data).then(response => response.json())
-    ajax.then(response => {
+    let form = event.target
+    let submit = document.getElementById('messageBtn')
+    submit.disabled = true
+    // id of the receiver is known when the lookup of the name has ended
+    receiverLookup().then(() => {
+        let receiver = receiverIds[form.receiver_name.value] || ''
+        form.receiver.value = receiver
+        let subject = form.subject.value
+        let content = form.content.value
+        let data = {receiver: receiver, subject: subject, content: content}
+        let url = '/rooms/ajax/message/'
+        return post_fetch(url, data).then(response => response.json())
+    }).then(response => {
         if (response['is_valid'] === 'true') {
             successMsg = makeMessage('success', 'Wiadomość została wysłana')
-            event.target.receiver.before(successMsg)
+            form.receiver_name.before(successMsg)
         } else {
             failureMsg = makeMessage('danger', 'Dane są błęde')
-            event.target.receiver.before(failureMsg)
+            form.receiver_name.before(failureMsg)
         }
+    }).finally(() => {
+        submit.disabled = false
     })
 }
 
@@ -125,6 +198,11 @@ function makeGuestList(data) {
 
 makeProgressRoom(progress)
 
+userAutocomplete(
+    document.getElementById('guestInput'),
+    document.getElementById('guestOptions')
+)
+
 // function responsible for adding guest watching the room.
 // only the creator can do that in 'rooms:edit'
 let addGuest = document.getElementById('addGuest')